@@ -13,6 +13,13 @@ from database import connect_to_db
 
 # Import document handler
 from documents_handler import DocumentsHandler
+import answer_cache
+import chatbot_profile
+import cache_warmer
+import embedding_service
+import namespace_versions
+import pinecone_sync
+import vector_replica
 
 # Needed for the new manual add route
 from flask import request
@@ -40,16 +47,11 @@ def update_pinecone_index(namespace, text_chunks, embeddings, old_namespace=None
     try:
         index = pinecone_client.Index(PINECONE_INDEX)
         
-        # Check if namespace exists before trying to delete from it
-        existing_stats = index.describe_index_stats()
-        if namespace in existing_stats.namespaces:
-            # Delete all vectors in the current namespace if it exists
-            index.delete(delete_all=True, namespace=namespace)
-        
-        # Upload vectors to the namespace
-        vectors = [(f"{namespace}-{i}", embedding, {"text": chunk}) 
-                  for i, (chunk, embedding) in enumerate(zip(text_chunks, embeddings))]
-        index.upsert(vectors=vectors, namespace=namespace)
+        # Upload only new or changed chunks and delete the ones that are gone
+        pinecone_sync.sync_namespace(index, namespace, text_chunks, embeddings)
+        vector_replica.replace_namespace(
+            namespace, [f"{namespace}-{i}" for i in range(len(text_chunks))], embeddings, text_chunks
+        )
         
         return True
     except Exception as e:
@@ -1583,14 +1585,7 @@ HTML = '''
 '''
 
 def get_embeddings(text_chunks):
-    embeddings = []
-    for chunk in text_chunks:
-        response = openai_client.embeddings.create(
-            input=chunk,
-            model="text-embedding-ada-002"
-        )
-        embeddings.append(response.data[0].embedding)
-    return embeddings
+    return embedding_service.embed_texts(openai_client, text_chunks, model="text-embedding-ada-002")
 
 def clear_user_id_from_companies():
     """Clear all user_id values in the companies table."""
@@ -2297,10 +2292,13 @@ def update_pinecone(id):
         
         chunks = chunk_text(processed_content)
         embeddings = get_embeddings(chunks)
-        
-        success = update_pinecone_index(pinecone_namespace, chunks, embeddings)
-        
-        return jsonify({'success': success})
+
+        # Build a new namespace version and switch to it once complete; the chatbot keeps
+        # answering from the current one meanwhile (reindex also drops its cached answers)
+        index = pinecone_client.Index(PINECONE_INDEX)
+        result = namespace_versions.reindex(index, id, pinecone_namespace, chunks, embeddings)
+
+        return jsonify({'success': result is not None})
     except Exception as e:
         print(f"Error: {e}")
         return jsonify({'success': False}), 500
@@ -2354,10 +2352,14 @@ def delete_record(id):
                     namespace = row[0]
                     index = pinecone_client.Index(PINECONE_INDEX)
                     index.delete(delete_all=True, namespace=namespace)
+                    vector_replica.delete_namespace(namespace)
+                    pinecone_sync.forget_namespace(namespace)
         except Exception as e:
             print(f"Warning: Could not delete Pinecone vectors: {e}")
             # Continue with the deletion process even if Pinecone cleanup fails
         
+        chatbot_profile.invalidate(id)
+        
         return jsonify({'success': True})
     except Exception as e:
         print(f"Error deleting record: {e}")
@@ -2726,6 +2728,8 @@ def truncate_table(table_name):
                         if namespace:
                             try:
                                 index.delete(delete_all=True, namespace=namespace)
+                                vector_replica.delete_namespace(namespace)
+                                pinecone_sync.forget_namespace(namespace)
                                 print(f"Deleted all vectors for namespace: {namespace}")
                             except Exception as e:
                                 print(f"Warning: Error deleting Pinecone vectors for namespace {namespace}: {e}")
@@ -2859,11 +2863,18 @@ def nuclear_reset(id):
             try:
                 index = pinecone_client.Index(PINECONE_INDEX)
                 index.delete(delete_all=True, namespace=namespace)
+                vector_replica.delete_namespace(namespace)
+                pinecone_sync.forget_namespace(namespace)
                 print(f"Deleted all vectors for namespace: {namespace}")
             except Exception as e:
                 print(f"Warning: Could not delete Pinecone vectors: {e}")
                 # Continue with the deletion process even if Pinecone cleanup fails
         
+        # Drop any cached answers, profile and warmed vectors for the removed chatbot
+        answer_cache.invalidate(id)
+        chatbot_profile.invalidate(id)
+        cache_warmer.invalidate(namespace)
+        
         # Return the response
         result = {
             'success': True, 
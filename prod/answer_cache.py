@@ -0,0 +1,189 @@
+import os
+import time
+import hashlib
+import threading
+from typing import Dict, Optional
+import numpy as np
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Cosine similarity a new first question needs to reuse a cached answer
+SIMILARITY_THRESHOLD = float(os.getenv('ANSWER_CACHE_SIMILARITY', 0.95))
+
+# How long a cached answer may be served
+TTL_SECONDS = int(os.getenv('ANSWER_CACHE_TTL_SECONDS', 3600))
+
+# Maximum cached questions per chatbot
+MAX_ENTRIES_PER_CHATBOT = int(os.getenv('ANSWER_CACHE_MAX_ENTRIES', 200))
+
+# chatbot_id -> {"fingerprint", "questions" (N x D float32, normalized), "answers", "expires_at"}
+answer_cache = {}
+_stats = {}
+_lock = threading.Lock()
+
+
+def is_enabled(config_value) -> bool:
+    """
+    Check the chatbot_config answer_cache_enabled flag ('Yes'/'No', like show_lead_form)
+    """
+    return str(config_value or '').strip().lower() in ('yes', 'true', '1')
+
+
+def make_fingerprint(system_prompt: str, namespace: str, model_settings: Dict, knowledge_version: int = 0) -> str:
+    """
+    Build a fingerprint of everything that shapes an answer.
+    Cached answers are only served while the fingerprint is unchanged, so a new
+    system prompt, namespace, model configuration or knowledge version invalidates
+    them automatically - in every worker, not just the one that handled the change.
+    """
+    parts = [
+        system_prompt or '',
+        namespace or '',
+        str(model_settings.get("model", "")),
+        str(model_settings.get("temperature", "")),
+        str(model_settings.get("max_tokens", "")),
+        str(knowledge_version or 0)
+    ]
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+def _normalize(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def _record(chatbot_id: str, outcome: str) -> None:
+    stats = _stats.setdefault(chatbot_id, {"hits": 0, "misses": 0, "stores": 0, "invalidations": 0})
+    stats[outcome] += 1
+
+
+def lookup(chatbot_id: str, question_embedding, fingerprint: str) -> Optional[str]:
+    """
+    Find a cached answer for a question similar to an earlier first question
+
+    Args:
+        chatbot_id: The chatbot being asked
+        question_embedding: Embedding of the visitor's question
+        fingerprint: Current fingerprint from make_fingerprint()
+
+    Returns:
+        The cached answer, or None on a miss
+    """
+    query = _normalize(question_embedding)
+    now = time.time()
+    with _lock:
+        entry = answer_cache.get(chatbot_id)
+        if entry is not None and entry["fingerprint"] != fingerprint:
+            # Prompt, namespace, model settings or knowledge changed since these were cached
+            del answer_cache[chatbot_id]
+            _record(chatbot_id, "invalidations")
+            entry = None
+
+        if entry is None or not entry["answers"]:
+            _record(chatbot_id, "misses")
+            return None
+
+        _expire(entry, now)
+        if not entry["answers"]:
+            _record(chatbot_id, "misses")
+            return None
+
+        similarities = entry["questions"] @ query
+        best = int(np.argmax(similarities))
+        if similarities[best] < SIMILARITY_THRESHOLD:
+            _record(chatbot_id, "misses")
+            return None
+
+        _record(chatbot_id, "hits")
+        logger.info(f"Answer cache hit for chatbot {chatbot_id} (similarity {similarities[best]:.3f})")
+        return entry["answers"][best]
+
+
+def store(chatbot_id: str, question_embedding, answer: str, fingerprint: str) -> None:
+    """
+    Cache the answer to a first-turn question
+    """
+    if not answer:
+        return
+    question = _normalize(question_embedding)
+    now = time.time()
+    with _lock:
+        entry = answer_cache.get(chatbot_id)
+        if entry is None or entry["fingerprint"] != fingerprint:
+            entry = {
+                "fingerprint": fingerprint,
+                "questions": np.empty((0, question.shape[0]), dtype=np.float32),
+                "answers": [],
+                "expires_at": []
+            }
+            answer_cache[chatbot_id] = entry
+
+        _expire(entry, now)
+        entry["questions"] = np.vstack([entry["questions"], question[np.newaxis, :]])
+        entry["answers"].append(answer)
+        entry["expires_at"].append(now + TTL_SECONDS)
+
+        # Drop the oldest questions past the per-chatbot cap
+        overflow = len(entry["answers"]) - MAX_ENTRIES_PER_CHATBOT
+        if overflow > 0:
+            entry["questions"] = entry["questions"][overflow:]
+            entry["answers"] = entry["answers"][overflow:]
+            entry["expires_at"] = entry["expires_at"][overflow:]
+
+        _record(chatbot_id, "stores")
+
+
+def invalidate(chatbot_id: str) -> bool:
+    """
+    Drop this worker's cached answers for a chatbot (e.g. after its knowledge base is
+    retrained). Other workers drop theirs when the knowledge version in the fingerprint
+    changes, see chatbot_profile.bump_knowledge_version().
+
+    Returns:
+        bool: True if anything was cached
+    """
+    with _lock:
+        existed = answer_cache.pop(chatbot_id, None) is not None
+        if existed:
+            _record(chatbot_id, "invalidations")
+            logger.info(f"Invalidated answer cache for chatbot {chatbot_id}")
+        return existed
+
+
+def get_stats(chatbot_id: str = None) -> Dict:
+    """
+    Get hit-rate metrics for one chatbot or for the whole cache
+    """
+    with _lock:
+        if chatbot_id:
+            stats = dict(_stats.get(chatbot_id, {"hits": 0, "misses": 0, "stores": 0, "invalidations": 0}))
+            entry = answer_cache.get(chatbot_id)
+            stats["cached_answers"] = len(entry["answers"]) if entry else 0
+        else:
+            stats = {"hits": 0, "misses": 0, "stores": 0, "invalidations": 0}
+            for chatbot_stats in _stats.values():
+                for key in stats:
+                    stats[key] += chatbot_stats[key]
+            stats["chatbots"] = len(answer_cache)
+            stats["cached_answers"] = sum(len(entry["answers"]) for entry in answer_cache.values())
+
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+def _expire(entry: Dict, now: float) -> None:
+    # Caller must hold _lock. Entries are appended in time order, so expired ones lead.
+    expired = 0
+    for expires_at in entry["expires_at"]:
+        if expires_at > now:
+            break
+        expired += 1
+    if expired:
+        entry["questions"] = entry["questions"][expired:]
+        entry["answers"] = entry["answers"][expired:]
+        entry["expires_at"] = entry["expires_at"][expired:]
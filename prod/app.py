@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, g, send_from_directory, make_response
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, g, send_from_directory, make_response, Response, stream_with_context
 from werkzeug.middleware.proxy_fix import ProxyFix
 from dotenv import load_dotenv
 from urllib.parse import urljoin, urlparse
@@ -22,6 +22,16 @@ import uuid
 import re
 import json
 import vector_cache
+from conversation_store import ConversationStore
+import embedding_cache
+import embedding_service
+import pinecone_sync
+import answer_cache
+import chatbot_profile
+import single_flight
+import cache_warmer
+import namespace_versions
+import vector_replica
 from flask_session import Session
 from auth import auth_bp
 import sqlite3
@@ -135,6 +145,12 @@ app.register_blueprint(admin_dashboard, url_prefix='/admin-dashboard-08x7z9y2-yo
 init_documents_blueprint(openai_client, pinecone_client, PINECONE_INDEX)
 app.register_blueprint(documents_blueprint, url_prefix='/documents')
 
+# Widget loads prefetch the chatbot's vectors into the local cache
+cache_warmer.init_cache_warmer(pinecone_client, PINECONE_INDEX)
+
+# Re-indexing builds a new namespace version; replaced versions are deleted after a grace period
+namespace_versions.init_namespace_versions(pinecone_client, PINECONE_INDEX)
+
 # Database connection variables
 DB_TYPE = os.getenv('DB_TYPE', 'sqlite')
 DB_HOST = os.getenv('DB_HOST', '')
@@ -155,8 +171,11 @@ app.register_blueprint(metrics_blueprint, url_prefix='/metrics')
 # Dictionary to track processing status
 processing_status = {}
 
-# Initialize chat handlers dictionary
-chat_handlers = {}
+# Conversation store keyed by (chatbot_id, thread_id) with LRU, idle TTL and memory budget
+chat_handlers = ConversationStore()
+
+# Coalesces duplicate /embed-chat requests (double submits, client retries) onto one upstream call
+chat_flights = single_flight.SingleFlight()
 
 # Import the settings blueprint for use on dashboard.html
 from settings_blueprint import settings_bp
@@ -333,15 +352,8 @@ def semantic_chunk_text(text, target_size=700, extended_size=1200):
     return chunks
 
 def get_embeddings(text_chunks):
-    """Get embeddings for text chunks using OpenAI's embedding model"""
-    embeddings = []
-    for chunk in text_chunks:
-        response = openai_client.embeddings.create(
-            input=chunk,
-            model="text-embedding-ada-002"
-        )
-        embeddings.append(response.data[0].embedding)
-    return embeddings
+    """Get embeddings for text chunks using OpenAI's embedding model, in batched concurrent requests"""
+    return embedding_service.embed_texts(openai_client, text_chunks, model="text-embedding-ada-002")
 
 def process_and_update_pinecone(processed_content, namespace):
     """
@@ -367,26 +379,21 @@ def process_and_update_pinecone(processed_content, namespace):
         embeddings = get_embeddings(text_chunks)
         print(f"Generated {len(embeddings)} embeddings")
         
-        # Add to the in-memory cache for immediate use
+        # Add to the in-memory cache for immediate use (replacing any warmed copy of the old content)
+        cache_warmer.invalidate(namespace)
         vector_cache.add_to_cache(namespace, embeddings, text_chunks, expiry_seconds=60)
         print(f"Added vectors to in-memory cache for namespace '{namespace}'")
         
-        # Update Pinecone index with the new vectors
+        # Update Pinecone index with only the chunks that changed; the namespace stays searchable throughout
         index = pinecone_client.Index(PINECONE_INDEX)
+        sync_result = pinecone_sync.sync_namespace(index, namespace, text_chunks, embeddings)
+        print(f"Synced Pinecone namespace '{namespace}': {sync_result['added']} added, "
+              f"{sync_result['updated']} updated, {sync_result['removed']} removed")
         
-        # Check if namespace exists before trying to delete
-        existing_stats = index.describe_index_stats()
-        if namespace in existing_stats.namespaces:
-            # Delete all vectors in the current namespace if it exists
-            index.delete(delete_all=True, namespace=namespace)
-            print(f"Cleared existing vectors for namespace '{namespace}'")
-        
-        # Upload vectors to the namespace
-        vectors = [(f"{namespace}-{i}", embedding, {"text": chunk}) 
-                  for i, (chunk, embedding) in enumerate(zip(text_chunks, embeddings))]
-        
-        index.upsert(vectors=vectors, namespace=namespace)
-        print(f"Successfully uploaded {len(vectors)} vectors to Pinecone namespace '{namespace}'")
+        # Keep the local replica identical to what Pinecone now holds
+        vector_replica.replace_namespace(
+            namespace, [f"{namespace}-{i}" for i in range(len(text_chunks))], embeddings, text_chunks
+        )
         
         return True
     except Exception as e:
@@ -395,21 +402,48 @@ def process_and_update_pinecone(processed_content, namespace):
         print(traceback.format_exc())
         return False
 
+def reindex_chatbot(processed_content, chatbot_id, namespace):
+    """
+    Re-ingest an existing chatbot's content into a new namespace version and switch
+    the chatbot to it once complete; until then it keeps answering from namespace.
+    
+    Args:
+        processed_content (str): The processed content to chunk and vectorize
+        chatbot_id (str): The chatbot being re-ingested
+        namespace (str): Its current namespace
+        
+    Returns:
+        str: The chatbot's namespace after the switch, or None on failure
+    """
+    try:
+        text_chunks = semantic_chunk_text(processed_content)
+        print(f"Created {len(text_chunks)} semantic chunks from content")
+        
+        embeddings = get_embeddings(text_chunks)
+        print(f"Generated {len(embeddings)} embeddings")
+        
+        index = pinecone_client.Index(PINECONE_INDEX)
+        result = namespace_versions.reindex(index, chatbot_id, namespace, text_chunks, embeddings)
+        if result is None:
+            return None
+        print(f"Chatbot {chatbot_id} switched from namespace '{namespace}' to '{result['namespace']}'")
+        return result['namespace']
+    except Exception as e:
+        print(f"Error in reindex_chatbot: {e}")
+        import traceback
+        print(traceback.format_exc())
+        return None
+
 def update_pinecone_index(namespace, text_chunks, embeddings, old_namespace=None):
     """Update Pinecone index with new vectors"""
     try:
         index = pinecone_client.Index(PINECONE_INDEX)
         
-        # Check if namespace exists before trying to delete from it
-        existing_stats = index.describe_index_stats()
-        if namespace in existing_stats.namespaces:
-            # Delete all vectors in the current namespace if it exists
-            index.delete(delete_all=True, namespace=namespace)
-        
-        # Upload vectors to the namespace
-        vectors = [(f"{namespace}-{i}", embedding, {"text": chunk}) 
-                  for i, (chunk, embedding) in enumerate(zip(text_chunks, embeddings))]
-        index.upsert(vectors=vectors, namespace=namespace)
+        # Upload only new or changed chunks and delete the ones that are gone
+        pinecone_sync.sync_namespace(index, namespace, text_chunks, embeddings)
+        vector_replica.replace_namespace(
+            namespace, [f"{namespace}-{i}" for i in range(len(text_chunks))], embeddings, text_chunks
+        )
         
         return True
     except Exception as e:
@@ -487,15 +521,18 @@ def check_namespace(url):
         # Clean the main domain to remove any invalid characters
         base = re.sub(r'[^a-zA-Z0-9-]', '', main_domain)
         
-        # Find existing namespaces with this base
-        pattern = f"^{base}-\\d+$"
+        # Find existing namespaces with this base, including re-indexed versions (base-01-v2)
+        pattern = f"^{base}-\\d+(-v\\d+)?$"
         existing = [ns for ns in stats.namespaces.keys() if re.match(pattern, ns)]
         
         if not existing:
             return f"{base}-01", None
             
         # Return the existing namespace instead of creating a new one
-        current = max(existing, key=lambda x: int(x.split('-')[-1]))
+        def namespace_order(ns):
+            unversioned, version = namespace_versions.parse_namespace(ns)
+            return int(unversioned.split('-')[-1]), version
+        current = max(existing, key=namespace_order)
         return current, None
     except Exception as e:
         print(f"Error checking namespace: {e}")
@@ -645,6 +682,9 @@ def update_company_data(data, chatbot_id):
             ''', (data[1], data[2], data[3], data[4], data[6], 
                 data[7], data[8], chatbot_id))
 
+    # Namespace may have changed
+    chatbot_profile.invalidate(chatbot_id)
+
 def extract_all_text(html_content):
     """Extract all visible text from HTML while maintaining minimal structure"""
     if not html_content:
@@ -1122,6 +1162,41 @@ def validate_website_url(url, recaptcha_token, remote_ip, honeypot_value=None):
 
     return result
 
+def pause_chatbot_for_rate_limit(chatbot_id, path, ip_address=None, user_agent=None):
+    """
+    Log a rate limit incident for a chatbot and pause it.
+    Shared by the WSGI 429 handler and the ASGI chat endpoint.
+    """
+    # Log the incident and update active_status
+    log_chatbot_incident(
+        chatbot_id=chatbot_id,
+        incident_type='rate_limit_exceeded',
+        incident_details=f"Rate limit exceeded for endpoint: {path}",
+        ip_address=ip_address,
+        user_agent=user_agent
+    )
+    
+    # Update active_status to 'paused'
+    with connect_to_db() as conn:
+        cursor = conn.cursor()
+        
+        # Different placeholder based on database type
+        placeholder = '%s' if os.getenv('DB_TYPE', '').lower() == 'postgresql' else '?'
+        table_name = 'companies' if os.getenv('DB_TYPE', '').lower() != 'postgresql' else f"{DB_SCHEMA}.companies"
+        
+        query = f"""
+            UPDATE {table_name}
+            SET active_status = 'paused'
+            WHERE chatbot_id = {placeholder}
+        """
+        
+        cursor.execute(query, (chatbot_id,))
+        conn.commit()
+        
+        print(f"[RATE LIMIT] Chatbot {chatbot_id} paused due to rate limit violation")
+
+    chatbot_profile.invalidate(chatbot_id)
+
 @app.errorhandler(429)
 def ratelimit_handler(e):
     """Custom handler for rate limit exceeded errors"""
@@ -1138,33 +1213,12 @@ def ratelimit_handler(e):
                 chatbot_id = data.get('chatbot_id')
                 
                 if chatbot_id:
-                    # Log the incident and update active_status
-                    log_chatbot_incident(
-                        chatbot_id=chatbot_id,
-                        incident_type='rate_limit_exceeded',
-                        incident_details=f"Rate limit exceeded for endpoint: {request.path}",
+                    pause_chatbot_for_rate_limit(
+                        chatbot_id,
+                        request.path,
                         ip_address=request.remote_addr,
                         user_agent=request.user_agent.string if request.user_agent else None
                     )
-                    
-                    # Update active_status to 'paused'
-                    with connect_to_db() as conn:
-                        cursor = conn.cursor()
-                        
-                        # Different placeholder based on database type
-                        placeholder = '%s' if os.getenv('DB_TYPE', '').lower() == 'postgresql' else '?'
-                        table_name = 'companies' if os.getenv('DB_TYPE', '').lower() != 'postgresql' else f"{DB_SCHEMA}.companies"
-                        
-                        query = f"""
-                            UPDATE {table_name}
-                            SET active_status = 'paused'
-                            WHERE chatbot_id = {placeholder}
-                        """
-                        
-                        cursor.execute(query, (chatbot_id,))
-                        conn.commit()
-                        
-                        print(f"[RATE LIMIT] Chatbot {chatbot_id} paused due to rate limit violation")
     except Exception as incident_error:
         print(f"[RATE LIMIT] Error handling rate limit incident: {str(incident_error)}")
     
@@ -1415,14 +1469,27 @@ About Scrape
 {about_text}"""
 
                 # --- Process and Update Pinecone ---
-                print(f"[process_in_background] Processing and updating Pinecone for namespace: {current_namespace}")
-                success = process_and_update_pinecone(processed_content, current_namespace)
+                live_profile = chatbot_profile.load_profile(current_chatbot_id)
+                if live_profile and live_profile.namespace:
+                    # Re-scrape of a live chatbot: build a new namespace version so it keeps answering meanwhile
+                    print(f"[process_in_background] Re-indexing chatbot from namespace: {live_profile.namespace}")
+                    new_namespace = reindex_chatbot(processed_content, current_chatbot_id, live_profile.namespace)
+                    success = new_namespace is not None
+                    if success:
+                        current_namespace = new_namespace
+                else:
+                    print(f"[process_in_background] Processing and updating Pinecone for namespace: {current_namespace}")
+                    success = process_and_update_pinecone(processed_content, current_namespace)
                 if not success:
                     print(f"[process_in_background] Failed to process and update Pinecone")
                     processing_status[current_chatbot_id]["error"] = "Failed to process and update Pinecone"
                     processing_status[current_chatbot_id]["completed"] = False
                     return
 
+                # Cached answers were generated from the previous scrape
+                answer_cache.invalidate(current_chatbot_id)
+                chatbot_profile.bump_knowledge_version(current_chatbot_id)
+
                 # --- Update Database ---
                 print(f"[process_in_background] Updating database for chatbot_id: {current_chatbot_id}")
                 now = datetime.now(UTC)
@@ -1588,6 +1655,10 @@ About Scrape
         print(f"[process_url_execute] Failed to process and update Pinecone")
         return jsonify({"error": "Failed to process and update Pinecone"}), 400
     
+    # Cached answers were generated from the previous scrape
+    answer_cache.invalidate(chatbot_id)
+    chatbot_profile.bump_knowledge_version(chatbot_id)
+    
     now = datetime.now(UTC)
     data = (
         chatbot_id, website_url, PINECONE_HOST, PINECONE_INDEX,
@@ -1760,10 +1831,214 @@ def demo(session_id):
         if 'conn' in locals() and conn:
              conn.close()
 
+def wants_event_stream():
+    """Check if the client asked for a Server-Sent Events response"""
+    return request.accept_mimetypes.best == 'text/event-stream'
+
+def format_sse(data, event=None):
+    """Format a payload as a single Server-Sent Events message"""
+    message = f"data: {json.dumps(data)}\n\n"
+    if event:
+        message = f"event: {event}\n{message}"
+    return message
+
+def extract_token_usage(response):
+    """
+    Extract token usage from an OpenAI completion or final stream chunk
+    
+    Returns:
+        tuple: (prompt_tokens, completion_tokens, total_tokens), zeros if unavailable
+    """
+    prompt_tokens = 0
+    completion_tokens = 0
+    total_tokens = 0
+    
+    # Check if usage information is available in the response
+    if hasattr(response, 'usage') and response.usage:
+        try:
+            prompt_tokens = response.usage.prompt_tokens
+            completion_tokens = response.usage.completion_tokens
+            total_tokens = response.usage.total_tokens
+            print(f"Token usage: prompt={prompt_tokens}, completion={completion_tokens}, total={total_tokens}")
+        except Exception as token_error:
+            print(f"Error extracting token usage: {str(token_error)}")
+    
+    return prompt_tokens, completion_tokens, total_tokens
+
+def finish_chat_exchange(handler, chatbot_id, thread_id, user_message, assistant_response,
+                         prompt_tokens, completion_tokens, total_tokens, ip_address, user_agent,
+                         answer_cache_entry=None):
+    """
+    Add a completed exchange to the conversation history and save it to the database.
+    Shared by the JSON and streaming responses of /embed-chat.
+    
+    Args:
+        answer_cache_entry: Optional (question_embedding, fingerprint) when a fresh
+            first-turn answer should be stored in the answer cache
+    
+    Returns:
+        dict: The conversation state after the exchange
+    """
+    if answer_cache_entry and assistant_response:
+        question_embedding, fingerprint = answer_cache_entry
+        answer_cache.store(chatbot_id, question_embedding, assistant_response, fingerprint)
+    
+    handler.add_to_history("user", user_message)
+    handler.add_to_history("assistant", assistant_response)
+    # Re-measure the conversation so the store can enforce its memory budget
+    chat_handlers.touch(chatbot_id, thread_id)
+
+    # Get the current conversation state for the frontend
+    conversation_state = handler.get_conversation_state()
+    
+    # Debugging information
+    print(f"Conversation state: {conversation_state}")
+    
+    try:
+        # Save the message exchange
+        save_result = save_chat_message(
+            chatbot_id=chatbot_id,
+            thread_id=thread_id,  # Use consistent thread_id
+            user_message=user_message,
+            assistant_response=assistant_response,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=total_tokens,
+            ip_address=ip_address,
+            user_agent=user_agent
+        )
+        
+        if not save_result:
+            print(f"Warning: Failed to save chat message to database")
+    except Exception as save_error:
+        print(f"Error saving chat message: {str(save_error)}")
+        # Continue with response even if saving fails
+    
+    return conversation_state
+
+def get_chat_handler(chatbot_id, thread_id, system_prompt=None):
+    """
+    Get the visitor thread's chat handler, creating it if needed, with the
+    chatbot's system prompt applied. Shared by the WSGI and ASGI /embed-chat.
+    """
+    def create_handler():
+        new_handler = ChatPromptHandler(openai_client, pinecone_client)
+        # Ensure first message includes system prompt by forcing conversation reset
+        new_handler.reset_conversation()
+        new_handler.thread_id = thread_id
+        new_handler.chatbot_id = chatbot_id
+        return new_handler
+
+    handler, created = chat_handlers.get_or_create(chatbot_id, thread_id, create_handler)
+    if created:
+        print(f"Created chat handler for chatbot {chatbot_id}, thread {thread_id}")
+    
+    # If a custom system prompt is provided, override the default one
+    if system_prompt:
+        print(f"Using custom system prompt for chatbot {chatbot_id}")
+        handler.SYSTEM_PROMPT = system_prompt
+    else:
+        # Reset to default if no custom prompt is specified
+        # Using the imported DEFAULT_SYSTEM_PROMPT instead of hardcoded value
+        print(f"Using default system prompt for chatbot {chatbot_id}")
+        handler.SYSTEM_PROMPT = DEFAULT_SYSTEM_PROMPT
+    
+    return handler
+
+def stream_embed_chat(handler, chatbot_id, thread_id, user_message, messages,
+                      chat_model, temperature, max_tokens, ip_address, user_agent,
+                      cached_answer=None, answer_cache_entry=None, flight=None):
+    """
+    Stream a chat completion to the widget as Server-Sent Events.
+    
+    Sends one 'delta' message per content fragment, then a 'done' event with the
+    same fields as the JSON response. The full exchange and its token usage are
+    saved once the stream has ended. A cached answer is sent as a single delta.
+    The finished result is published to duplicate requests waiting on the flight.
+    """
+    def generate():
+        try:
+            yield from relay()
+        finally:
+            # Stream failed or the client went away before the end
+            chat_flights.abandon(flight)
+    
+    def relay():
+        fragments = []
+        usage_chunk = None
+        try:
+            if cached_answer is not None:
+                fragments.append(cached_answer)
+                yield format_sse({"delta": cached_answer})
+                stream = []
+            else:
+                stream = openai_client.chat.completions.create(
+                    model=chat_model,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    stream=True,
+                    stream_options={"include_usage": True}
+                )
+            
+            for chunk in stream:
+                # The final chunk carries usage and has no choices
+                if getattr(chunk, 'usage', None):
+                    usage_chunk = chunk
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    fragments.append(delta)
+                    yield format_sse({"delta": delta})
+        except Exception as e:
+            print(f"Detailed error in embed-chat stream: {str(e)}")
+            yield format_sse({"error": "Internal server error"}, event="error")
+            return
+        
+        assistant_response = "".join(fragments)
+        prompt_tokens, completion_tokens, total_tokens = extract_token_usage(usage_chunk)
+        
+        conversation_state = finish_chat_exchange(
+            handler, chatbot_id, thread_id, user_message, assistant_response,
+            prompt_tokens, completion_tokens, total_tokens, ip_address, user_agent,
+            answer_cache_entry=answer_cache_entry
+        )
+        
+        done = {
+            "thread_id": thread_id,
+            "is_first_interaction": conversation_state["is_first_interaction"],
+            "message_count": conversation_state["message_count"],
+            "initial_question": conversation_state.get("initial_question")
+        }
+        chat_flights.complete(flight, {"response": assistant_response, **done})
+        yield format_sse(done, event="done")
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    # Stop proxies from buffering the stream
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def shared_chat_response(result):
+    """
+    Return a result produced by an identical request (coalesced or replayed by
+    idempotency key) in the format this request asked for
+    """
+    if not wants_event_stream():
+        return jsonify(result)
+    
+    done = {key: value for key, value in result.items() if key != "response"}
+    body = format_sse({"delta": result["response"]}) + format_sse(done, event="done")
+    response = Response(body, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 # Modify the /embed-chat route to save message data
 @app.route('/embed-chat', methods=['POST'])
 @limiter.limit("10 per minute")
 def embed_chat():
+    flight = None
     try:
         data = request.json
         print("Received chat request:", data)  # Keep existing debug log
@@ -1783,30 +2058,15 @@ def embed_chat():
             print(f"Missing fields - chatbot_id: {chatbot_id}, message: {user_message}")
             return jsonify({"error": "Missing chatbot_id or message"}), 400
 
-        # Get namespace BEFORE initializing chat handler
-        with connect_to_db() as conn:
-            cursor = conn.cursor()
-            
-            if os.getenv('DB_TYPE', '').lower() == 'postgresql':
-                cursor.execute('''
-                    SELECT pinecone_namespace, c.chatbot_id
-                    FROM companies c
-                    WHERE c.chatbot_id = %s
-                ''', (chatbot_id,))
-            else:
-                cursor.execute('''
-                    SELECT pinecone_namespace, c.chatbot_id
-                    FROM companies c 
-                    WHERE c.chatbot_id = ?
-                ''', (chatbot_id,))
-                
-            row = cursor.fetchone()
+        # Namespace, prompt and model settings come from the cached chatbot profile
+        # (one joined query on a miss, no database access on a hit)
+        profile = chatbot_profile.get_profile(chatbot_id)
 
-        if not row:
+        if not profile:
             print(f"Chatbot ID {chatbot_id} not found in database")
             return jsonify({"error": "Chatbot ID not found"}), 404
 
-        namespace = row[0]
+        namespace = profile.namespace
         
         # Check if this is a support bot request (thread_id starting with "support_")
         is_support_bot = thread_id and thread_id.startswith("support_")
@@ -1815,69 +2075,46 @@ def embed_chat():
         
         # Get system prompt from chatbot_config if it exists
         system_prompt = None
-        with connect_to_db() as conn:
-            cursor = conn.cursor()
-            
-            if os.getenv('DB_TYPE', '').lower() == 'postgresql':
-                cursor.execute('''
-                    SELECT system_prompt, chat_model, temperature, max_tokens
-                    FROM chatbot_config
-                    WHERE chatbot_id = %s
-                ''', (chatbot_id,))
-            else:
-                cursor.execute('''
-                    SELECT system_prompt, chat_model, temperature, max_tokens
-                    FROM chatbot_config
-                    WHERE chatbot_id = ?
-                ''', (chatbot_id,))
-                
-            config_row = cursor.fetchone()
-            
-            if config_row:
-                system_prompt = config_row[0]
-                # Override model settings from frontend if not provided
-                if not model_settings:
-                    model_settings = {
-                        "model": config_row[1] or "gpt-4o",
-                        "temperature": float(config_row[2]) if config_row[2] is not None else 0.7,
-                        "max_tokens": int(config_row[3]) if config_row[3] is not None else 500
-                    }
-        
-        # Initialize chat handler with namespace if it doesn't exist
-        if chatbot_id not in chat_handlers:
-            chat_handlers[chatbot_id] = ChatPromptHandler(openai_client, pinecone_client)
-            # Ensure first message includes system prompt by forcing conversation reset
-            chat_handlers[chatbot_id].reset_conversation()
-            
-            # Always set the thread_id in the handler to the one provided by frontend
-            if thread_id:
-                # Ensure we're using the frontend-provided thread_id
-                chat_handlers[chatbot_id].thread_id = thread_id
-                print(f"Using frontend-provided thread_id: {thread_id}")
+        answer_cache_enabled = False
+        if profile.has_config:
+            system_prompt = profile.system_prompt
+            answer_cache_enabled = answer_cache.is_enabled(profile.answer_cache_enabled)
+            # Override model settings from frontend if not provided
+            if not model_settings:
+                model_settings = profile.get_model_settings()
+        
+        # Each visitor thread gets its own handler so histories never mix
+        if not thread_id:
+            thread_id = f"thread_{uuid.uuid4().hex}"
+            # Log a warning if no thread_id was provided
+            print(f"Warning: No thread_id provided in request, using generated: {thread_id}")
+
+        # Identical requests already in flight (or retried with the same idempotency key) share one result
+        idempotency_key = data.get("idempotency_key")
+        flight, shared_result = chat_flights.join(
+            single_flight.make_key(chatbot_id, thread_id, user_message, idempotency_key),
+            retain=bool(idempotency_key)
+        )
+        if shared_result is not None:
+            print(f"Returning shared result for duplicate request in thread {thread_id}")
+            return shared_chat_response(shared_result)
+
+        handler = get_chat_handler(chatbot_id, thread_id, system_prompt)
+        
+        # Opt-in answer cache: a first question close to an earlier one reuses its answer
+        cached_answer = None
+        answer_cache_entry = None
+        if answer_cache_enabled and handler.is_first_interaction:
+            fingerprint = answer_cache.make_fingerprint(
+                handler.SYSTEM_PROMPT, namespace, model_settings, profile.knowledge_version
+            )
+            question_embedding = embedding_cache.get_query_embedding(openai_client, user_message)
+            cached_answer = answer_cache.lookup(chatbot_id, question_embedding, fingerprint)
+            if cached_answer is not None:
+                print(f"Serving cached answer for chatbot {chatbot_id}")
+                handler.track_initial_question(user_message)
             else:
-                # Log a warning if no thread_id was provided
-                print(f"Warning: No thread_id provided in request, using generated: {chat_handlers[chatbot_id].thread_id}")
-
-        handler = chat_handlers[chatbot_id]
-        
-        # If a custom system prompt is provided, override the default one
-        if system_prompt:
-            print(f"Using custom system prompt for chatbot {chatbot_id}")
-            handler.SYSTEM_PROMPT = system_prompt
-        else:
-            # Reset to default if no custom prompt is specified
-            # Using the imported DEFAULT_SYSTEM_PROMPT instead of hardcoded value
-            print(f"Using default system prompt for chatbot {chatbot_id}")
-            handler.SYSTEM_PROMPT = DEFAULT_SYSTEM_PROMPT
-        
-        # Ensure handler is using the frontend thread_id for every message in the conversation
-        if thread_id and handler.thread_id != thread_id:
-            print(f"Thread ID mismatch - Request: {thread_id}, Handler: {handler.thread_id}")
-            # Always use the frontend-provided thread_id for consistency
-            handler.thread_id = thread_id
-            print(f"Updated handler thread_id to match request: {thread_id}")
-        
-        messages = handler.format_messages(user_message, namespace=namespace)
+                answer_cache_entry = (question_embedding, fingerprint)
         
         # Extract model settings from the request or use defaults
         chat_model = model_settings.get("model", "gpt-4o")
@@ -1887,73 +2124,64 @@ def embed_chat():
         # Log the model settings being used
         print(f"Using model settings - model: {chat_model}, temperature: {temperature}, max_tokens: {max_tokens}")
         
-        response = openai_client.chat.completions.create(
-            model=chat_model,
-            messages=messages,
-            max_tokens=max_tokens,
-            temperature=temperature
-        )
-
-        assistant_response = response.choices[0].message.content
-        handler.add_to_history("user", user_message)
-        handler.add_to_history("assistant", assistant_response)
-
-        # Get the current conversation state for the frontend
-        conversation_state = handler.get_conversation_state()
-        
-        # Debugging information
-        print(f"Conversation state: {conversation_state}")
-        
-        # Extract token usage from OpenAI response
-        prompt_tokens = 0
-        completion_tokens = 0
-        total_tokens = 0
+        # Retrieval and prompt assembly are only needed when we call the model
+        messages = None
+        if cached_answer is None:
+            messages = handler.format_messages(
+                user_message,
+                namespace=namespace,
+                model=chat_model,
+                max_completion_tokens=max_tokens
+            )
+            print(f"Prompt tokens by section: {handler.last_prompt_tokens}")
+        
+        # Relay tokens as they arrive when the widget negotiated Server-Sent Events
+        if wants_event_stream():
+            return stream_embed_chat(
+                handler, chatbot_id, thread_id, user_message, messages,
+                chat_model, temperature, max_tokens, ip_address, user_agent,
+                cached_answer=cached_answer, answer_cache_entry=answer_cache_entry,
+                flight=flight
+            )
         
-        # Check if usage information is available in the response
-        if hasattr(response, 'usage') and response.usage:
-            try:
-                prompt_tokens = response.usage.prompt_tokens
-                completion_tokens = response.usage.completion_tokens
-                total_tokens = response.usage.total_tokens
-                print(f"Token usage: prompt={prompt_tokens}, completion={completion_tokens}, total={total_tokens}")
-            except Exception as token_error:
-                print(f"Error extracting token usage: {str(token_error)}")
-        
-        # Save message to database - ALWAYS use the frontend-provided thread_id
-        try:
-            # Always use the thread_id from request if available
-            current_thread_id = thread_id or handler.thread_id
-            
-            # Save the message exchange
-            save_result = save_chat_message(
-                chatbot_id=chatbot_id,
-                thread_id=current_thread_id,  # Use consistent thread_id
-                user_message=user_message,
-                assistant_response=assistant_response,
-                prompt_tokens=prompt_tokens,
-                completion_tokens=completion_tokens,
-                total_tokens=total_tokens,
-                ip_address=ip_address,
-                user_agent=user_agent
+        if cached_answer is not None:
+            assistant_response = cached_answer
+            prompt_tokens, completion_tokens, total_tokens = 0, 0, 0
+        else:
+            response = openai_client.chat.completions.create(
+                model=chat_model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature
             )
+
+            assistant_response = response.choices[0].message.content
             
-            if not save_result:
-                print(f"Warning: Failed to save chat message to database")
-        except Exception as save_error:
-            print(f"Error saving chat message: {str(save_error)}")
-            # Continue with response even if saving fails
+            # Extract token usage from OpenAI response
+            prompt_tokens, completion_tokens, total_tokens = extract_token_usage(response)
+        
+        # Record history and save the exchange - ALWAYS use the frontend-provided thread_id
+        conversation_state = finish_chat_exchange(
+            handler, chatbot_id, thread_id, user_message, assistant_response,
+            prompt_tokens, completion_tokens, total_tokens, ip_address, user_agent,
+            answer_cache_entry=answer_cache_entry
+        )
         
         # Return the same thread_id that was provided in the request
-        return jsonify({
+        result = {
             "response": assistant_response,
-            "thread_id": thread_id or handler.thread_id,  # Return consistent thread_id
+            "thread_id": thread_id,  # Return consistent thread_id
             "is_first_interaction": conversation_state["is_first_interaction"],
             "message_count": conversation_state["message_count"],
             "initial_question": conversation_state.get("initial_question")
-        })
+        }
+        chat_flights.complete(flight, result)
+        return jsonify(result)
 
     except Exception as e:
         print(f"Detailed error in embed-chat: {str(e)}")  # Enhanced error logging
+        # Let a waiting duplicate retry instead of sharing the failure
+        chat_flights.abandon(flight)
         return jsonify({"error": "Internal server error"}), 500
     
 
@@ -1963,12 +2191,15 @@ def reset_chat():
     try:
         data = request.json
         chatbot_id = data.get('chatbot_id')
+        thread_id = data.get('thread_id')
         
         if not chatbot_id:
             return jsonify({'error': 'Missing chatbot ID'}), 400
             
-        if chatbot_id in chat_handlers:
-            chat_handlers[chatbot_id].reset_conversation()
+        # Only the caller's own conversation is dropped; other visitors keep theirs.
+        # Older widgets send no thread_id but start a fresh thread after reset anyway.
+        if thread_id:
+            chat_handlers.discard(chatbot_id, thread_id)
             
         return jsonify({'status': 'success', 'message': 'Chat history reset'})
     except Exception as e:
@@ -2372,6 +2603,9 @@ def get_chatbot_config(chatbot_id):
     Get chatbot configuration for the specified chatbot ID.
     This includes the icon_image_url and other settings.
     """
+    # The widget is loading, so start pulling the chatbot's vectors into the local cache
+    cache_warmer.warm_chatbot(chatbot_id)
+    
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
@@ -2455,41 +2689,30 @@ The GoEasyChat Team
 def check_active_status(chatbot_id):
     """Check if a chatbot is active and can be displayed"""
     try:
-        # Get database connection
-        with connect_to_db() as conn:
-            cursor = conn.cursor()
-            
-            # Different placeholder based on database type
-            placeholder = '%s' if os.getenv('DB_TYPE', '').lower() == 'postgresql' else '?'
-            
-            # Query to get active_status from companies table
-            query = f"""
-                SELECT active_status
-                FROM {'companies' if os.getenv('DB_TYPE', '').lower() != 'postgresql' else DB_SCHEMA + '.companies'}
-                WHERE chatbot_id = {placeholder}
-            """
-            
-            cursor.execute(query, (chatbot_id,))
-            result = cursor.fetchone()
-            
-            if not result:
-                print(f"[check_active_status] Chatbot ID not found: {chatbot_id}")
-                return jsonify({
-                    "active": False,
-                    "status": "not_found",
-                    "message": "Chatbot not found"
-                }), 404
-            
-            active_status = result[0]
-            print(f"[check_active_status] Chatbot {chatbot_id} status: {active_status}")
-            
-            # Only consider 'live' as active
-            is_active = active_status == 'live'
-            
+        # active_status comes from the cached chatbot profile shared with embed_chat
+        profile = chatbot_profile.get_profile(chatbot_id)
+        
+        if not profile:
+            print(f"[check_active_status] Chatbot ID not found: {chatbot_id}")
             return jsonify({
-                "active": is_active,
-                "status": active_status
-            })
+                "active": False,
+                "status": "not_found",
+                "message": "Chatbot not found"
+            }), 404
+        
+        active_status = profile.active_status
+        print(f"[check_active_status] Chatbot {chatbot_id} status: {active_status}")
+        
+        if active_status == 'live':
+            cache_warmer.warm_chatbot(chatbot_id, profile.namespace)
+        
+        # Only consider 'live' as active
+        is_active = active_status == 'live'
+        
+        return jsonify({
+            "active": is_active,
+            "status": active_status
+        })
             
     except Exception as e:
         import traceback
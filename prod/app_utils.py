@@ -6,6 +6,8 @@ import requests
 from openai import OpenAI
 from bs4 import BeautifulSoup
 import pinecone
+import pinecone_sync
+import vector_replica
 
 def generate_chatbot_id():
     """Generate a unique chatbot ID."""
@@ -208,6 +210,10 @@ def update_pinecone_index(namespace, text_chunks, embeddings):
         try:
             upsert_response = index.upsert(vectors=vectors, namespace=namespace)
             print(f"Pinecone upsert successful. Namespace: {namespace}, Vectors: {len(vectors)}")
+            
+            # Mirror into the local replica if the namespace already has one
+            vector_replica.upsert(namespace, [v[0] for v in vectors], embeddings, text_chunks)
+            pinecone_sync.record_vectors(namespace, [v[0] for v in vectors], text_chunks)
             return True
         except Exception as upsert_error:
             print(f"Error during Pinecone upsert: {upsert_error}")
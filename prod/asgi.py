@@ -0,0 +1,308 @@
+"""
+ASGI entry point: serves /embed-chat on an asyncio event loop and everything
+else through the existing Flask app.
+
+Run with:
+    cd prod && gunicorn -k uvicorn.workers.UvicornWorker --forwarded-allow-ips='*' --timeout 600 asgi:app
+
+The chat path awaits the OpenAI embedding and completion calls, so a worker
+holds hundreds of in-flight conversations instead of one per thread. The
+short blocking steps that remain (a chatbot profile miss, the vector cache
+search and the Pinecone query) run on a bounded thread pool.
+"""
+import os
+import uuid
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from a2wsgi import WSGIMiddleware
+from limits import parse
+from limits.storage import MemoryStorage
+from limits.strategies import FixedWindowRateLimiter
+from openai import AsyncOpenAI
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+
+from app import (
+    app as flask_app,
+    chat_flights,
+    extract_token_usage,
+    finish_chat_exchange,
+    format_sse,
+    get_chat_handler,
+    pause_chatbot_for_rate_limit
+)
+import answer_cache
+import chatbot_profile
+import embedding_cache
+import single_flight
+
+# Async client for the chat path; the Flask app keeps its own sync client
+async_openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+# Threads for the blocking steps of the chat path (database, vector cache, Pinecone)
+_blocking_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('ASGI_BLOCKING_WORKERS', 32)),
+    thread_name_prefix="asgi-blocking"
+)
+
+# Same limit as the Flask route: 10 per minute per client IP, in-memory per worker
+EMBED_CHAT_LIMIT = parse(os.getenv('EMBED_CHAT_RATE_LIMIT', '10 per minute'))
+_rate_limiter = FixedWindowRateLimiter(MemoryStorage())
+
+# The widget is embedded on customer sites, so the endpoint is open to all origins (like CORS(app))
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "POST, OPTIONS",
+    "Access-Control-Allow-Headers": "Content-Type, Accept"
+}
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking call on the chat thread pool without stalling the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_blocking_executor, partial(func, *args, **kwargs))
+
+
+def json_response(data, status_code=200):
+    return JSONResponse(data, status_code=status_code, headers=CORS_HEADERS)
+
+
+async def embed_chat(request: Request):
+    """Async /embed-chat with the same request and response format as the Flask route"""
+    if request.method == "OPTIONS":
+        return Response(status_code=200, headers=CORS_HEADERS)
+
+    ip_address = request.client.host if request.client else None
+    user_agent = request.headers.get('user-agent')
+
+    try:
+        data = await request.json()
+    except Exception:
+        data = None
+    if not isinstance(data, dict):
+        return json_response({"error": "Invalid JSON"}, 400)
+
+    chatbot_id = data.get("chatbot_id")
+
+    if not _rate_limiter.hit(EMBED_CHAT_LIMIT, "embed_chat", ip_address or "unknown"):
+        print(f"[RATE LIMIT] Rate limit exceeded for IP: {ip_address}")
+        if chatbot_id:
+            try:
+                await run_blocking(pause_chatbot_for_rate_limit, chatbot_id, request.url.path,
+                                   ip_address=ip_address, user_agent=user_agent)
+            except Exception as incident_error:
+                print(f"[RATE LIMIT] Error handling rate limit incident: {str(incident_error)}")
+        return json_response({
+            "error": "Too many requests. This chatbot has been paused due to excessive usage.",
+            "rate_limit_exceeded": True,
+            "chatbot_paused": chatbot_id is not None
+        }, 429)
+
+    flight = None
+    try:
+        user_message = data.get("message")
+        thread_id = data.get("thread_id")
+        model_settings = data.get("model_settings", {})
+
+        if not chatbot_id or not user_message:
+            print(f"Missing fields - chatbot_id: {chatbot_id}, message: {user_message}")
+            return json_response({"error": "Missing chatbot_id or message"}, 400)
+
+        profile = await run_blocking(chatbot_profile.get_profile, chatbot_id)
+        if not profile:
+            print(f"Chatbot ID {chatbot_id} not found in database")
+            return json_response({"error": "Chatbot ID not found"}, 404)
+
+        namespace = profile.namespace
+        system_prompt = None
+        answer_cache_enabled = False
+        if profile.has_config:
+            system_prompt = profile.system_prompt
+            answer_cache_enabled = answer_cache.is_enabled(profile.answer_cache_enabled)
+            if not model_settings:
+                model_settings = profile.get_model_settings()
+
+        if not thread_id:
+            thread_id = f"thread_{uuid.uuid4().hex}"
+            print(f"Warning: No thread_id provided in request, using generated: {thread_id}")
+
+        # Identical requests already in flight (or retried with the same idempotency key) share one result
+        idempotency_key = data.get("idempotency_key")
+        flight, shared_result = await run_blocking(
+            chat_flights.join,
+            single_flight.make_key(chatbot_id, thread_id, user_message, idempotency_key),
+            retain=bool(idempotency_key),
+            # The wait holds a thread of the shared blocking pool
+            wait_timeout_seconds=single_flight.DEFAULT_POOL_WAIT_TIMEOUT_SECONDS
+        )
+        if shared_result is not None:
+            print(f"Returning shared result for duplicate request in thread {thread_id}")
+            return shared_chat_response(request, shared_result)
+
+        handler = get_chat_handler(chatbot_id, thread_id, system_prompt)
+
+        chat_model = model_settings.get("model", "gpt-4o")
+        temperature = model_settings.get("temperature", 0.7)
+        max_tokens = model_settings.get("max_tokens", 500)
+
+        # Embed the question without blocking; retrieval below then hits the embedding cache
+        question_embedding = await embedding_cache.get_query_embedding_async(async_openai_client, user_message)
+
+        cached_answer = None
+        answer_cache_entry = None
+        if answer_cache_enabled and handler.is_first_interaction:
+            fingerprint = answer_cache.make_fingerprint(
+                handler.SYSTEM_PROMPT, namespace, model_settings, profile.knowledge_version
+            )
+            cached_answer = answer_cache.lookup(chatbot_id, question_embedding, fingerprint)
+            if cached_answer is not None:
+                print(f"Serving cached answer for chatbot {chatbot_id}")
+                handler.track_initial_question(user_message)
+            else:
+                answer_cache_entry = (question_embedding, fingerprint)
+
+        messages = None
+        if cached_answer is None:
+            messages = await run_blocking(
+                handler.format_messages,
+                user_message,
+                namespace=namespace,
+                model=chat_model,
+                max_completion_tokens=max_tokens
+            )
+
+        finish = partial(
+            finish_chat_exchange, handler, chatbot_id, thread_id, user_message,
+            ip_address=ip_address, user_agent=user_agent, answer_cache_entry=answer_cache_entry
+        )
+
+        if wants_event_stream(request):
+            return StreamingResponse(
+                stream_chat(finish, thread_id, messages, chat_model, temperature, max_tokens,
+                            cached_answer=cached_answer, flight=flight),
+                media_type='text/event-stream',
+                headers={**CORS_HEADERS, 'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+            )
+
+        if cached_answer is not None:
+            assistant_response = cached_answer
+            prompt_tokens, completion_tokens, total_tokens = 0, 0, 0
+        else:
+            response = await async_openai_client.chat.completions.create(
+                model=chat_model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature
+            )
+            assistant_response = response.choices[0].message.content
+            prompt_tokens, completion_tokens, total_tokens = extract_token_usage(response)
+
+        conversation_state = finish(
+            assistant_response=assistant_response,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=total_tokens
+        )
+
+        result = {
+            "response": assistant_response,
+            "thread_id": thread_id,
+            "is_first_interaction": conversation_state["is_first_interaction"],
+            "message_count": conversation_state["message_count"],
+            "initial_question": conversation_state.get("initial_question")
+        }
+        chat_flights.complete(flight, result)
+        return json_response(result)
+
+    except Exception as e:
+        print(f"Detailed error in async embed-chat: {str(e)}")
+        # Let a waiting duplicate retry instead of sharing the failure
+        chat_flights.abandon(flight)
+        return json_response({"error": "Internal server error"}, 500)
+
+
+def wants_event_stream(request: Request) -> bool:
+    return request.headers.get('accept', '').startswith('text/event-stream')
+
+
+def shared_chat_response(request: Request, result):
+    """Return a result produced by an identical request in the format this request asked for"""
+    if not wants_event_stream(request):
+        return json_response(result)
+    done = {key: value for key, value in result.items() if key != "response"}
+    body = format_sse({"delta": result["response"]}) + format_sse(done, event="done")
+    return Response(body, media_type='text/event-stream', headers={**CORS_HEADERS, 'Cache-Control': 'no-cache'})
+
+
+async def stream_chat(finish, thread_id, messages, chat_model, temperature, max_tokens,
+                      cached_answer=None, flight=None):
+    """Relay completion fragments as Server-Sent Events, in the same format as the Flask stream"""
+    try:
+        async for event in relay_chat(finish, thread_id, messages, chat_model, temperature, max_tokens,
+                                      cached_answer=cached_answer, flight=flight):
+            yield event
+    finally:
+        # Completed flights ignore this; otherwise the stream failed or the client went away
+        chat_flights.abandon(flight)
+
+
+async def relay_chat(finish, thread_id, messages, chat_model, temperature, max_tokens, cached_answer=None,
+                     flight=None):
+    fragments = []
+    usage_chunk = None
+    try:
+        if cached_answer is not None:
+            fragments.append(cached_answer)
+            yield format_sse({"delta": cached_answer})
+        else:
+            stream = await async_openai_client.chat.completions.create(
+                model=chat_model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+            async for chunk in stream:
+                # The final chunk carries usage and has no choices
+                if getattr(chunk, 'usage', None):
+                    usage_chunk = chunk
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    fragments.append(delta)
+                    yield format_sse({"delta": delta})
+    except Exception as e:
+        print(f"Detailed error in async embed-chat stream: {str(e)}")
+        yield format_sse({"error": "Internal server error"}, event="error")
+        return
+
+    assistant_response = "".join(fragments)
+    prompt_tokens, completion_tokens, total_tokens = extract_token_usage(usage_chunk)
+    conversation_state = finish(
+        assistant_response=assistant_response,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        total_tokens=total_tokens
+    )
+
+    done = {
+        "thread_id": thread_id,
+        "is_first_interaction": conversation_state["is_first_interaction"],
+        "message_count": conversation_state["message_count"],
+        "initial_question": conversation_state.get("initial_question")
+    }
+    chat_flights.complete(flight, {"response": assistant_response, **done})
+    yield format_sse(done, event="done")
+
+
+app = Starlette(routes=[
+    Route('/embed-chat', embed_chat, methods=['POST', 'OPTIONS']),
+    # Everything else is served by the Flask app unchanged
+    Mount('/', app=WSGIMiddleware(flask_app))
+])
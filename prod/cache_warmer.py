@@ -0,0 +1,293 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import logging
+
+import chatbot_profile
+import vector_cache
+import vector_replica
+from chat_handler import get_index_handle
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# How long warmed vectors stay in the local cache. Content changes made through the
+# dashboard invalidate the entry in this worker; other workers drop it once their
+# profile shows a newer knowledge version, so this only bounds staleness from elsewhere.
+WARM_TTL_SECONDS = int(os.getenv('CACHE_WARM_TTL_SECONDS', 900))
+
+# A namespace is warmed at most once per interval, however often its widget loads
+WARM_INTERVAL_SECONDS = float(os.getenv('CACHE_WARM_INTERVAL_SECONDS', 300))
+
+# Namespaces larger than this are left to Pinecone rather than held in memory
+MAX_WARM_VECTORS = int(os.getenv('CACHE_WARM_MAX_VECTORS', 2000))
+
+# Background threads doing the warming, and how many warms may wait for one
+WARM_WORKERS = int(os.getenv('CACHE_WARM_WORKERS', 2))
+MAX_PENDING_WARMS = int(os.getenv('CACHE_WARM_MAX_PENDING', 32))
+
+# Vector IDs per Pinecone fetch call (IDs travel in the query string)
+FETCH_BATCH_SIZE = 100
+
+pinecone_client = None
+PINECONE_INDEX = None
+
+_executor = ThreadPoolExecutor(max_workers=WARM_WORKERS, thread_name_prefix="cache-warmer")
+_lock = threading.Lock()
+# Chatbots and namespaces with a warm queued or running
+_pending_chatbots = set()
+_pending_namespaces = set()
+# Last time a warm was accepted for a chatbot, and last completed warm per namespace
+_last_requested: Dict[str, float] = {}
+_last_warmed: Dict[str, float] = {}
+# Namespace each chatbot was last warmed for, so invalidate() can reset its rate limit
+_namespace_chatbots: Dict[str, str] = {}
+# Bumped by invalidate() so a warm that read the old content does not overwrite the new
+_generations: Dict[str, int] = {}
+_stats_lock = threading.Lock()
+_stats = {
+    "requested": 0, "deduplicated": 0, "rate_limited": 0, "queue_full": 0,
+    "warmed": 0, "vectors_loaded": 0, "skipped_inactive": 0, "skipped_too_large": 0,
+    "skipped_empty": 0, "skipped_replica": 0, "replicas_created": 0, "failures": 0
+}
+
+
+def init_cache_warmer(app_pinecone_client, app_pinecone_index: str) -> None:
+    """Set the Pinecone client and index the warmer fetches vectors from"""
+    global pinecone_client, PINECONE_INDEX
+    pinecone_client = app_pinecone_client
+    PINECONE_INDEX = app_pinecone_index
+
+
+def _count(key: str, amount: int = 1) -> None:
+    with _stats_lock:
+        _stats[key] += amount
+
+
+def warm_chatbot(chatbot_id: str, namespace: str = None) -> bool:
+    """
+    Prefetch a chatbot's vectors into the local vector cache in the background,
+    so the visitor's first question is answered without a Pinecone query.
+    Called when the widget loads; returns immediately.
+
+    Args:
+        chatbot_id: Chatbot whose widget is loading
+        namespace: The chatbot's namespace if the caller already has it
+
+    Returns:
+        bool: True if a warm was queued
+    """
+    if pinecone_client is None or not chatbot_id:
+        return False
+
+    now = time.time()
+    with _lock:
+        _count("requested")
+        # The widget calls several endpoints on load; only the first one queues a warm
+        if chatbot_id in _pending_chatbots:
+            _count("deduplicated")
+            return False
+        if now - _last_requested.get(chatbot_id, 0) < WARM_INTERVAL_SECONDS:
+            _count("rate_limited")
+            return False
+        if namespace and (namespace in _pending_namespaces or
+                          now - _last_warmed.get(namespace, 0) < WARM_INTERVAL_SECONDS):
+            _count("rate_limited")
+            return False
+        if len(_pending_chatbots) >= MAX_PENDING_WARMS:
+            _count("queue_full")
+            return False
+        _pending_chatbots.add(chatbot_id)
+        _last_requested[chatbot_id] = now
+
+    try:
+        _executor.submit(_warm, chatbot_id, namespace)
+    except RuntimeError:
+        # Executor shut down while the worker exits
+        with _lock:
+            _pending_chatbots.discard(chatbot_id)
+        return False
+    return True
+
+
+def invalidate(namespace: str) -> None:
+    """
+    Drop warmed vectors for a namespace after its content changed in Pinecone,
+    so the next widget load warms it again from the new content
+    """
+    if not namespace:
+        return
+    with _lock:
+        _generations[namespace] = _generations.get(namespace, 0) + 1
+        _last_warmed.pop(namespace, None)
+        for chatbot_id, warmed_namespace in list(_namespace_chatbots.items()):
+            if warmed_namespace == namespace:
+                _last_requested.pop(chatbot_id, None)
+    if vector_cache.remove_from_cache(namespace):
+        logger.info(f"[cache_warmer] Invalidated cached vectors for namespace '{namespace}'")
+
+
+def get_stats() -> Dict:
+    """Get warm counters and the namespaces currently warmed by this worker"""
+    with _stats_lock:
+        stats = dict(_stats)
+    with _lock:
+        stats.update({
+            "pending": len(_pending_chatbots),
+            "warmed_namespaces": len(_last_warmed),
+            "ttl_seconds": WARM_TTL_SECONDS,
+            "interval_seconds": WARM_INTERVAL_SECONDS,
+            "max_vectors": MAX_WARM_VECTORS
+        })
+    return stats
+
+
+def _warm(chatbot_id: str, namespace: Optional[str]) -> None:
+    claimed = None
+    try:
+        # Also primes the profile cache for the chat request that usually follows
+        profile = chatbot_profile.get_profile(chatbot_id)
+        if not profile or not profile.namespace:
+            return
+        if profile.active_status != 'live':
+            _count("skipped_inactive")
+            return
+        namespace = profile.namespace
+
+        # Served from its local replica already; nothing to prefetch. A replica that missed
+        # a change made on another host is rebuilt below.
+        if vector_replica.SERVING_ENABLED and vector_replica.has_replica(namespace, profile.knowledge_version):
+            _count("skipped_replica")
+            return
+
+        with _lock:
+            if namespace in _pending_namespaces:
+                _count("deduplicated")
+                return
+            if time.time() - _last_warmed.get(namespace, 0) < WARM_INTERVAL_SECONDS:
+                _count("rate_limited")
+                return
+            # Already warm at the current knowledge version, e.g. by another worker sharing the vector cache
+            cache_status = vector_cache.get_cache_status(namespace)
+            if (cache_status.get("time_remaining", 0) > WARM_INTERVAL_SECONDS and
+                    (cache_status.get("knowledge_version") or 0) >= profile.knowledge_version):
+                _count("rate_limited")
+                return
+            _pending_namespaces.add(namespace)
+            _namespace_chatbots[chatbot_id] = namespace
+            generation = _generations.get(namespace, 0)
+            claimed = namespace
+
+        started = time.time()
+        loaded = _load_namespace(namespace)
+        if loaded is None:
+            return
+        ids, vectors, chunks, doc_ids, complete = loaded
+        with _lock:
+            changed = _generations.get(namespace, 0) != generation
+        if changed:
+            logger.info(f"[cache_warmer] Namespace '{namespace}' changed while warming, discarding")
+            return
+
+        # Namespaces written before replicas existed, or changed on another host, get one from
+        # what Pinecone holds. create_only: a write-through that landed meanwhile is newer than this fetch.
+        if vector_replica.SERVING_ENABLED and complete and vector_replica.replace_namespace(
+                namespace, ids, vectors, chunks, doc_ids=doc_ids, create_only=True,
+                knowledge_version=profile.knowledge_version):
+            _count("replicas_created")
+            logger.info(f"[cache_warmer] Created local replica of namespace '{namespace}' from Pinecone")
+            return
+
+        with _lock:
+            if _generations.get(namespace, 0) != generation:
+                logger.info(f"[cache_warmer] Namespace '{namespace}' changed while warming, discarding")
+                return
+            cached = vector_cache.add_to_cache(namespace, vectors, chunks, expiry_seconds=WARM_TTL_SECONDS,
+                                               knowledge_version=profile.knowledge_version)
+            if cached:
+                _last_warmed[namespace] = time.time()
+        if cached:
+            _count("warmed")
+            _count("vectors_loaded", len(chunks))
+            logger.info(
+                f"[cache_warmer] Warmed {len(chunks)} vectors for namespace '{namespace}' "
+                f"in {time.time() - started:.2f}s"
+            )
+    except Exception as e:
+        _count("failures")
+        logger.error(f"[cache_warmer] Error warming chatbot {chatbot_id}: {e}")
+    finally:
+        with _lock:
+            _pending_chatbots.discard(chatbot_id)
+            if claimed:
+                _pending_namespaces.discard(claimed)
+
+
+def _load_namespace(namespace: str) -> Optional[Tuple[List[str], np.ndarray, List[str], List, bool]]:
+    """
+    Fetch every vector and its text in a namespace, or None if it should not be cached
+
+    Returns:
+        Tuple of (ids, vectors, texts, doc_ids, complete) where complete is False if the
+        IDs had to be guessed and documents may be missing
+    """
+    index = get_index_handle(pinecone_client, PINECONE_INDEX)
+
+    ids, complete = _list_vector_ids(index, namespace)
+    if not ids:
+        _count("skipped_empty")
+        return None
+    if len(ids) > MAX_WARM_VECTORS:
+        _count("skipped_too_large")
+        logger.info(f"[cache_warmer] Namespace '{namespace}' has more than {MAX_WARM_VECTORS} vectors, not warming")
+        return None
+
+    found_ids = []
+    values = []
+    chunks = []
+    doc_ids = []
+    for i in range(0, len(ids), FETCH_BATCH_SIZE):
+        response = index.fetch(ids=ids[i:i + FETCH_BATCH_SIZE], namespace=namespace)
+        for vector_id, vector in response.vectors.items():
+            metadata = vector.metadata or {}
+            text = metadata.get("text")
+            if text:
+                found_ids.append(vector_id)
+                values.append(vector.values)
+                chunks.append(text)
+                doc_ids.append(metadata.get("doc_id"))
+
+    if not chunks:
+        _count("skipped_empty")
+        return None
+    # float32 keeps a 1536-dimension chunk at 6 KB instead of ~50 KB as a list of floats
+    return found_ids, np.asarray(values, dtype=np.float32), chunks, doc_ids, complete
+
+
+def _list_vector_ids(index, namespace: str) -> Tuple[List[str], bool]:
+    """
+    List vector IDs in a namespace, stopping once there are too many to cache
+
+    Returns:
+        Tuple of (ids, complete)
+    """
+    ids = []
+    try:
+        for page in index.list(namespace=namespace):
+            ids.extend(page)
+            if len(ids) > MAX_WARM_VECTORS:
+                break
+        return ids, True
+    except Exception as e:
+        # Older clients have no list(), and pod-based indexes reject it
+        logger.info(f"[cache_warmer] Cannot list vector IDs in namespace '{namespace}' ({e}), probing instead")
+
+    # Scraped content uses sequential IDs, so probe those
+    stats = index.describe_index_stats()
+    namespace_stats = stats.namespaces.get(namespace) if stats.namespaces else None
+    count = getattr(namespace_stats, 'vector_count', 0) if namespace_stats else 0
+    return [f"{namespace}-{i}" for i in range(min(count, MAX_WARM_VECTORS + 1))], False
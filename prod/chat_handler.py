@@ -1,11 +1,61 @@
 from typing import List, Dict, Tuple, Optional
 from datetime import datetime
-import json
+import time
 import uuid
 from openai import OpenAI
 from pinecone import Pinecone
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 import vector_cache
+import vector_replica
+import chatbot_profile
+import embedding_cache
+import prompt_audit
+import prompt_budget
+
+# Longest hybrid retrieval waits for Pinecone before answering from the local document cache alone
+RETRIEVAL_DEADLINE_SECONDS = float(os.getenv('RETRIEVAL_DEADLINE_SECONDS', 1.5))
+
+# Shared pool for remote Pinecone queries so they can overlap the local cache search
+_retrieval_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('RETRIEVAL_WORKERS', 8)),
+    thread_name_prefix="retrieval"
+)
+
+# Long-lived Pinecone Index handles keyed by (client, index name); building one per query
+# repeats the client setup on every chat message
+_index_handles = {}
+_index_handles_lock = threading.Lock()
+
+
+def get_index_handle(pinecone_client, index_name: str):
+    """Get a shared Index handle for a Pinecone client, creating it on first use"""
+    key = (id(pinecone_client), index_name)
+    index = _index_handles.get(key)
+    if index is None:
+        with _index_handles_lock:
+            index = _index_handles.get(key)
+            if index is None:
+                index = pinecone_client.Index(index_name)
+                _index_handles[key] = index
+    return index
+
+
+def merge_results(*result_lists: List[Dict], top_k: int) -> List[Dict]:
+    """
+    Merge scored results from several sources, keeping the best score for
+    chunks that appear in more than one (uploaded documents live in both the
+    local cache and Pinecone)
+    """
+    best = {}
+    for results in result_lists:
+        for result in results:
+            existing = best.get(result["text"])
+            if existing is None or result["score"] > existing["score"]:
+                best[result["text"]] = result
+    merged = sorted(best.values(), key=lambda x: x["score"], reverse=True)
+    return merged[:top_k]
 
 # Export the default system prompt as a module-level constant
 DEFAULT_SYSTEM_PROMPT = '''### Role
@@ -38,6 +88,9 @@ class ChatPromptHandler:
         self.thread_id = str(uuid.uuid4())  # Generate a unique thread ID for this conversation
         self.is_first_interaction = True  # Track if this is the first user message
         self.initial_question = None  # Store the first question for lead generation
+        self.chatbot_id = None  # Set by the caller so audit records can be attributed
+        self.last_retrieval = {}  # Source, scores and timing of the latest context lookup
+        self.last_prompt_tokens = {}  # Per-section token counts of the latest prompt
         
         # Initialize clients if not provided
         self.openai_client = openai_client or OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
@@ -50,66 +103,94 @@ class ChatPromptHandler:
     def get_relevant_context(self, query: str, namespace: str, num_results: int = 5) -> str:
         """
         Search for relevant context based on the query.
+        
+        Returns concatenated context strings from top matches.
+        """
+        chunks = self.get_relevant_chunks(query, namespace, num_results)
+        return "\n".join(chunk['text'] for chunk in chunks)
+
+    def get_relevant_chunks(self, query: str, namespace: str, num_results: int = 5) -> List[Dict]:
+        """
+        Search for relevant context chunks based on the query.
         Uses a hybrid approach:
+        0. In replica serving mode: search the namespace's local replica, which holds everything
         1. For regular cache: use cache first, fall back to Pinecone if expired
-        2. For document uploads: check both document cache AND Pinecone, merge results
+        2. For document uploads: check both document cache AND Pinecone, merge results;
+           Pinecone is never waited on past RETRIEVAL_DEADLINE_SECONDS
         
-        Returns concatenated context strings from top matches.
+        Returns top matches as dicts with 'text' and 'score', best first.
         """
+        started = time.time()
+        self.last_retrieval = {}
         try:
-            # Get embedding for the query
-            query_embedding = self.openai_client.embeddings.create(
-                input=query,
+            # Get embedding for the query (served from the process-wide cache when possible)
+            query_embedding = embedding_cache.get_query_embedding(
+                self.openai_client,
+                query,
                 model="text-embedding-ada-002"
-            ).data[0].embedding
+            )
+            # --- SCENARIO 0: Local replica (complete copy of the namespace) ---
+            if vector_replica.SERVING_ENABLED:
+                replica_results = vector_replica.search(
+                    namespace, query_embedding, top_k=num_results,
+                    knowledge_version=self._knowledge_version(namespace)
+                )
+                if replica_results:
+                    self._record_retrieval("replica", replica_results, started)
+                    return replica_results
+            
+            # Pinecone expects a plain list of floats
+            query_vector = query_embedding.tolist()
 
             # Check for cached document vectors for this namespace
-            document_cache_keys = vector_cache.get_all_document_cache_keys(namespace)
-            has_document_cache = len(document_cache_keys) > 0
+            has_document_cache = vector_cache.has_document_cache(namespace)
             
-            # Check for regular cache
-            regular_cache_valid = vector_cache.is_cache_valid(namespace)
+            # Check for regular cache; vectors warmed before the knowledge base last changed are stale
+            regular_cache_valid = vector_cache.is_cache_valid(namespace, self._knowledge_version(namespace))
             
             # --- SCENARIO 1: Document Upload (Hybrid Search) ---
             if has_document_cache:
                 print(f"Using hybrid search for namespace '{namespace}' with document cache")
                 
-                # Step 1: Get results from document cache
+                # Step 1: Start the Pinecone query in the background
+                submitted = time.time()
+                pinecone_future = _retrieval_executor.submit(
+                    self._query_pinecone, query_vector, namespace, num_results
+                )
+                
+                # Step 2: Search the document cache while Pinecone is in flight
                 cached_doc_results = vector_cache.get_cached_document_results(
                     namespace, 
                     query_embedding,
                     top_k=num_results
                 )
                 
-                # Step 2: Get results from Pinecone
-                index = self.pinecone_client.Index(self.PINECONE_INDEX)
-                pinecone_results = index.query(
-                    vector=query_embedding,
-                    namespace=namespace,
-                    top_k=num_results,
-                    include_metadata=True
-                )
-                
-                # Convert Pinecone results to same format as cache results
-                pinecone_formatted = [
-                    {"text": match.metadata['text'], "score": match.score} 
-                    for match in pinecone_results.matches
-                ]
-                
-                # Step 3: Merge results - add all results and sort by score
-                all_results = cached_doc_results + pinecone_formatted
-                all_results.sort(key=lambda x: x["score"], reverse=True)
+                # Step 3: Wait for Pinecone only until the deadline
+                pinecone_formatted = []
+                pinecone_timeout = False
+                remaining = RETRIEVAL_DEADLINE_SECONDS - (time.time() - submitted)
+                try:
+                    pinecone_formatted = pinecone_future.result(timeout=max(remaining, 0))
+                except FutureTimeoutError:
+                    pinecone_timeout = True
+                    print(f"Pinecone missed the {RETRIEVAL_DEADLINE_SECONDS}s deadline, using document cache results only")
+                except Exception as e:
+                    print(f"Pinecone query failed during hybrid search, using document cache results only: {e}")
                 
-                # Step 4: Take top results
-                merged_results = all_results[:num_results]
+                # Step 4: Merge results and take the top matches
+                merged_results = merge_results(cached_doc_results, pinecone_formatted, top_k=num_results)
                 
-                # Combine the relevant chunks from merged results
-                if merged_results:
-                    context_chunks = [match['text'] for match in merged_results]
-                    return "\n".join(context_chunks)
-                    
-                # Fallback if no results from hybrid search
-                print(f"Hybrid search returned no results, using Pinecone only")
+                # Pinecone already had its chance within the deadline; querying it again
+                # synchronously would let an empty result wait on it without a bound
+                if not merged_results:
+                    print(f"Hybrid search returned no results for namespace '{namespace}'")
+                self._record_retrieval(
+                    "hybrid", merged_results, started,
+                    local=len(cached_doc_results),
+                    remote=len(pinecone_formatted),
+                    pinecone_timeout=pinecone_timeout
+                )
+                return merged_results
             
             # --- SCENARIO 2: Regular Cache ---
             elif regular_cache_valid:
@@ -123,86 +204,125 @@ class ChatPromptHandler:
                 )
                 
                 if cached_results:
-                    # Combine the relevant chunks from cache
-                    context_chunks = [match['text'] for match in cached_results]
-                    return "\n".join(context_chunks)
+                    self._record_retrieval("cache", cached_results, started)
+                    return cached_results
                     
                 print(f"Cache returned no results, falling back to Pinecone")
             
             # --- SCENARIO 3: Fallback to Pinecone ---
             # If no cache or cache returned no results, use Pinecone
-            index = self.pinecone_client.Index(self.PINECONE_INDEX)
-            results = index.query(
-                vector=query_embedding,
-                namespace=namespace,
-                top_k=num_results,
-                include_metadata=True
-            )
-
-            # Combine the relevant chunks from Pinecone
-            context_chunks = [match.metadata['text'] for match in results.matches]
-            return "\n".join(context_chunks)
+            pinecone_results = self._query_pinecone(query_vector, namespace, num_results)
+            self._record_retrieval("pinecone", pinecone_results, started)
+            return pinecone_results
         except Exception as e:
             print(f"Error getting relevant context: {e}")
-            return ""
+            self.last_retrieval = {"source": "error", "error": str(e)}
+            return []
+
+    def _knowledge_version(self, namespace: str) -> Optional[int]:
+        """Current knowledge version of the chatbot serving this namespace, from its cached profile"""
+        if not self.chatbot_id:
+            return None
+        try:
+            profile = chatbot_profile.get_profile(self.chatbot_id)
+        except Exception as e:
+            print(f"Could not load profile for chatbot {self.chatbot_id}: {e}")
+            return None
+        if profile is None or profile.namespace != namespace:
+            return None
+        return profile.knowledge_version
+
+    def _query_pinecone(self, query_vector: List[float], namespace: str, num_results: int) -> List[Dict]:
+        """Query Pinecone and return results in the same format as the vector cache"""
+        index = get_index_handle(self.pinecone_client, self.PINECONE_INDEX)
+        results = index.query(
+            vector=query_vector,
+            namespace=namespace,
+            top_k=num_results,
+            include_metadata=True
+        )
+        return [
+            {"text": match.metadata['text'], "score": match.score}
+            for match in results.matches
+        ]
+
+    def _record_retrieval(self, source: str, results: List[Dict], started: float, **details):
+        """Keep a compact summary of the latest retrieval for the prompt audit log"""
+        self.last_retrieval = {
+            "source": source,
+            "chunks": len(results),
+            "scores": [round(float(result["score"]), 4) for result in results],
+            "duration_ms": round((time.time() - started) * 1000, 1),
+            **details
+        }
 
     def update_company_context(self, new_namespace: str):
         """
         Update the company context and reset history if company changes.
         This ensures conversations don't mix between different companies.
+        A re-index only moves the chatbot to a new version of its namespace
+        (acme-01 -> acme-01-v1), which keeps the conversation.
         """
-        if new_namespace != self.current_namespace:
+        # Imported here: namespace_versions depends on modules that import this one
+        from namespace_versions import parse_namespace
+        if new_namespace == self.current_namespace:
+            return
+        if self.current_namespace is None or parse_namespace(new_namespace)[0] != parse_namespace(self.current_namespace)[0]:
             self.reset_conversation()
-            self.current_namespace = new_namespace
+        self.current_namespace = new_namespace
 
-    def format_messages(self, user_message: str, namespace: str = "", context: str = "") -> List[Dict[str, str]]:
+    def format_messages(self, user_message: str, namespace: str = "", context: str = "",
+                        model: str = "gpt-4o", max_completion_tokens: int = None) -> List[Dict[str, str]]:
         """
         Format the conversation into messages for the API call.
         Only includes system prompt at start of conversation.
+        The prompt is packed into the model's token budget by prompt_budget;
+        per-section token counts are kept in last_prompt_tokens.
         """
         # Check if company context has changed
         if namespace:
             self.update_company_context(namespace)
         
         # Track initial question if this is the first interaction
-        if self.is_first_interaction:
-            self.initial_question = user_message
-            self.is_first_interaction = False
+        self.track_initial_question(user_message)
         
-        messages = []
+        self.last_retrieval = {}
         
-        # Always include system prompt first
-        messages.append({"role": "system", "content": self.SYSTEM_PROMPT})
-        
-        # Add context for this specific question if needed
+        # Retrieve ranked context for this specific question if needed
+        context_chunks = []
         if namespace:
-            relevant_context = self.get_relevant_context(user_message, namespace)
-            if relevant_context:
-                messages.append({
-                    "role": "system", 
-                    "content": f"Company Information for this question:\n{relevant_context}"
-                })
+            context_chunks = self.get_relevant_chunks(user_message, namespace)
         elif context:
-            messages.append({
-                "role": "system",
-                "content": f"Company Information for this question:\n{context}"
-            })
+            self.last_retrieval = {"source": "provided"}
+            context_chunks = [{"text": context, "score": 1.0}]
         
-        # Add conversation history
+        # Recent conversation history
         history_messages = [
             msg for msg in self.conversation_history
             if msg["role"] in ["user", "assistant"]
         ][-self.max_history * 2:]  # Keep only recent messages within max_history
-        messages.extend(history_messages)
-            
-        # Add the current user message
-        messages.append({"role": "user", "content": user_message})
         
-        # Log the full prompt
+        # System prompt, context and history packed into the token budget
+        messages, self.last_prompt_tokens = prompt_budget.build_messages(
+            self.SYSTEM_PROMPT,
+            user_message,
+            context_chunks=context_chunks,
+            history=history_messages,
+            model=model,
+            max_completion_tokens=max_completion_tokens
+        )
+        
+        # Queue the prompt for the (sampled) audit log
         self.log_prompt(messages)
 
         return messages
 
+    def track_initial_question(self, user_message: str):
+        """Remember the first question of the conversation for lead generation"""
+        if self.is_first_interaction:
+            self.initial_question = user_message
+            self.is_first_interaction = False
+
     def add_to_history(self, role: str, content: str):
         """
         Add a message to the conversation history with timestamp.
@@ -226,9 +346,11 @@ class ChatPromptHandler:
             self.conversation_history = history_messages[-self.max_history * 2:]
 
     def reset_conversation(self):
-        """Reset the conversation history and generate a new thread ID"""
+        """
+        Reset the conversation history. The thread ID is kept: handlers are
+        keyed by (chatbot_id, thread_id), so it is the visitor's thread.
+        """
         self.conversation_history = []
-        self.thread_id = str(uuid.uuid4())
         self.is_first_interaction = True
         self.initial_question = None
 
@@ -252,15 +374,15 @@ class ChatPromptHandler:
 
     def log_prompt(self, messages: List[Dict[str, str]]):
         """
-        Log the prompt to the terminal and a file for debugging.
-        Includes timestamp for tracking conversation flow.
+        Queue the prompt for the background audit log with the conversation's
+        chatbot, thread and retrieval details. Sampling, rotation and disk
+        writes are handled by prompt_audit off the request thread.
         """
-        prompt_log = json.dumps(messages, indent=2)  # Pretty-print messages
-        
-        # Log to terminal
-        print(f"\n*** Prompt Used for Model Call ***\n{prompt_log}\n")
-        
-        # Log to a file
-        with open("prompt_log.txt", "a") as log_file:
-            log_file.write(f"\n*** Prompt Used at {datetime.now().isoformat()} ***\n")
-            log_file.write(prompt_log + "\n")
\ No newline at end of file
+        prompt_audit.record_prompt(
+            messages,
+            chatbot_id=self.chatbot_id,
+            thread_id=self.thread_id,
+            namespace=self.current_namespace,
+            retrieval=self.last_retrieval,
+            tokens=self.last_prompt_tokens
+        )
@@ -235,6 +235,7 @@ def embed_chat():
             chat_handlers[chatbot_id] = ChatPromptHandler(openai_client, pinecone_client)
             # Reset conversation to ensure system prompt is included
             chat_handlers[chatbot_id].reset_conversation()
+            chat_handlers[chatbot_id].chatbot_id = chatbot_id
 
         handler = chat_handlers[chatbot_id]
         messages = handler.format_messages(user_message, namespace=namespace)
@@ -0,0 +1,166 @@
+import os
+import time
+import threading
+from typing import Dict, Optional
+import vector_replica
+from database import connect_to_db
+
+# How long a loaded profile is trusted before it is re-read from the database.
+# Changes made through this worker invalidate immediately; the TTL bounds how
+# long other workers can serve stale settings.
+PROFILE_TTL_SECONDS = int(os.getenv('CHATBOT_PROFILE_TTL_SECONDS', 60))
+
+# chatbot_id -> {"profile": ChatbotProfile, "expires_at": float}
+profile_cache = {}
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+
+class ChatbotProfile:
+    """
+    Runtime settings needed to answer a chat message, loaded from the
+    companies and chatbot_config tables in a single query.
+    """
+
+    def __init__(self, chatbot_id, namespace, active_status, has_config=False, system_prompt=None,
+                 chat_model=None, temperature=None, max_tokens=None, answer_cache_enabled=None,
+                 knowledge_version=0):
+        self.chatbot_id = chatbot_id
+        self.namespace = namespace
+        self.active_status = active_status
+        self.has_config = has_config
+        self.system_prompt = system_prompt
+        self.chat_model = chat_model
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.answer_cache_enabled = answer_cache_enabled
+        self.knowledge_version = knowledge_version or 0
+
+    def get_model_settings(self) -> Dict:
+        """Model settings from chatbot_config with the same defaults embed_chat has always used"""
+        return {
+            "model": self.chat_model or "gpt-4o",
+            "temperature": float(self.temperature) if self.temperature is not None else 0.7,
+            "max_tokens": int(self.max_tokens) if self.max_tokens is not None else 500
+        }
+
+
+def load_profile(chatbot_id: str) -> Optional[ChatbotProfile]:
+    """
+    Read a chatbot's profile straight from the database
+
+    Returns:
+        ChatbotProfile, or None if the chatbot does not exist
+    """
+    with connect_to_db() as conn:
+        cursor = conn.cursor()
+
+        # Different placeholder based on database type
+        placeholder = '%s' if os.getenv('DB_TYPE', '').lower() == 'postgresql' else '?'
+
+        cursor.execute(f"""
+            SELECT c.pinecone_namespace, c.active_status, cc.chatbot_id,
+                   cc.system_prompt, cc.chat_model, cc.temperature, cc.max_tokens,
+                   cc.answer_cache_enabled, c.knowledge_version
+            FROM companies c
+            LEFT JOIN chatbot_config cc ON cc.chatbot_id = c.chatbot_id
+            WHERE c.chatbot_id = {placeholder}
+        """, (chatbot_id,))
+
+        row = cursor.fetchone()
+
+    if not row:
+        return None
+
+    return ChatbotProfile(
+        chatbot_id=chatbot_id,
+        namespace=row[0],
+        active_status=row[1],
+        has_config=row[2] is not None,
+        system_prompt=row[3],
+        chat_model=row[4],
+        temperature=row[5],
+        max_tokens=row[6],
+        answer_cache_enabled=row[7],
+        knowledge_version=row[8]
+    )
+
+
+def get_profile(chatbot_id: str) -> Optional[ChatbotProfile]:
+    """
+    Get a chatbot's profile, loading it from the database only when it is
+    not cached or its TTL has passed
+
+    Returns:
+        ChatbotProfile, or None if the chatbot does not exist
+    """
+    now = time.time()
+    with _lock:
+        entry = profile_cache.get(chatbot_id)
+        if entry is not None and entry["expires_at"] > now:
+            _stats["hits"] += 1
+            return entry["profile"]
+        _stats["misses"] += 1
+
+    profile = load_profile(chatbot_id)
+
+    # Unknown chatbots are not cached so newly created ones are found right away
+    if profile is not None:
+        with _lock:
+            profile_cache[chatbot_id] = {"profile": profile, "expires_at": now + PROFILE_TTL_SECONDS}
+    return profile
+
+
+def invalidate(chatbot_id: str) -> None:
+    """Forget a chatbot's cached profile after its companies/chatbot_config rows change"""
+    with _lock:
+        if profile_cache.pop(chatbot_id, None) is not None:
+            _stats["invalidations"] += 1
+
+
+def bump_knowledge_version(chatbot_id: str) -> Optional[int]:
+    """
+    Record that a chatbot's knowledge base changed. Workers compare the version
+    in their profile against the one their caches were built with, so answers and
+    vectors cached in other workers stop being served once their profile TTL runs out.
+    Call it after the change reached Pinecone: this host's replica, which the change
+    was mirrored to, is stamped with the new version, other hosts' replicas are not.
+
+    Returns:
+        int: The new version, or None if the chatbot does not exist
+    """
+    with connect_to_db() as conn:
+        cursor = conn.cursor()
+
+        # Different placeholder based on database type
+        placeholder = '%s' if os.getenv('DB_TYPE', '').lower() == 'postgresql' else '?'
+
+        cursor.execute(f"""
+            UPDATE companies
+            SET knowledge_version = COALESCE(knowledge_version, 0) + 1
+            WHERE chatbot_id = {placeholder}
+        """, (chatbot_id,))
+        cursor.execute(f"""
+            SELECT knowledge_version, pinecone_namespace FROM companies WHERE chatbot_id = {placeholder}
+        """, (chatbot_id,))
+        row = cursor.fetchone()
+
+    invalidate(chatbot_id)
+    if not row:
+        return None
+    vector_replica.mark_version(row[1], row[0])
+    return row[0]
+
+
+def get_stats() -> Dict:
+    """Get size and hit/miss counters for the profile cache"""
+    with _lock:
+        lookups = _stats["hits"] + _stats["misses"]
+        return {
+            "profiles": len(profile_cache),
+            "ttl_seconds": PROFILE_TTL_SECONDS,
+            "hits": _stats["hits"],
+            "misses": _stats["misses"],
+            "invalidations": _stats["invalidations"],
+            "hit_rate": _stats["hits"] / lookups if lookups else 0.0
+        }
@@ -0,0 +1,230 @@
+import os
+import sys
+import time
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Tuple
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Defaults can be overridden from the environment
+DEFAULT_MAX_ENTRIES = int(os.getenv('CONVERSATION_STORE_MAX_ENTRIES', 5000))
+DEFAULT_MAX_BYTES = int(os.getenv('CONVERSATION_STORE_MAX_BYTES', 64 * 1024 * 1024))
+DEFAULT_IDLE_TTL_SECONDS = int(os.getenv('CONVERSATION_IDLE_TTL_SECONDS', 30 * 60))
+
+# Rough fixed cost of a handler object and its bookkeeping
+HANDLER_BASE_BYTES = 2048
+
+
+def estimate_handler_size(handler) -> int:
+    """
+    Estimate the memory held by a chat handler's conversation state
+
+    Args:
+        handler: A ChatPromptHandler (or anything with conversation_history)
+
+    Returns:
+        int: Approximate size in bytes
+    """
+    size = HANDLER_BASE_BYTES
+    for message in getattr(handler, "conversation_history", []):
+        for value in message.values():
+            size += sys.getsizeof(value)
+    initial_question = getattr(handler, "initial_question", None)
+    if initial_question:
+        size += sys.getsizeof(initial_question)
+    return size
+
+
+class ConversationStore:
+    """
+    Bounded store of chat handlers keyed by (chatbot_id, thread_id).
+
+    Entries are kept in LRU order. Idle conversations expire after a TTL and
+    the least recently used ones are evicted once the entry count or the
+    memory budget is exceeded. All lookups are O(1).
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES,
+                 idle_ttl_seconds: int = DEFAULT_IDLE_TTL_SECONDS):
+        """Initialize an empty store with the given limits"""
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.idle_ttl_seconds = idle_ttl_seconds
+
+        # key -> {"handler", "size", "last_access"}
+        self._entries: "OrderedDict[Tuple[str, str], Dict]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+        # Counters for get_stats()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, chatbot_id: str, thread_id: str):
+        """
+        Get the handler for a conversation if it exists and has not gone idle
+
+        Returns:
+            The handler, or None if not found
+        """
+        key = (chatbot_id, thread_id)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if now - entry["last_access"] > self.idle_ttl_seconds:
+                self._remove(key)
+                self.expirations += 1
+                return None
+            entry["last_access"] = now
+            self._entries.move_to_end(key)
+            return entry["handler"]
+
+    def get_or_create(self, chatbot_id: str, thread_id: str, factory: Callable[[], object]):
+        """
+        Get the handler for a conversation, creating it with factory() if needed
+
+        Args:
+            chatbot_id: The chatbot this conversation belongs to
+            thread_id: The visitor's thread ID
+            factory: Callable returning a new handler
+
+        Returns:
+            Tuple of (handler, created) where created is True for a new handler
+        """
+        handler = self.get(chatbot_id, thread_id)
+        if handler is not None:
+            with self._lock:
+                self.hits += 1
+            return handler, False
+
+        handler = factory()
+        key = (chatbot_id, thread_id)
+        now = time.time()
+        with self._lock:
+            self.misses += 1
+            # Another request for the same thread may have won the race
+            existing = self._entries.get(key)
+            if existing is not None:
+                existing["last_access"] = now
+                self._entries.move_to_end(key)
+                return existing["handler"], False
+
+            size = estimate_handler_size(handler)
+            self._entries[key] = {"handler": handler, "size": size, "last_access": now}
+            self._total_bytes += size
+            self._enforce_limits(now)
+        return handler, True
+
+    def touch(self, chatbot_id: str, thread_id: str) -> None:
+        """
+        Re-measure a conversation after its history changed and enforce the budget
+        """
+        key = (chatbot_id, thread_id)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            size = estimate_handler_size(entry["handler"])
+            self._total_bytes += size - entry["size"]
+            entry["size"] = size
+            entry["last_access"] = now
+            self._entries.move_to_end(key)
+            self._enforce_limits(now)
+
+    def discard(self, chatbot_id: str, thread_id: str) -> bool:
+        """
+        Drop a single conversation
+
+        Returns:
+            bool: True if the conversation existed
+        """
+        with self._lock:
+            return self._remove((chatbot_id, thread_id))
+
+    def discard_chatbot(self, chatbot_id: str) -> int:
+        """
+        Drop every conversation belonging to a chatbot
+
+        Returns:
+            int: Number of conversations removed
+        """
+        with self._lock:
+            keys = [key for key in self._entries if key[0] == chatbot_id]
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def sweep(self) -> int:
+        """
+        Remove all conversations that have been idle longer than the TTL
+
+        Returns:
+            int: Number of conversations removed
+        """
+        with self._lock:
+            return self._expire_idle(time.time())
+
+    def get_stats(self) -> Dict:
+        """Get occupancy and hit/eviction counters for monitoring"""
+        with self._lock:
+            return {
+                "conversations": len(self._entries),
+                "total_bytes": self._total_bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "idle_ttl_seconds": self.idle_ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
+
+    def __contains__(self, key: Tuple[str, str]) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    # Internal helpers - callers must hold self._lock
+
+    def _remove(self, key: Tuple[str, str]) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        self._total_bytes -= entry["size"]
+        return True
+
+    def _expire_idle(self, now: float) -> int:
+        # Entries are in access order, so stop at the first one still fresh
+        expired = 0
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if now - entry["last_access"] <= self.idle_ttl_seconds:
+                break
+            self._remove(key)
+            expired += 1
+        self.expirations += expired
+        return expired
+
+    def _enforce_limits(self, now: float) -> None:
+        self._expire_idle(now)
+
+        # Evict least recently used until within both limits, but never the newest entry
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes
+        ):
+            key = next(iter(self._entries))
+            self._remove(key)
+            self.evictions += 1
+            logger.info(f"Evicted conversation {key} from store (total bytes: {self._total_bytes})")
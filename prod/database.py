@@ -133,7 +133,8 @@ def upgrade_database(verbose=False):
                     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     scraped_text TEXT,
                     processed_content TEXT,
-                    active_status TEXT DEFAULT 'live'
+                    active_status TEXT DEFAULT 'live',
+                    knowledge_version INTEGER DEFAULT 0
                 )
                 """)
             else:
@@ -155,6 +156,24 @@ def upgrade_database(verbose=False):
                     ADD COLUMN active_status TEXT DEFAULT 'live'
                     """)
                     
+                # Check if knowledge_version column exists
+                cursor.execute(f"""
+                SELECT column_name 
+                FROM information_schema.columns 
+                WHERE table_schema = '{DB_SCHEMA}' 
+                AND table_name = 'companies' 
+                AND column_name = 'knowledge_version'
+                """)
+                
+                if not cursor.fetchone():
+                    # Bumped whenever the knowledge base changes so every worker can tell its caches are stale
+                    if verbose:
+                        print(f"Adding knowledge_version column to existing companies table")
+                    cursor.execute(f"""
+                    ALTER TABLE {DB_SCHEMA}.companies 
+                    ADD COLUMN knowledge_version INTEGER DEFAULT 0
+                    """)
+                    
                 # Check if scraped_text column exists
                 cursor.execute(f"""
                 SELECT column_name 
@@ -383,10 +402,29 @@ def upgrade_database(verbose=False):
                     show_lead_form TEXT DEFAULT 'Yes',
                     webhook_url TEXT DEFAULT NULL,
                     webhook_triggers TEXT DEFAULT NULL,
+                    answer_cache_enabled TEXT DEFAULT 'No',
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
                 """)
+            else:
+                # Check if answer_cache_enabled column exists
+                cursor.execute(f"""
+                SELECT column_name 
+                FROM information_schema.columns 
+                WHERE table_schema = '{DB_SCHEMA}' 
+                AND table_name = 'chatbot_config' 
+                AND column_name = 'answer_cache_enabled'
+                """)
+                
+                if not cursor.fetchone():
+                    # answer_cache_enabled column doesn't exist, so add it
+                    if verbose:
+                        print("Adding answer_cache_enabled column to existing chatbot_config table")
+                    cursor.execute(f"""
+                    ALTER TABLE {DB_SCHEMA}.chatbot_config 
+                    ADD COLUMN answer_cache_enabled TEXT DEFAULT 'No'
+                    """)
             
             # Check if chatbot_incidents table exists
             cursor.execute(f"""
@@ -646,6 +684,45 @@ def upgrade_database(verbose=False):
 
             # --- End of customer_plans table block ---
 
+            # Embeddings already computed, keyed by model and SHA-256 of the chunk text
+            cursor.execute(sql.SQL("""
+            CREATE TABLE IF NOT EXISTS {schema}.embedding_store (
+                model TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                dimension INTEGER NOT NULL,
+                vector BYTEA NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (model, content_hash)
+            )
+            """).format(schema=sql.Identifier(DB_SCHEMA)))
+            if verbose:
+                print(f"Ensured embedding_store table exists in {DB_SCHEMA} schema")
+
+            # What each namespace in Pinecone holds, so syncs upload only what changed
+            cursor.execute(sql.SQL("""
+            CREATE TABLE IF NOT EXISTS {schema}.pinecone_vectors (
+                namespace TEXT NOT NULL,
+                vector_id TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (namespace, vector_id)
+            )
+            """).format(schema=sql.Identifier(DB_SCHEMA)))
+            if verbose:
+                print(f"Ensured pinecone_vectors table exists in {DB_SCHEMA} schema")
+
+            # Namespace versions replaced by a re-index, deleted from Pinecone once delete_after passes
+            cursor.execute(sql.SQL("""
+            CREATE TABLE IF NOT EXISTS {schema}.retired_namespaces (
+                namespace TEXT PRIMARY KEY,
+                chatbot_id TEXT,
+                retired_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                delete_after DOUBLE PRECISION NOT NULL
+            )
+            """).format(schema=sql.Identifier(DB_SCHEMA)))
+            if verbose:
+                print(f"Ensured retired_namespaces table exists in {DB_SCHEMA} schema")
+
         else:
             # SQLite handling
             # Create companies table if not exists
@@ -660,7 +737,8 @@ def upgrade_database(verbose=False):
                 updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
                 scraped_text TEXT,
                 processed_content TEXT,
-                active_status TEXT DEFAULT 'live'
+                active_status TEXT DEFAULT 'live',
+                knowledge_version INTEGER DEFAULT 0
             )
             ''')
             
@@ -672,6 +750,12 @@ def upgrade_database(verbose=False):
                 cursor.execute('ALTER TABLE companies ADD COLUMN active_status TEXT DEFAULT "live"')
                 if verbose:
                     print("Added active_status column to companies table")
+
+            # Bumped whenever the knowledge base changes so every worker can tell its caches are stale
+            if 'knowledge_version' not in columns:
+                cursor.execute('ALTER TABLE companies ADD COLUMN knowledge_version INTEGER DEFAULT 0')
+                if verbose:
+                    print("Added knowledge_version column to companies table")
             
             # Create users table if not exists
             cursor.execute('''
@@ -748,11 +832,21 @@ def upgrade_database(verbose=False):
                 show_lead_form TEXT DEFAULT 'Yes',
                 webhook_url TEXT DEFAULT NULL,
                 webhook_triggers TEXT DEFAULT NULL,
+                answer_cache_enabled TEXT DEFAULT 'No',
                 created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
                 updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
             )
             ''')
             
+            # Check if answer_cache_enabled column exists in chatbot_config table
+            cursor.execute("PRAGMA table_info(chatbot_config)")
+            columns = [column[1] for column in cursor.fetchall()]
+            
+            if 'answer_cache_enabled' not in columns:
+                cursor.execute('ALTER TABLE chatbot_config ADD COLUMN answer_cache_enabled TEXT DEFAULT "No"')
+                if verbose:
+                    print("Added answer_cache_enabled column to chatbot_config table")
+            
             # Create chatbot_incidents table if not exists
             cursor.execute('''
             CREATE TABLE IF NOT EXISTS chatbot_incidents (
@@ -927,6 +1021,45 @@ def upgrade_database(verbose=False):
                 print("Ensured idx_customer_plans_chatbot_id index exists in SQLite")
 
             # --- End of customer_plans table block ---
+
+            # Embeddings already computed, keyed by model and SHA-256 of the chunk text
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS embedding_store (
+                model TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                dimension INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (model, content_hash)
+            )
+            ''')
+            if verbose:
+                print("Ensured embedding_store table exists in SQLite")
+
+            # What each namespace in Pinecone holds, so syncs upload only what changed
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS pinecone_vectors (
+                namespace TEXT NOT NULL,
+                vector_id TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (namespace, vector_id)
+            )
+            ''')
+            if verbose:
+                print("Ensured pinecone_vectors table exists in SQLite")
+
+            # Namespace versions replaced by a re-index, deleted from Pinecone once delete_after passes
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS retired_namespaces (
+                namespace TEXT PRIMARY KEY,
+                chatbot_id TEXT,
+                retired_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                delete_after REAL NOT NULL
+            )
+            ''')
+            if verbose:
+                print("Ensured retired_namespaces table exists in SQLite")
             
             # Check if the old fields exist and migrate data if needed
             try:
@@ -8,6 +8,15 @@ import traceback
 from typing import Dict, Any, List, Optional, Tuple, Union
 from decimal import Decimal, getcontext
 import pytz 
+import answer_cache
+import cache_warmer
+import embedding_service
+import namespace_versions
+import pinecone_sync
+import vector_replica
+import prompt_audit
+import prompt_budget
+from write_behind import WriteBehindQueue
 
 # Set precision for Decimal calculations
 getcontext().prec = 18  # Sufficient precision for cost calculations
@@ -32,8 +41,46 @@ DB_SCHEMA = os.getenv('DB_SCHEMA', 'easychat')
 def init_metrics_blueprint():
     """Initialize the metrics blueprint"""
     print("[db_metrics] Initializing metrics blueprint")
+    chat_message_queue.start()
     return metrics_blueprint
 
+def insert_chat_messages(rows: List[Tuple]) -> None:
+    """
+    Insert a batch of chat message rows in one transaction
+    
+    Args:
+        rows: Tuples of (chatbot_id, thread_id, user_message, assistant_response,
+              prompt_tokens, completion_tokens, total_tokens, ip_address,
+              user_agent, created_at)
+    """
+    with connect_to_db() as conn:
+        cursor = conn.cursor()
+        
+        # Different placeholder style based on database type
+        if DB_TYPE.lower() == 'postgresql':
+            # PostgreSQL uses %s placeholders
+            query = f"""
+                INSERT INTO {DB_SCHEMA}.chat_messages 
+                (chatbot_id, thread_id, user_message, assistant_response, 
+                 prompt_tokens, completion_tokens, total_tokens, ip_address, user_agent, created_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """
+        else:
+            # SQLite uses ? placeholders
+            query = """
+                INSERT INTO chat_messages 
+                (chatbot_id, thread_id, user_message, assistant_response, 
+                 prompt_tokens, completion_tokens, total_tokens, ip_address, user_agent, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """
+        
+        cursor.executemany(query, rows)
+        conn.commit()
+        print(f"[db_metrics] Wrote batch of {len(rows)} chat messages")
+
+# Chat messages are written behind the response in batches
+chat_message_queue = WriteBehindQueue("chat_messages", insert_chat_messages)
+
 def save_chat_message(
     chatbot_id: str, 
     thread_id: str, 
@@ -46,7 +93,8 @@ def save_chat_message(
     user_agent: str = None
 ) -> bool:
     """
-    Save a chat message exchange to the database
+    Queue a chat message exchange for the database. The row is spilled to
+    local disk and inserted by the write-behind queue shortly afterwards.
     
     Args:
         chatbot_id: The ID of the chatbot
@@ -60,50 +108,28 @@ def save_chat_message(
         user_agent: User's browser user agent (optional)
         
     Returns:
-        bool: True if successful, False otherwise
+        bool: True if queued, False otherwise
     """
     try:
-        print(f"[db_metrics] Saving chat message for chatbot {chatbot_id}, thread {thread_id}")
-        with connect_to_db() as conn:
-            cursor = conn.cursor()
-            
-            # Different placeholder style based on database type
-            if DB_TYPE.lower() == 'postgresql':
-                # PostgreSQL uses %s placeholders
-                query = f"""
-                    INSERT INTO {DB_SCHEMA}.chat_messages 
-                    (chatbot_id, thread_id, user_message, assistant_response, 
-                     prompt_tokens, completion_tokens, total_tokens, ip_address, user_agent)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """
-            else:
-                # SQLite uses ? placeholders
-                query = """
-                    INSERT INTO chat_messages 
-                    (chatbot_id, thread_id, user_message, assistant_response, 
-                     prompt_tokens, completion_tokens, total_tokens, ip_address, user_agent)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """
-            
-            # Execute the query with parameters
-            cursor.execute(query, (
-                chatbot_id, 
-                thread_id, 
-                user_message, 
-                assistant_response, 
-                prompt_tokens, 
-                completion_tokens, 
-                total_tokens,
-                ip_address, 
-                user_agent
-            ))
-            
-            conn.commit()
-            print(f"[db_metrics] Chat message saved successfully for {chatbot_id}")
-            return True
+        # Timestamp now, in the same UTC format as CURRENT_TIMESTAMP, so the
+        # row keeps its time even if it is written late or replayed after a crash
+        created_at = datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        chat_message_queue.enqueue((
+            chatbot_id, 
+            thread_id, 
+            user_message, 
+            assistant_response, 
+            prompt_tokens, 
+            completion_tokens, 
+            total_tokens,
+            ip_address, 
+            user_agent,
+            created_at
+        ))
+        return True
             
     except Exception as e:
-        print(f"[db_metrics] Error saving chat message: {str(e)}")
+        print(f"[db_metrics] Error queueing chat message: {str(e)}")
         print(traceback.format_exc())
         return False
 
@@ -1018,6 +1044,141 @@ def get_chatbot_metrics(chatbot_id):
             "message": "Internal server error"
         }), 500
 
+@metrics_blueprint.route('/answer-cache/<chatbot_id>', methods=['GET'])
+def get_answer_cache_metrics(chatbot_id):
+    """API endpoint to get answer cache hit-rate metrics for a chatbot (this worker only)"""
+    try:
+        return jsonify({
+            "status": "success",
+            "data": answer_cache.get_stats(chatbot_id)
+        })
+    except Exception as e:
+        print(f"[db_metrics] Error getting answer cache metrics: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": "Internal server error"
+        }), 500
+
+@metrics_blueprint.route('/prompt-audit', methods=['GET'])
+def get_prompt_audit_metrics():
+    """API endpoint to get prompt audit log sampling and writer counters (this worker only)"""
+    try:
+        return jsonify({
+            "status": "success",
+            "data": prompt_audit.get_stats()
+        })
+    except Exception as e:
+        print(f"[db_metrics] Error getting prompt audit metrics: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": "Internal server error"
+        }), 500
+
+@metrics_blueprint.route('/prompt-tokens', methods=['GET'])
+def get_prompt_token_metrics():
+    """API endpoint to get average prompt tokens per section (system, context, history, user) for this worker"""
+    try:
+        return jsonify({
+            "status": "success",
+            "data": prompt_budget.get_stats()
+        })
+    except Exception as e:
+        print(f"[db_metrics] Error getting prompt token metrics: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": "Internal server error"
+        }), 500
+
+@metrics_blueprint.route('/chat-message-queue', methods=['GET'])
+def get_chat_message_queue_metrics():
+    """API endpoint to get write-behind queue depth and counters for chat messages (this worker only)"""
+    try:
+        return jsonify({
+            "status": "success",
+            "data": chat_message_queue.get_stats()
+        })
+    except Exception as e:
+        print(f"[db_metrics] Error getting chat message queue metrics: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": "Internal server error"
+        }), 500
+
+@metrics_blueprint.route('/cache-warmer', methods=['GET'])
+def get_cache_warmer_metrics():
+    """API endpoint to get widget-load cache warming counters (this worker only)"""
+    try:
+        return jsonify({
+            "status": "success",
+            "data": cache_warmer.get_stats()
+        })
+    except Exception as e:
+        print(f"[db_metrics] Error getting cache warmer metrics: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": "Internal server error"
+        }), 500
+
+@metrics_blueprint.route('/vector-replica', methods=['GET'])
+def get_vector_replica_metrics():
+    """API endpoint to get local replica search and write counters (this worker only)"""
+    try:
+        return jsonify({
+            "status": "success",
+            "data": vector_replica.get_stats()
+        })
+    except Exception as e:
+        print(f"[db_metrics] Error getting vector replica metrics: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": "Internal server error"
+        }), 500
+
+@metrics_blueprint.route('/embeddings', methods=['GET'])
+def get_embedding_metrics():
+    """API endpoint to get batched embedding request and retry counters (this worker only)"""
+    try:
+        return jsonify({
+            "status": "success",
+            "data": embedding_service.get_stats()
+        })
+    except Exception as e:
+        print(f"[db_metrics] Error getting embedding metrics: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": "Internal server error"
+        }), 500
+
+@metrics_blueprint.route('/pinecone-sync', methods=['GET'])
+def get_pinecone_sync_metrics():
+    """API endpoint to get incremental Pinecone sync counters (this worker only)"""
+    try:
+        return jsonify({
+            "status": "success",
+            "data": pinecone_sync.get_stats()
+        })
+    except Exception as e:
+        print(f"[db_metrics] Error getting Pinecone sync metrics: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": "Internal server error"
+        }), 500
+
+@metrics_blueprint.route('/namespace-versions', methods=['GET'])
+def get_namespace_version_metrics():
+    """API endpoint to get namespace swap and garbage collection counters (this worker only)"""
+    try:
+        return jsonify({
+            "status": "success",
+            "data": namespace_versions.get_stats()
+        })
+    except Exception as e:
+        print(f"[db_metrics] Error getting namespace version metrics: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": "Internal server error"
+        }), 500
+
 # Route for getting chatbot threads with time filter
 @metrics_blueprint.route('/chatbot-threads/<chatbot_id>', methods=['GET'])
 def get_chatbot_threads_route(chatbot_id):
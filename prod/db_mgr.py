@@ -5,6 +5,8 @@ from openai import OpenAI
 from pinecone import Pinecone
 import os
 from dotenv import load_dotenv
+import embedding_service
+import pinecone_sync
 
 load_dotenv()
 
@@ -212,14 +214,7 @@ def chunk_text(text, chunk_size=500):
     return chunks
 
 def get_embeddings(text_chunks):
-    embeddings = []
-    for chunk in text_chunks:
-        response = openai_client.embeddings.create(
-            input=chunk,
-            model="text-embedding-ada-002"
-        )
-        embeddings.append(response.data[0].embedding)
-    return embeddings
+    return embedding_service.embed_texts(openai_client, text_chunks, model="text-embedding-ada-002")
 
 def update_pinecone_index(namespace, text_chunks, embeddings):
     try:
@@ -229,6 +224,7 @@ def update_pinecone_index(namespace, text_chunks, embeddings):
             for i, (chunk, embedding) in enumerate(zip(text_chunks, embeddings))
         ]
         index.upsert(vectors=vectors, namespace=namespace)
+        pinecone_sync.record_vectors(namespace, [v[0] for v in vectors], text_chunks)
         return True
     except Exception as e:
         print(f"Error updating Pinecone: {e}")
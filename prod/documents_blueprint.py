@@ -3,6 +3,12 @@ import os
 from datetime import datetime
 import uuid
 import vector_cache
+import answer_cache
+import chatbot_profile
+import namespace_versions
+import cache_warmer
+import pinecone_sync
+import vector_replica
 
 # Import connect_to_db from the database module
 from database import connect_to_db
@@ -384,6 +390,10 @@ def delete_document(doc_id):
                 
                 # Perform batch deletion
                 pinecone_index.delete(ids=vector_ids, namespace=namespace)
+                vector_replica.delete_vectors(namespace, ids=vector_ids)
+                pinecone_sync.forget_vectors(namespace, ids=vector_ids)
+                vector_cache.remove_document_from_cache(namespace, doc_id)
+                cache_warmer.invalidate(namespace)
                 
                 print(f"Deleted {vectors_count} vectors for doc_id {doc_id} in namespace {namespace}")
 
@@ -398,6 +408,10 @@ def delete_document(doc_id):
             else:
                 cursor.execute('DELETE FROM documents WHERE doc_id = ?', (doc_id,))
 
+        # Cached answers may cite the deleted document
+        answer_cache.invalidate(chatbot_id)
+        chatbot_profile.bump_knowledge_version(chatbot_id)
+
         return jsonify({'success': True})
 
     except Exception as e:
@@ -512,8 +526,12 @@ def upload_document():
                     doc_result['content'],
                     doc_result['vectors_count']
                 ))
-                
-            return jsonify({'success': True, 'doc_id': doc_result['doc_id']})
+
+        # New knowledge may change answers to earlier questions
+        answer_cache.invalidate(chatbot_id)
+        chatbot_profile.bump_knowledge_version(chatbot_id)
+
+        return jsonify({'success': True, 'doc_id': doc_result['doc_id']})
     except Exception as e:
         print(f"Error uploading document: {e}")
         return jsonify({'error': str(e)}), 500
@@ -826,68 +844,71 @@ def retrain_agent(chatbot_id):
             namespace = company[0]
             processed_content = company[1]
             
-            # Get all documents for this chatbot
-            if os.getenv('DB_TYPE', '').lower() == 'postgresql':
-                cursor.execute('''
-                    SELECT doc_id, content
-                    FROM documents
-                    WHERE chatbot_id = %s
-                ''', (chatbot_id,))
-            else:
-                cursor.execute('''
-                    SELECT doc_id, content
-                    FROM documents
-                    WHERE chatbot_id = ?
-                ''', (chatbot_id,))
-                
-            documents = cursor.fetchall()
-            
-            # Combine all text content
-            all_content = processed_content if processed_content else ""
-            
-            for doc in documents:
-                if doc[1]:  # If document has content
-                    all_content += "\n\n" + doc[1]
-            
+            # Combine the scraped content with all of the chatbot's documents
+            all_content = _combined_content(cursor, chatbot_id, processed_content)
+
             # Check if there's any content to process
             if not all_content.strip():
                 return jsonify({'error': 'No content available for retraining'}), 400
-                
-            # Chunk the content and create embeddings
-            chunks = documents_handler.chunk_text(all_content)
-            embeddings = documents_handler.get_embeddings(chunks)
-            
-            # Update Pinecone
-            index = pinecone_client.Index(PINECONE_INDEX)
-            
-            # First delete all existing vectors
-            try:
-                index.delete(delete_all=True, namespace=namespace)
-            except Exception as e:
-                print(f"Warning: Error clearing vectors from namespace {namespace}: {e}")
-            
-            # Upload new vectors
-            vectors = []
-            
-            # Add vectors for the main content
-            for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-                vectors.append((
-                    f"{namespace}-{i}",
-                    embedding,
-                    {"text": chunk}
-                ))
-            
-            # Upsert vectors in batches of 100
-            batch_size = 100
-            for i in range(0, len(vectors), batch_size):
-                batch = vectors[i:i+batch_size]
-                index.upsert(vectors=batch, namespace=namespace)
-            
-            return jsonify({'success': True, 'vectors_count': len(vectors)})
+
+        # Chunk the content and create embeddings
+        chunks = documents_handler.chunk_text(all_content)
+        embeddings = documents_handler.get_embeddings(chunks)
+
+        def content_unchanged():
+            # A document uploaded or deleted during the build would be missing from, or linger in, the new version
+            with connect_to_db() as conn:
+                cursor = conn.cursor()
+                if os.getenv('DB_TYPE', '').lower() == 'postgresql':
+                    cursor.execute('SELECT processed_content FROM companies WHERE chatbot_id = %s', (chatbot_id,))
+                else:
+                    cursor.execute('SELECT processed_content FROM companies WHERE chatbot_id = ?', (chatbot_id,))
+                row = cursor.fetchone()
+                return row is not None and _combined_content(cursor, chatbot_id, row[0]) == all_content
+
+        # Build the new knowledge base in the next namespace version while chat keeps using
+        # the current one, then switch the chatbot over; the old version is deleted after a grace period
+        index = pinecone_client.Index(PINECONE_INDEX)
+        result = namespace_versions.reindex(index, chatbot_id, namespace, chunks, embeddings,
+                                            is_current=content_unchanged)
+        if result is None:
+            return jsonify({'error': 'The chatbot changed while retraining, please try again'}), 409
+
+        return jsonify({
+            'success': True,
+            'vectors_count': len(chunks),
+            'namespace': result['namespace'],
+            'added': result['added'],
+            'updated': result['updated'],
+            'removed': result['removed']
+        })
     except Exception as e:
         print(f"Error retraining agent: {e}")
         return jsonify({'error': str(e)}), 500
 
+def _combined_content(cursor, chatbot_id, processed_content):
+    """The text a retrain indexes: the scraped content followed by each document's content"""
+    if os.getenv('DB_TYPE', '').lower() == 'postgresql':
+        cursor.execute('''
+            SELECT doc_id, content
+            FROM documents
+            WHERE chatbot_id = %s
+            ORDER BY doc_id
+        ''', (chatbot_id,))
+    else:
+        cursor.execute('''
+            SELECT doc_id, content
+            FROM documents
+            WHERE chatbot_id = ?
+            ORDER BY doc_id
+        ''', (chatbot_id,))
+
+    all_content = processed_content if processed_content else ""
+    for doc in cursor.fetchall():
+        if doc[1]:  # If document has content
+            all_content += "\n\n" + doc[1]
+    return all_content
+
 # This function initializes the blueprint with the OpenAI and Pinecone clients
 def init_documents_blueprint(app_openai_client, app_pinecone_client, app_pinecone_index):
     global openai_client, pinecone_client, PINECONE_INDEX, documents_handler
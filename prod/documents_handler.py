@@ -4,6 +4,11 @@ import docx
 import io
 from datetime import datetime
 import PyPDF2
+import cache_warmer
+import embedding_service
+import pinecone_sync
+import vector_cache
+import vector_replica
 
 class DocumentsHandler:
     """
@@ -60,6 +65,10 @@ class DocumentsHandler:
             doc_id=doc_id
         )
         
+        # Serve the new chunks locally while Pinecone finishes indexing them
+        if vectors_count:
+            vector_cache.add_document_to_cache(namespace, doc_id, embeddings, chunks)
+        
         return {
             "doc_id": doc_id,
             "doc_name": filename,
@@ -243,15 +252,8 @@ class DocumentsHandler:
         return chunks
     
     def get_embeddings(self, text_chunks):
-        """Get embeddings for text chunks using OpenAI"""
-        embeddings = []
-        for chunk in text_chunks:
-            response = self.openai_client.embeddings.create(
-                input=chunk,
-                model="text-embedding-ada-002"
-            )
-            embeddings.append(response.data[0].embedding)
-        return embeddings
+        """Get embeddings for text chunks using OpenAI, in batched concurrent requests"""
+        return embedding_service.embed_texts(self.openai_client, text_chunks, model="text-embedding-ada-002")
     
     def upload_to_pinecone(self, namespace, text_chunks, embeddings, doc_id=None):
         """Upload vectors to Pinecone with document metadata"""
@@ -276,6 +278,14 @@ class DocumentsHandler:
                 batch = vectors[i:i+batch_size]
                 index.upsert(vectors=batch, namespace=namespace)
             
+            vector_replica.upsert(
+                namespace, [v[0] for v in vectors], embeddings, text_chunks, doc_ids=[doc_id] * len(vectors)
+            )
+            pinecone_sync.record_vectors(namespace, [v[0] for v in vectors], text_chunks)
+            
+            # Warmed vectors no longer include this document
+            cache_warmer.invalidate(namespace)
+            
             return len(vectors)
         except Exception as e:
             print(f"Error in Pinecone upload: {e}")
@@ -297,6 +307,11 @@ class DocumentsHandler:
                 filter=filter_obj
             )
             
+            vector_replica.delete_vectors(namespace, doc_id=doc_id)
+            pinecone_sync.forget_vectors(namespace, prefix=f"{namespace}-{doc_id}-")
+            vector_cache.remove_document_from_cache(namespace, doc_id)
+            cache_warmer.invalidate(namespace)
+            
             return True
         except Exception as e:
             print(f"Error deleting document vectors: {e}")
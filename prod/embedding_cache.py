@@ -0,0 +1,149 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Tuple
+import numpy as np
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Embedding model used for chat queries
+DEFAULT_EMBEDDING_MODEL = "text-embedding-ada-002"
+
+# Maximum number of query embeddings kept in memory (1536 float32 values = 6 KB each)
+MAX_ENTRIES = int(os.getenv('QUERY_EMBEDDING_CACHE_SIZE', 10000))
+
+# Process-wide LRU cache: (model, normalized query) -> float32 vector
+_cache: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+_whitespace_re = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """
+    Normalize query text so trivially different phrasings share a cache entry
+
+    Args:
+        text: The raw user query
+
+    Returns:
+        str: Lowercased text with collapsed whitespace
+    """
+    return _whitespace_re.sub(" ", text or "").strip().lower()
+
+
+def get_cached_embedding(text: str, model: str = DEFAULT_EMBEDDING_MODEL):
+    """
+    Look up a query embedding without calling the API
+
+    Returns:
+        np.ndarray (float32) or None if not cached
+    """
+    key = (model, normalize_query(text))
+    with _lock:
+        vector = _cache.get(key)
+        if vector is None:
+            return None
+        _cache.move_to_end(key)
+        return vector
+
+
+def put_embedding(text: str, embedding, model: str = DEFAULT_EMBEDDING_MODEL) -> np.ndarray:
+    """
+    Store a query embedding, evicting the least recently used entries past the cap
+
+    Returns:
+        np.ndarray: The stored read-only float32 vector
+    """
+    vector = np.asarray(embedding, dtype=np.float32)
+    vector.setflags(write=False)
+    key = (model, normalize_query(text))
+    with _lock:
+        _cache[key] = vector
+        _cache.move_to_end(key)
+        while len(_cache) > MAX_ENTRIES:
+            _cache.popitem(last=False)
+            _stats["evictions"] += 1
+    return vector
+
+
+def get_query_embedding(openai_client, text: str, model: str = DEFAULT_EMBEDDING_MODEL) -> np.ndarray:
+    """
+    Get the embedding for a chat query, calling the embeddings API only on a cache miss
+
+    Args:
+        openai_client: OpenAI client used on a miss
+        text: The user query
+        model: Embedding model name
+
+    Returns:
+        np.ndarray: Read-only float32 embedding vector
+    """
+    vector = get_cached_embedding(text, model)
+    if vector is not None:
+        with _lock:
+            _stats["hits"] += 1
+        return vector
+
+    with _lock:
+        _stats["misses"] += 1
+
+    embedding = openai_client.embeddings.create(
+        input=text,
+        model=model
+    ).data[0].embedding
+    return put_embedding(text, embedding, model)
+
+
+async def get_query_embedding_async(async_openai_client, text: str, model: str = DEFAULT_EMBEDDING_MODEL) -> np.ndarray:
+    """
+    Async variant of get_query_embedding for the ASGI chat pipeline; shares the same cache
+
+    Args:
+        async_openai_client: AsyncOpenAI client used on a miss
+        text: The user query
+        model: Embedding model name
+
+    Returns:
+        np.ndarray: Read-only float32 embedding vector
+    """
+    vector = get_cached_embedding(text, model)
+    if vector is not None:
+        with _lock:
+            _stats["hits"] += 1
+        return vector
+
+    with _lock:
+        _stats["misses"] += 1
+
+    response = await async_openai_client.embeddings.create(
+        input=text,
+        model=model
+    )
+    return put_embedding(text, response.data[0].embedding, model)
+
+
+def get_cache_stats() -> Dict:
+    """Get size and hit/miss counters for the query embedding cache"""
+    with _lock:
+        lookups = _stats["hits"] + _stats["misses"]
+        return {
+            "entries": len(_cache),
+            "max_entries": MAX_ENTRIES,
+            "bytes": sum(vector.nbytes for vector in _cache.values()),
+            "hits": _stats["hits"],
+            "misses": _stats["misses"],
+            "evictions": _stats["evictions"],
+            "hit_rate": _stats["hits"] / lookups if lookups else 0.0
+        }
+
+
+def clear_cache() -> None:
+    """Drop every cached query embedding"""
+    with _lock:
+        _cache.clear()
@@ -0,0 +1,169 @@
+import os
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+import logging
+
+import embedding_store
+from prompt_budget import count_tokens
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_EMBEDDING_MODEL = "text-embedding-ada-002"
+
+# One request carries at most this many inputs and tokens (the API allows 2048 inputs
+# and 8191 tokens per input; keeping batches well under its request limits avoids 400s)
+MAX_BATCH_INPUTS = int(os.getenv('EMBEDDING_BATCH_MAX_INPUTS', 256))
+MAX_BATCH_TOKENS = int(os.getenv('EMBEDDING_BATCH_MAX_TOKENS', 60000))
+
+# Embedding requests in flight at once across the whole process, whoever asked for them
+MAX_CONCURRENT_REQUESTS = int(os.getenv('EMBEDDING_CONCURRENCY', 4))
+
+# Retries of a batch on 429, 5xx and connection errors, with exponential backoff from BACKOFF_SECONDS
+MAX_RETRIES = int(os.getenv('EMBEDDING_MAX_RETRIES', 5))
+BACKOFF_SECONDS = float(os.getenv('EMBEDDING_BACKOFF_SECONDS', 1.0))
+MAX_BACKOFF_SECONDS = 30.0
+
+_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS, thread_name_prefix="embeddings")
+_stats_lock = threading.Lock()
+_stats = {"texts": 0, "reused": 0, "requests": 0, "retries": 0, "failures": 0, "tokens": 0}
+
+
+def embed_texts(openai_client, texts: List[str], model: str = DEFAULT_EMBEDDING_MODEL) -> List[List[float]]:
+    """
+    Embed many texts with as few API requests as possible
+
+    Texts whose embedding is already in the embedding store (same model,
+    byte-identical text) are not sent again, and repeated texts are sent once.
+    The rest are grouped into batches by input count and token count, and the
+    batches are sent concurrently on the shared embedding pool. Results come
+    back in the order of texts.
+
+    Args:
+        openai_client: OpenAI client
+        texts: Texts to embed (e.g. the chunks of a page or document)
+        model: Embedding model name
+
+    Returns:
+        List of embedding vectors, one per text
+
+    Raises:
+        Exception: The API error of a batch that still failed after MAX_RETRIES retries
+    """
+    if not texts:
+        return []
+
+    started = time.time()
+    hashes = [embedding_store.content_hash(text) for text in texts]
+    known = {row_hash: vector.tolist() for row_hash, vector in embedding_store.lookup_many(model, hashes).items()}
+
+    # One API input per distinct text the store doesn't have
+    missing = {}
+    for text, row_hash in zip(texts, hashes):
+        if row_hash not in known and row_hash not in missing:
+            missing[row_hash] = text
+    missing_hashes = list(missing)
+    missing_texts = list(missing.values())
+
+    batches = make_batches(missing_texts, model)
+    futures = [
+        _executor.submit(_embed_batch, openai_client, [missing_texts[i] for i in batch], model)
+        for batch in batches
+    ]
+    fresh = [None] * len(missing_texts)
+    for batch, future in zip(batches, futures):
+        for position, embedding in zip(batch, future.result()):
+            fresh[position] = embedding
+
+    embedding_store.store_many(model, missing_hashes, fresh)
+    known.update(zip(missing_hashes, fresh))
+    embeddings = [known[row_hash] for row_hash in hashes]
+
+    with _stats_lock:
+        _stats["texts"] += len(texts)
+        _stats["reused"] += len(texts) - len(missing_texts)
+    logger.info(f"[embedding_service] Embedded {len(texts)} texts: {len(texts) - len(missing_texts)} reused, "
+                f"{len(missing_texts)} sent in {len(batches)} requests ({time.time() - started:.2f}s)")
+    return embeddings
+
+
+def make_batches(texts: List[str], model: str = DEFAULT_EMBEDDING_MODEL) -> List[List[int]]:
+    """
+    Group text positions into request batches, keeping each under the input and token limits
+
+    Returns:
+        List of batches, each a list of positions into texts, in order
+    """
+    batches, batch, batch_tokens = [], [], 0
+    for position, text in enumerate(texts):
+        tokens = count_tokens(text, model)
+        if batch and (len(batch) >= MAX_BATCH_INPUTS or batch_tokens + tokens > MAX_BATCH_TOKENS):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(position)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def get_stats() -> Dict:
+    """Get request, retry, failure and embedding store counters for this worker"""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats.update({
+        "store": embedding_store.get_stats(),
+        "max_batch_inputs": MAX_BATCH_INPUTS,
+        "max_batch_tokens": MAX_BATCH_TOKENS,
+        "max_concurrent_requests": MAX_CONCURRENT_REQUESTS
+    })
+    return stats
+
+
+def _embed_batch(openai_client, texts: List[str], model: str) -> List[List[float]]:
+    """Send one batch, retrying rate limits and server errors with backoff"""
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            response = openai_client.embeddings.create(input=texts, model=model)
+            with _stats_lock:
+                _stats["requests"] += 1
+                usage = getattr(response, "usage", None)
+                _stats["tokens"] += getattr(usage, "total_tokens", 0) or 0
+            # The API tags each result with its input position; don't rely on response order
+            return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+        except Exception as e:
+            if attempt == MAX_RETRIES or not _is_retryable(e):
+                with _stats_lock:
+                    _stats["failures"] += 1
+                logger.error(f"[embedding_service] Batch of {len(texts)} texts failed: {e}")
+                raise
+            delay = _retry_delay(e, attempt)
+            with _stats_lock:
+                _stats["retries"] += 1
+            logger.warning(f"[embedding_service] Retrying batch of {len(texts)} texts in {delay:.1f}s: {e}")
+            time.sleep(delay)
+
+
+def _is_retryable(error: Exception) -> bool:
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    # openai.APIConnectionError and APITimeoutError carry no status code
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError")
+
+
+def _retry_delay(error: Exception, attempt: int) -> float:
+    # Honour the server's Retry-After when it sends one
+    response = getattr(error, "response", None)
+    retry_after = getattr(response, "headers", {}).get("retry-after") if response is not None else None
+    try:
+        if retry_after is not None:
+            return min(float(retry_after), MAX_BACKOFF_SECONDS)
+    except ValueError:
+        pass
+    # Full jitter keeps concurrent batches from retrying in lockstep
+    return random.uniform(0, min(BACKOFF_SECONDS * 2 ** attempt, MAX_BACKOFF_SECONDS))
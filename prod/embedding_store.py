@@ -0,0 +1,123 @@
+import os
+import hashlib
+import threading
+from typing import Dict, Iterable, List
+import numpy as np
+import logging
+
+from database import connect_to_db
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Look up chunk embeddings in the embedding_store table before calling the API
+ENABLED = os.getenv('EMBEDDING_STORE_ENABLED', 'true').lower() == 'true'
+
+# Hashes per SELECT/INSERT statement (SQLite allows 999 bound parameters in older builds)
+LOOKUP_BATCH_SIZE = 500
+
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "stored": 0, "errors": 0}
+
+
+def content_hash(text: str) -> str:
+    """SHA-256 of the exact chunk text, the store's content address"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def lookup_many(model: str, hashes: Iterable[str]) -> Dict[str, np.ndarray]:
+    """
+    Get stored embeddings for content hashes
+
+    Args:
+        model: Embedding model name
+        hashes: Content hashes from content_hash()
+
+    Returns:
+        dict of content hash -> float32 vector, for the hashes that are stored.
+        Empty if the store is disabled or the database can't be read.
+    """
+    hashes = list(dict.fromkeys(hashes))
+    if not ENABLED or not hashes:
+        return {}
+
+    found = {}
+    try:
+        with connect_to_db() as conn:
+            cursor = conn.cursor()
+            placeholder = '%s' if os.getenv('DB_TYPE', '').lower() == 'postgresql' else '?'
+            for start in range(0, len(hashes), LOOKUP_BATCH_SIZE):
+                batch = hashes[start:start + LOOKUP_BATCH_SIZE]
+                cursor.execute(
+                    f"SELECT content_hash, vector FROM embedding_store "
+                    f"WHERE model = {placeholder} AND content_hash IN ({', '.join([placeholder] * len(batch))})",
+                    (model, *batch)
+                )
+                for row_hash, blob in cursor.fetchall():
+                    # BYTEA comes back as a memoryview, BLOB as bytes
+                    found[row_hash] = np.frombuffer(bytes(blob), dtype=np.float32)
+    except Exception as e:
+        # The store only saves work; never fail ingestion because of it
+        logger.error(f"[embedding_store] Lookup failed, embedding every chunk: {e}")
+        with _stats_lock:
+            _stats["errors"] += 1
+        return {}
+
+    with _stats_lock:
+        _stats["hits"] += len(found)
+        _stats["misses"] += len(hashes) - len(found)
+    return found
+
+
+def store_many(model: str, hashes: List[str], embeddings: List) -> None:
+    """
+    Save embeddings under their content hashes; hashes already stored are left as they are
+
+    Args:
+        model: Embedding model name
+        hashes: Content hashes from content_hash()
+        embeddings: One embedding vector per hash
+    """
+    if not ENABLED or not hashes:
+        return
+
+    rows = []
+    for row_hash, embedding in zip(hashes, embeddings):
+        vector = np.asarray(embedding, dtype=np.float32)
+        rows.append((model, row_hash, int(vector.shape[0]), vector.tobytes()))
+
+    try:
+        with connect_to_db() as conn:
+            cursor = conn.cursor()
+            if os.getenv('DB_TYPE', '').lower() == 'postgresql':
+                query = '''
+                    INSERT INTO embedding_store (model, content_hash, dimension, vector)
+                    VALUES (%s, %s, %s, %s)
+                    ON CONFLICT (model, content_hash) DO NOTHING
+                '''
+            else:
+                query = '''
+                    INSERT OR IGNORE INTO embedding_store (model, content_hash, dimension, vector)
+                    VALUES (?, ?, ?, ?)
+                '''
+            for start in range(0, len(rows), LOOKUP_BATCH_SIZE):
+                cursor.executemany(query, rows[start:start + LOOKUP_BATCH_SIZE])
+    except Exception as e:
+        logger.error(f"[embedding_store] Could not save {len(rows)} embeddings: {e}")
+        with _stats_lock:
+            _stats["errors"] += 1
+        return
+
+    with _stats_lock:
+        _stats["stored"] += len(rows)
+
+
+def get_stats() -> Dict:
+    """Get hit, miss and write counters for this worker"""
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+    stats["enabled"] = ENABLED
+    return stats
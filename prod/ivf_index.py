@@ -0,0 +1,182 @@
+import os
+from typing import Tuple
+import numpy as np
+import logging
+
+from vector_cache import top_k_indices
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Inverted lists per index; 0 picks about 4 * sqrt(rows)
+DEFAULT_N_LISTS = int(os.getenv('IVF_N_LISTS', 0))
+
+# Lists searched per query: more lists means higher recall and slower queries
+DEFAULT_N_PROBE = int(os.getenv('IVF_N_PROBE', 8))
+
+# k-means iterations, and training rows sampled per list (capped in total to bound training time)
+KMEANS_ITERATIONS = int(os.getenv('IVF_KMEANS_ITERATIONS', 10))
+TRAINING_ROWS_PER_LIST = int(os.getenv('IVF_TRAINING_ROWS_PER_LIST', 64))
+MAX_TRAINING_ROWS = int(os.getenv('IVF_MAX_TRAINING_ROWS', 20000))
+
+# Rows assigned per matrix product while training and inserting, to bound temporary memory
+ASSIGN_BATCH_ROWS = 4096
+
+
+class IVFIndex:
+    """
+    Inverted-file approximate nearest-neighbour index over a matrix of
+    unit-length float32 vectors that is stored elsewhere.
+
+    Rows are grouped around k-means centroids. A query scores the centroids,
+    then scores exactly only the rows of the n_probe closest lists, so the
+    work per query is a small fraction of the matrix. The index itself is
+    just the centroids plus one list number per row, which keeps it aligned
+    with the matrix as rows are appended, overwritten or deleted.
+    """
+
+    def __init__(self, centroids: np.ndarray, assignments: np.ndarray, trained_rows: int):
+        """
+        Args:
+            centroids: Unit-length centroid vectors, one per list
+            assignments: List number of each matrix row
+            trained_rows: Number of rows the centroids were trained on
+        """
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.assignments = np.asarray(assignments, dtype=np.int32)
+        self.trained_rows = int(trained_rows)
+        self._lists = None
+
+    @property
+    def n_lists(self) -> int:
+        return len(self.centroids)
+
+    @classmethod
+    def train(cls, matrix: np.ndarray, n_lists: int = None, iterations: int = KMEANS_ITERATIONS,
+              seed: int = 0) -> "IVFIndex":
+        """
+        Train centroids with spherical k-means and assign every row
+
+        Args:
+            matrix: Unit-length float32 vectors, one row per chunk
+            n_lists: Number of inverted lists (default about 4 * sqrt(rows))
+            iterations: k-means iterations
+            seed: Random seed for sampling and initialization
+
+        Returns:
+            IVFIndex covering every row of the matrix
+        """
+        rows = len(matrix)
+        if rows == 0:
+            raise ValueError("Cannot train an IVF index on an empty matrix")
+        n_lists = n_lists or DEFAULT_N_LISTS or int(4 * np.sqrt(rows))
+        n_lists = max(1, min(n_lists, rows))
+
+        rng = np.random.default_rng(seed)
+        sample_size = min(rows, max(n_lists, min(n_lists * TRAINING_ROWS_PER_LIST, MAX_TRAINING_ROWS)))
+        sample = matrix[np.sort(rng.choice(rows, size=sample_size, replace=False))]
+
+        centroids = np.array(sample[rng.choice(sample_size, size=n_lists, replace=False)], dtype=np.float32)
+        for _ in range(iterations):
+            labels = _nearest(centroids, sample)
+            counts = np.bincount(labels, minlength=n_lists)
+
+            # Sum each list's rows: sort by list, then add up each contiguous run
+            order = np.argsort(labels, kind="stable")
+            sorted_labels = labels[order]
+            starts = np.flatnonzero(np.r_[True, sorted_labels[1:] != sorted_labels[:-1]])
+            sums = np.zeros_like(centroids)
+            sums[sorted_labels[starts]] = np.add.reduceat(sample[order], starts, axis=0)
+
+            # Restart empty lists from random rows so every list stays in use
+            empty = np.flatnonzero(counts == 0)
+            if len(empty):
+                sums[empty] = sample[rng.choice(sample_size, size=len(empty), replace=False)]
+
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            centroids = sums / norms
+
+        index = cls(centroids, _nearest(centroids, matrix), trained_rows=rows)
+        logger.info(f"[ivf_index] Trained {n_lists} lists on {sample_size} of {rows} rows")
+        return index
+
+    def assign(self, vectors: np.ndarray) -> np.ndarray:
+        """Get the list number each vector belongs to"""
+        return _nearest(self.centroids, vectors)
+
+    def add(self, vectors: np.ndarray) -> None:
+        """Index rows appended to the end of the matrix"""
+        if len(vectors):
+            self.assignments = np.concatenate([self.assignments, self.assign(vectors)])
+            self._lists = None
+
+    def update(self, rows: np.ndarray, vectors: np.ndarray) -> None:
+        """Re-index rows whose vectors were overwritten in place"""
+        if len(rows):
+            self.assignments[rows] = self.assign(vectors)
+            self._lists = None
+
+    def keep(self, rows: np.ndarray) -> None:
+        """Keep only these rows, in this order (mirrors compacting the matrix after deletes)"""
+        self.assignments = self.assignments[rows]
+        self._lists = None
+
+    def needs_retraining(self, factor: float = 4.0) -> bool:
+        """True once the matrix has grown well past what the centroids were trained on"""
+        return len(self.assignments) > self.trained_rows * factor
+
+    def search(self, matrix: np.ndarray, query: np.ndarray, top_k: int,
+               n_probe: int = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the approximate top_k rows for a unit-length query
+
+        Args:
+            matrix: The matrix this index covers
+            query: Unit-length query vector
+            top_k: Number of rows to return
+            n_probe: Lists to search (default IVF_N_PROBE)
+
+        Returns:
+            Tuple of (row indices, scores), best first
+        """
+        n_probe = max(1, min(n_probe or DEFAULT_N_PROBE, self.n_lists))
+        order, offsets = self._inverted_lists()
+        probes = top_k_indices(self.centroids @ query, n_probe)
+        candidates = np.concatenate([order[offsets[probe]:offsets[probe + 1]] for probe in probes])
+        if len(candidates) == 0:
+            return candidates, np.empty(0, dtype=np.float32)
+
+        scores = matrix[candidates] @ query
+        best = top_k_indices(scores, top_k)
+        return candidates[best], scores[best]
+
+    def save(self, file) -> None:
+        """Write the index to a path or binary file object"""
+        np.savez(file, centroids=self.centroids, assignments=self.assignments,
+                 trained_rows=np.array(self.trained_rows))
+
+    @classmethod
+    def load(cls, path: str) -> "IVFIndex":
+        """Read an index written by save()"""
+        with np.load(path) as data:
+            return cls(data["centroids"], data["assignments"], int(data["trained_rows"]))
+
+    def _inverted_lists(self) -> Tuple[np.ndarray, np.ndarray]:
+        # Rows sorted by list, plus where each list starts; rebuilt after any change
+        if self._lists is None:
+            order = np.argsort(self.assignments, kind="stable")
+            counts = np.bincount(self.assignments, minlength=self.n_lists)
+            offsets = np.concatenate([[0], np.cumsum(counts)])
+            self._lists = (order, offsets)
+        return self._lists
+
+
+def _nearest(centroids: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+    """List number of the closest centroid for each vector, in batches"""
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), ASSIGN_BATCH_ROWS):
+        batch = vectors[start:start + ASSIGN_BATCH_ROWS]
+        labels[start:start + len(batch)] = np.argmax(batch @ centroids.T, axis=1)
+    return labels
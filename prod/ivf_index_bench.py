@@ -0,0 +1,97 @@
+"""
+IVF Index Benchmark
+Reports recall@k and per-query latency of the IVF approximate index against
+exact brute-force search, for several n_probe settings.
+
+Embeddings of a real catalog are clustered, so the benchmark draws vectors
+around random topic centres rather than uniformly (uniform random vectors
+have no neighbourhood structure for any ANN index to exploit).
+
+Run from the prod directory:
+    python ivf_index_bench.py [--rows 10000 50000] [--top-k 10]
+"""
+
+import time
+import argparse
+import statistics
+import numpy as np
+
+import vector_cache
+from ivf_index import IVFIndex
+
+N_PROBES = [1, 2, 4, 8, 16, 32]
+
+
+def clustered_vectors(rng, rows, dimension, topics, spread=0.35):
+    """Unit vectors scattered around random topic centres"""
+    centres = rng.standard_normal((topics, dimension)).astype(np.float32)
+    centres /= np.linalg.norm(centres, axis=1, keepdims=True)
+    labels = rng.integers(0, topics, size=rows)
+    noise = rng.standard_normal((rows, dimension)).astype(np.float32) * spread / np.sqrt(dimension)
+    return vector_cache.prepare_vectors(centres[labels] + noise)
+
+
+def median_ms(search, queries):
+    samples = []
+    for query in queries:
+        started = time.perf_counter()
+        search(query)
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark IVF recall and latency against exact search")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 50000], help="Matrix sizes to test")
+    parser.add_argument("--dimension", type=int, default=1536, help="Embedding dimension (ada-002 is 1536)")
+    parser.add_argument("--top-k", type=int, default=10, help="k for recall@k")
+    parser.add_argument("--queries", type=int, default=200, help="Queries per setting")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    for rows in args.rows:
+        matrix = clustered_vectors(rng, rows, args.dimension, topics=max(10, rows // 200))
+        # Queries are perturbed copies of stored chunks, like questions about the catalog
+        picks = rng.choice(rows, size=args.queries, replace=False)
+        queries = [
+            vector_cache.normalize_query(matrix[i] + rng.standard_normal(args.dimension).astype(np.float32) * 0.02)
+            for i in picks
+        ]
+
+        started = time.perf_counter()
+        index = IVFIndex.train(matrix)
+        train_seconds = time.perf_counter() - started
+
+        exact = [set(vector_cache.top_k_indices(matrix @ q, args.top_k)) for q in queries]
+        exact_ms = median_ms(lambda q: vector_cache.top_k_indices(matrix @ q, args.top_k), queries)
+
+        print(f"\nrows={rows} dimension={args.dimension} lists={index.n_lists} "
+              f"train={train_seconds:.1f}s exact={exact_ms:.3f} ms/query")
+        print(f"{'n_probe':>8} {'recall@' + str(args.top_k):>10} {'ms/query':>10} {'speedup':>8}")
+        for n_probe in N_PROBES:
+            if n_probe > index.n_lists:
+                break
+            found = [set(index.search(matrix, q, args.top_k, n_probe=n_probe)[0]) for q in queries]
+            recall = sum(len(f & e) for f, e in zip(found, exact)) / (len(queries) * args.top_k)
+            ann_ms = median_ms(lambda q: index.search(matrix, q, args.top_k, n_probe=n_probe), queries)
+            print(f"{n_probe:>8} {recall:>10.3f} {ann_ms:>10.3f} {exact_ms / ann_ms:>7.1f}x")
+
+        # Incremental maintenance keeps the index aligned with the matrix
+        extra = clustered_vectors(rng, rows // 10, args.dimension, topics=max(10, rows // 200))
+        started = time.perf_counter()
+        index.add(extra)
+        grown = np.concatenate([matrix, extra])
+        keep = np.flatnonzero(rng.random(len(grown)) > 0.1)
+        index.keep(keep)
+        grown = grown[keep]
+        maintain_ms = (time.perf_counter() - started) * 1000
+        exact = [set(vector_cache.top_k_indices(grown @ q, args.top_k)) for q in queries]
+        found = [set(index.search(grown, q, args.top_k)[0]) for q in queries]
+        recall = sum(len(f & e) for f, e in zip(found, exact)) / (len(queries) * args.top_k)
+        deleted = rows + len(extra) - len(keep)
+        print(f"after +{len(extra)} inserts / -{deleted} deletes ({maintain_ms:.0f} ms): "
+              f"recall@{args.top_k}={recall:.3f} at default n_probe")
+
+
+if __name__ == "__main__":
+    main()
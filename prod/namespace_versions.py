@@ -0,0 +1,324 @@
+import os
+import re
+import time
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+import logging
+
+import answer_cache
+import cache_warmer
+import chatbot_profile
+import pinecone_sync
+import vector_cache
+import vector_replica
+from chat_handler import get_index_handle
+from database import connect_to_db
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# How long a replaced namespace version stays in Pinecone after the swap. Other
+# workers keep reading it until their cached chatbot profile expires, so it is
+# never shorter than twice the profile TTL.
+GRACE_SECONDS = max(int(os.getenv('NAMESPACE_GC_GRACE_SECONDS', 900)),
+                    2 * chatbot_profile.PROFILE_TTL_SECONDS)
+
+# How often each worker looks for retired versions whose grace period has passed
+GC_INTERVAL_SECONDS = int(os.getenv('NAMESPACE_GC_INTERVAL_SECONDS', 300))
+
+# "<base>-NN" is version 0; re-indexing it produces "<base>-NN-v1", then "-v2", ...
+_VERSION_SUFFIX = re.compile(r"^(?P<base>.+?)-v(?P<version>\d+)$")
+
+pinecone_client = None
+PINECONE_INDEX = None
+
+_gc_thread = None
+_lock = threading.Lock()
+# Chatbots with a re-index running in this worker
+_building = set()
+_stats_lock = threading.Lock()
+_stats = {"swaps": 0, "swap_conflicts": 0, "abandoned_builds": 0, "collected": 0, "kept_in_use": 0, "gc_errors": 0}
+
+
+def init_namespace_versions(app_pinecone_client, app_pinecone_index: str) -> None:
+    """Set the Pinecone client used to delete retired versions and start the collector"""
+    global pinecone_client, PINECONE_INDEX
+    pinecone_client = app_pinecone_client
+    PINECONE_INDEX = app_pinecone_index
+    _ensure_collector()
+
+
+def _count(key: str, amount: int = 1) -> None:
+    with _stats_lock:
+        _stats[key] += amount
+
+
+def parse_namespace(namespace: str) -> Tuple[str, int]:
+    """
+    Split a namespace into its unversioned base and version
+
+    Returns:
+        Tuple of (base, version); "acme-01" is ("acme-01", 0), "acme-01-v3" is ("acme-01", 3)
+    """
+    match = _VERSION_SUFFIX.match(namespace)
+    if match:
+        return match.group("base"), int(match.group("version"))
+    return namespace, 0
+
+
+def next_namespace(namespace: str) -> str:
+    """The namespace a re-index of this one is built in"""
+    base, version = parse_namespace(namespace)
+    return f"{base}-v{version + 1}"
+
+
+def reindex(index, chatbot_id: str, namespace: str, text_chunks: List[str], embeddings: List,
+            is_current: Callable[[], bool] = None) -> Optional[Dict]:
+    """
+    Rebuild a chatbot's knowledge base in a new namespace version and switch to it
+
+    The chunks are uploaded to the next unused version of namespace while
+    chat keeps reading the live one. Only when the new version is complete does
+    companies.pinecone_namespace change, in one compare-and-swap UPDATE that
+    also retires the old version. Readers pick the new namespace up on their
+    next profile load (immediately in this worker); the old one is deleted by
+    collect_garbage() once GRACE_SECONDS have passed.
+
+    Args:
+        index: Pinecone index handle
+        chatbot_id: Chatbot being re-indexed
+        namespace: Its live namespace, as read together with the content being indexed
+        text_chunks: The complete new content, in order
+        embeddings: Embedding vector for each chunk
+        is_current: Called just before the swap; return False if the source
+            content changed while building (e.g. a document was uploaded)
+
+    Returns:
+        dict with 'namespace', 'previous_namespace' and the sync counts, or None if
+        the build was abandoned because the content or the live namespace changed
+
+    Raises:
+        Exception: Pinecone or database errors; the live namespace is left untouched
+    """
+    with _lock:
+        if chatbot_id in _building:
+            logger.info(f"[namespace_versions] Re-index of chatbot {chatbot_id} already running in this worker")
+            return None
+        _building.add(chatbot_id)
+
+    new_namespace, swapped = None, False
+    try:
+        new_namespace = _unused_version(chatbot_id, namespace)
+        if new_namespace is None:
+            _count("swap_conflicts")
+            logger.warning(f"[namespace_versions] Namespace of chatbot {chatbot_id} is no longer '{namespace}'")
+            return None
+        sync_result = pinecone_sync.sync_namespace(index, new_namespace, text_chunks, embeddings)
+        vector_replica.replace_namespace(
+            new_namespace, [f"{new_namespace}-{i}" for i in range(len(text_chunks))], embeddings, text_chunks
+        )
+
+        if is_current is not None and not is_current():
+            _count("abandoned_builds")
+            logger.info(f"[namespace_versions] Content of chatbot {chatbot_id} changed while building "
+                        f"'{new_namespace}', abandoning it")
+            return None
+
+        swapped = swap_namespace(chatbot_id, namespace, new_namespace)
+        if not swapped:
+            _count("swap_conflicts")
+            logger.warning(f"[namespace_versions] Namespace of chatbot {chatbot_id} is no longer '{namespace}', "
+                           f"abandoning '{new_namespace}'")
+            return None
+    finally:
+        if not swapped and new_namespace:
+            # Nothing points at the half-built or superseded version; collect it on the next pass
+            retire_namespace(new_namespace, chatbot_id, delay_seconds=0)
+        with _lock:
+            _building.discard(chatbot_id)
+
+    # This worker switches now; other workers switch when their profile TTL runs out
+    knowledge_version = chatbot_profile.bump_knowledge_version(chatbot_id)
+    answer_cache.invalidate(chatbot_id)
+    cache_warmer.invalidate(namespace)
+    vector_cache.add_to_cache(new_namespace, embeddings, text_chunks, expiry_seconds=cache_warmer.WARM_TTL_SECONDS,
+                              knowledge_version=knowledge_version)
+
+    _count("swaps")
+    logger.info(f"[namespace_versions] Chatbot {chatbot_id} now serves '{new_namespace}' "
+                f"('{namespace}' retired for {GRACE_SECONDS}s)")
+    return dict(sync_result, namespace=new_namespace, previous_namespace=namespace)
+
+
+def swap_namespace(chatbot_id: str, expected: str, new_namespace: str) -> bool:
+    """
+    Point a chatbot at a new namespace if it still points at expected, and retire expected
+
+    Returns:
+        bool: True if the swap happened; False if the chatbot is gone or already moved on
+    """
+    delete_after = time.time() + GRACE_SECONDS
+    with connect_to_db() as conn:
+        cursor = conn.cursor()
+        if os.getenv('DB_TYPE', '').lower() == 'postgresql':
+            cursor.execute('''
+                UPDATE companies SET pinecone_namespace = %s, updated_at = CURRENT_TIMESTAMP
+                WHERE chatbot_id = %s AND pinecone_namespace = %s
+            ''', (new_namespace, chatbot_id, expected))
+            if cursor.rowcount != 1:
+                return False
+            cursor.execute('''
+                INSERT INTO retired_namespaces (namespace, chatbot_id, delete_after)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (namespace) DO UPDATE SET chatbot_id = EXCLUDED.chatbot_id,
+                    retired_at = CURRENT_TIMESTAMP, delete_after = EXCLUDED.delete_after
+            ''', (expected, chatbot_id, delete_after))
+        else:
+            cursor.execute('''
+                UPDATE companies SET pinecone_namespace = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE chatbot_id = ? AND pinecone_namespace = ?
+            ''', (new_namespace, chatbot_id, expected))
+            if cursor.rowcount != 1:
+                return False
+            cursor.execute('''
+                INSERT OR REPLACE INTO retired_namespaces (namespace, chatbot_id, delete_after)
+                VALUES (?, ?, ?)
+            ''', (expected, chatbot_id, delete_after))
+    return True
+
+
+def retire_namespace(namespace: str, chatbot_id: str = None, delay_seconds: float = None) -> None:
+    """Schedule a namespace version for deletion after delay_seconds (GRACE_SECONDS by default)"""
+    delete_after = time.time() + (GRACE_SECONDS if delay_seconds is None else delay_seconds)
+    try:
+        with connect_to_db() as conn:
+            cursor = conn.cursor()
+            if os.getenv('DB_TYPE', '').lower() == 'postgresql':
+                cursor.execute('''
+                    INSERT INTO retired_namespaces (namespace, chatbot_id, delete_after)
+                    VALUES (%s, %s, %s)
+                    ON CONFLICT (namespace) DO UPDATE SET delete_after = EXCLUDED.delete_after
+                ''', (namespace, chatbot_id, delete_after))
+            else:
+                cursor.execute('''
+                    INSERT OR REPLACE INTO retired_namespaces (namespace, chatbot_id, delete_after)
+                    VALUES (?, ?, ?)
+                ''', (namespace, chatbot_id, delete_after))
+    except Exception as e:
+        _count("gc_errors")
+        logger.error(f"[namespace_versions] Could not retire namespace '{namespace}': {e}")
+
+
+def collect_garbage() -> int:
+    """
+    Delete retired namespace versions whose grace period has passed
+
+    A retired namespace that a chatbot points at again (a shared namespace, or
+    a build whose swap raced another worker's) is only dropped from the list.
+
+    Returns:
+        int: Number of namespaces deleted from Pinecone
+    """
+    if pinecone_client is None:
+        return 0
+
+    placeholder = '%s' if os.getenv('DB_TYPE', '').lower() == 'postgresql' else '?'
+    with connect_to_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'SELECT namespace FROM retired_namespaces WHERE delete_after <= {placeholder}', (time.time(),))
+        due = [row[0] for row in cursor.fetchall()]
+
+    index = get_index_handle(pinecone_client, PINECONE_INDEX)
+    collected = 0
+    for namespace in due:
+        try:
+            with connect_to_db() as conn:
+                cursor = conn.cursor()
+                cursor.execute(f'SELECT 1 FROM companies WHERE pinecone_namespace = {placeholder}', (namespace,))
+                in_use = cursor.fetchone() is not None
+            if in_use:
+                _count("kept_in_use")
+            else:
+                _delete_namespace(index, namespace)
+                collected += 1
+            with connect_to_db() as conn:
+                cursor = conn.cursor()
+                cursor.execute(f'DELETE FROM retired_namespaces WHERE namespace = {placeholder}', (namespace,))
+        except Exception as e:
+            # Left in the table; the next pass tries again
+            _count("gc_errors")
+            logger.error(f"[namespace_versions] Could not delete retired namespace '{namespace}': {e}")
+
+    if collected:
+        _count("collected", collected)
+        logger.info(f"[namespace_versions] Deleted {collected} retired namespace versions")
+    return collected
+
+
+def get_stats() -> Dict:
+    """Get swap and garbage collection counters for this worker"""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats.update({
+        "grace_seconds": GRACE_SECONDS,
+        "gc_interval_seconds": GC_INTERVAL_SECONDS
+    })
+    return stats
+
+
+def _unused_version(chatbot_id: str, namespace: str) -> Optional[str]:
+    """
+    The next version of namespace that no chatbot uses and the collector isn't about to delete
+
+    Returns:
+        The namespace to build in, or None if the chatbot no longer points at namespace
+    """
+    placeholder = '%s' if os.getenv('DB_TYPE', '').lower() == 'postgresql' else '?'
+    with connect_to_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'SELECT pinecone_namespace FROM companies WHERE chatbot_id = {placeholder}', (chatbot_id,))
+        row = cursor.fetchone()
+        if row is None or row[0] != namespace:
+            return None
+        candidate = next_namespace(namespace)
+        while True:
+            cursor.execute(f'''
+                SELECT 1 FROM companies WHERE pinecone_namespace = {placeholder}
+                UNION ALL
+                SELECT 1 FROM retired_namespaces WHERE namespace = {placeholder}
+            ''', (candidate, candidate))
+            if cursor.fetchone() is None:
+                return candidate
+            candidate = next_namespace(candidate)
+
+
+def _delete_namespace(index, namespace: str) -> None:
+    try:
+        index.delete(delete_all=True, namespace=namespace)
+    except Exception as e:
+        # Serverless indexes answer 404 for a namespace that was never written or is already gone
+        if getattr(e, "status", None) != 404:
+            raise
+    pinecone_sync.forget_namespace(namespace)
+    vector_replica.delete_namespace(namespace)
+    cache_warmer.invalidate(namespace)
+    vector_cache.remove_from_cache(vector_cache.document_cache_key(namespace))
+
+
+def _ensure_collector() -> None:
+    global _gc_thread
+    with _lock:
+        if _gc_thread is None or not _gc_thread.is_alive():
+            _gc_thread = threading.Thread(target=_collect_loop, name="namespace-gc", daemon=True)
+            _gc_thread.start()
+
+
+def _collect_loop() -> None:
+    while True:
+        time.sleep(GC_INTERVAL_SECONDS)
+        try:
+            collect_garbage()
+        except Exception as e:
+            _count("gc_errors")
+            logger.error(f"[namespace_versions] Error collecting retired namespaces: {e}")
@@ -0,0 +1,219 @@
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+import logging
+
+from database import connect_to_db
+from embedding_store import content_hash
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Pinecone request limits: vectors per upsert and IDs per delete
+UPSERT_BATCH_SIZE = 100
+DELETE_BATCH_SIZE = 1000
+
+# Rows per statement when reading or writing the pinecone_vectors table
+STATE_BATCH_SIZE = 500
+
+_stats_lock = threading.Lock()
+_stats = {"syncs": 0, "full_replaces": 0, "added": 0, "updated": 0, "removed": 0, "unchanged": 0, "state_errors": 0}
+
+
+def sync_namespace(index, namespace: str, text_chunks: List[str], embeddings: List) -> Dict:
+    """
+    Make a namespace hold exactly these chunks, uploading only what changed
+
+    Chunk i is stored as vector "{namespace}-{i}". The pinecone_vectors table
+    remembers the content hash behind every vector ID in the namespace, so a
+    chunk whose text is unchanged at its position is skipped, a new or
+    changed one is upserted, and IDs no longer produced (old trailing chunks,
+    uploaded document vectors) are deleted afterwards. The namespace is never
+    empty in between, unlike delete_all followed by upsert.
+
+    Args:
+        index: Pinecone index handle
+        namespace: Namespace to sync
+        text_chunks: The namespace's complete new content, in order
+        embeddings: Embedding vector for each chunk
+
+    Returns:
+        dict with 'added', 'updated', 'removed' and 'unchanged' vector counts, and
+        'full_replace' if the namespace had to be replaced wholesale
+
+    Raises:
+        RuntimeError: The saved state could not be read. Nothing is changed: without
+        it a recorded namespace would look new and, on indexes that cannot list IDs,
+        be emptied by a full replace
+        Exception: Pinecone errors; the saved state is then left as it was, so
+        the next sync redoes whatever did not complete
+    """
+    ids = [f"{namespace}-{i}" for i in range(len(text_chunks))]
+    hashes = [content_hash(chunk) for chunk in text_chunks]
+
+    previous = load_state(namespace)
+    if previous is None:
+        raise RuntimeError(f"Could not read the saved state of namespace '{namespace}'; not syncing")
+    full_replace = False
+    if not previous:
+        previous, full_replace = _discover(index, namespace)
+    if full_replace:
+        # Vectors exist that we have no record of and cannot list: replace the namespace once
+        # the old way; the state saved below makes every later sync incremental
+        index.delete(delete_all=True, namespace=namespace)
+        previous = {}
+
+    changed = [i for i, (vector_id, chunk_hash) in enumerate(zip(ids, hashes)) if previous.get(vector_id) != chunk_hash]
+    added = sum(1 for i in changed if ids[i] not in previous)
+    new_ids = set(ids)
+    removed = [vector_id for vector_id in previous if vector_id not in new_ids]
+
+    # Upsert before deleting so readers always find the new or the old content
+    for start in range(0, len(changed), UPSERT_BATCH_SIZE):
+        batch = changed[start:start + UPSERT_BATCH_SIZE]
+        index.upsert(
+            vectors=[(ids[i], embeddings[i], {"text": text_chunks[i]}) for i in batch],
+            namespace=namespace
+        )
+    for start in range(0, len(removed), DELETE_BATCH_SIZE):
+        index.delete(ids=removed[start:start + DELETE_BATCH_SIZE], namespace=namespace)
+
+    _save_state(namespace, [(ids[i], hashes[i]) for i in changed], removed)
+
+    result = {
+        "added": added,
+        "updated": len(changed) - added,
+        "removed": len(removed),
+        "unchanged": len(ids) - len(changed),
+        "full_replace": full_replace
+    }
+    with _stats_lock:
+        _stats["syncs"] += 1
+        _stats["full_replaces"] += int(full_replace)
+        for key in ("added", "updated", "removed", "unchanged"):
+            _stats[key] += result[key]
+    logger.info(f"[pinecone_sync] Synced namespace '{namespace}': {result['added']} added, "
+                f"{result['updated']} updated, {result['removed']} removed, {result['unchanged']} unchanged"
+                f"{' (full replace)' if full_replace else ''}")
+    return result
+
+
+def load_state(namespace: str) -> Optional[Dict[str, Optional[str]]]:
+    """
+    Get the vector IDs recorded for a namespace and the content hash behind each
+
+    Returns:
+        dict of vector ID -> content hash (empty if nothing is recorded),
+        or None if the table can't be read
+    """
+    try:
+        with connect_to_db() as conn:
+            cursor = conn.cursor()
+            if os.getenv('DB_TYPE', '').lower() == 'postgresql':
+                cursor.execute('SELECT vector_id, content_hash FROM pinecone_vectors WHERE namespace = %s', (namespace,))
+            else:
+                cursor.execute('SELECT vector_id, content_hash FROM pinecone_vectors WHERE namespace = ?', (namespace,))
+            return {row[0]: row[1] for row in cursor.fetchall()}
+    except Exception as e:
+        logger.error(f"[pinecone_sync] Could not read state for namespace '{namespace}': {e}")
+        with _stats_lock:
+            _stats["state_errors"] += 1
+        return None
+
+
+def record_vectors(namespace: str, ids: List[str], text_chunks: List[str]) -> None:
+    """Record vectors upserted outside sync_namespace (e.g. uploaded documents)"""
+    _save_state(namespace, [(vector_id, content_hash(chunk)) for vector_id, chunk in zip(ids, text_chunks)], [])
+
+
+def forget_vectors(namespace: str, ids: List[str] = None, prefix: str = None) -> None:
+    """
+    Drop recorded vectors after they were deleted from Pinecone
+
+    Args:
+        namespace: The namespace
+        ids: Vector IDs that were deleted
+        prefix: Or every recorded ID starting with this (e.g. "{namespace}-{doc_id}-")
+    """
+    if prefix is not None:
+        # Unreadable state: the rows stay recorded, and the next sync deletes the IDs again (a no-op)
+        ids = [vector_id for vector_id in load_state(namespace) or {} if vector_id.startswith(prefix)]
+    _save_state(namespace, [], ids or [])
+
+
+def forget_namespace(namespace: str) -> None:
+    """Drop everything recorded for a namespace after delete_all"""
+    try:
+        with connect_to_db() as conn:
+            cursor = conn.cursor()
+            if os.getenv('DB_TYPE', '').lower() == 'postgresql':
+                cursor.execute('DELETE FROM pinecone_vectors WHERE namespace = %s', (namespace,))
+            else:
+                cursor.execute('DELETE FROM pinecone_vectors WHERE namespace = ?', (namespace,))
+    except Exception as e:
+        logger.error(f"[pinecone_sync] Could not clear state for namespace '{namespace}': {e}")
+        with _stats_lock:
+            _stats["state_errors"] += 1
+
+
+def get_stats() -> Dict:
+    """Get sync counters for this worker"""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _discover(index, namespace: str) -> Tuple[Dict[str, Optional[str]], bool]:
+    """
+    Find what an unrecorded namespace holds
+
+    Returns:
+        Tuple of ({vector ID: None} for every listed vector, whether the namespace must be
+        replaced wholesale because it has vectors that cannot be listed)
+    """
+    try:
+        ids = []
+        for page in index.list(namespace=namespace):
+            ids.extend(page)
+        # Hashes unknown: every listed ID is re-upserted or deleted
+        return {vector_id: None for vector_id in ids}, False
+    except Exception:
+        # Pod-based indexes and older clients cannot list IDs
+        pass
+
+    stats = index.describe_index_stats()
+    namespace_stats = stats.namespaces.get(namespace) if stats.namespaces else None
+    count = getattr(namespace_stats, 'vector_count', 0) if namespace_stats else 0
+    return {}, count > 0
+
+
+def _save_state(namespace: str, upserted: List[Tuple[str, str]], removed: List[str]) -> None:
+    if not upserted and not removed:
+        return
+    try:
+        with connect_to_db() as conn:
+            cursor = conn.cursor()
+            if os.getenv('DB_TYPE', '').lower() == 'postgresql':
+                delete_query = 'DELETE FROM pinecone_vectors WHERE namespace = %s AND vector_id = %s'
+                upsert_query = '''
+                    INSERT INTO pinecone_vectors (namespace, vector_id, content_hash, updated_at)
+                    VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
+                    ON CONFLICT (namespace, vector_id)
+                    DO UPDATE SET content_hash = EXCLUDED.content_hash, updated_at = CURRENT_TIMESTAMP
+                '''
+            else:
+                delete_query = 'DELETE FROM pinecone_vectors WHERE namespace = ? AND vector_id = ?'
+                upsert_query = '''
+                    INSERT OR REPLACE INTO pinecone_vectors (namespace, vector_id, content_hash, updated_at)
+                    VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                '''
+            for start in range(0, len(removed), STATE_BATCH_SIZE):
+                cursor.executemany(delete_query, [(namespace, vector_id) for vector_id in removed[start:start + STATE_BATCH_SIZE]])
+            for start in range(0, len(upserted), STATE_BATCH_SIZE):
+                cursor.executemany(upsert_query, [(namespace, vector_id, chunk_hash)
+                                                  for vector_id, chunk_hash in upserted[start:start + STATE_BATCH_SIZE]])
+    except Exception as e:
+        # Pinecone is already up to date; the next sync just re-uploads what it can't prove unchanged
+        logger.error(f"[pinecone_sync] Could not save state for namespace '{namespace}': {e}")
+        with _stats_lock:
+            _stats["state_errors"] += 1
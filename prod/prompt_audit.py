@@ -0,0 +1,244 @@
+import os
+import gzip
+import json
+import queue
+import atexit
+import random
+import shutil
+import threading
+from contextlib import contextmanager
+from datetime import datetime, UTC
+from typing import Dict, List, Optional
+import logging
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines: only threads in this process are serialized
+    fcntl = None
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Fraction of prompts written to the audit log (0.0 disables it, 1.0 logs everything)
+SAMPLE_RATE = float(os.getenv('PROMPT_AUDIT_SAMPLE_RATE', 0.1))
+
+# JSONL file the writer appends to; rotated copies are <path>.1.gz, <path>.2.gz, ...
+# Every worker appends to the same file; writes and rotation are serialized with
+# an flock on <path>.lock
+LOG_PATH = os.getenv('PROMPT_AUDIT_PATH', 'prompt_log.jsonl')
+
+# Rotate once the active file passes this size, keeping this many compressed backups
+MAX_BYTES = int(os.getenv('PROMPT_AUDIT_MAX_BYTES', 10 * 1024 * 1024))
+BACKUP_COUNT = int(os.getenv('PROMPT_AUDIT_BACKUP_COUNT', 5))
+
+# Records waiting for the writer; when full, new records are dropped rather than blocking
+QUEUE_SIZE = int(os.getenv('PROMPT_AUDIT_QUEUE_SIZE', 1000))
+
+_queue: "queue.Queue[Optional[str]]" = queue.Queue(maxsize=QUEUE_SIZE)
+_writer_thread = None
+_writer_lock = threading.Lock()
+_file_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {"sampled": 0, "skipped": 0, "dropped": 0, "written": 0, "rotations": 0, "errors": 0}
+
+
+def _count(key: str, amount: int = 1) -> None:
+    with _stats_lock:
+        _stats[key] += amount
+
+
+def should_sample() -> bool:
+    """Decide whether the current prompt is written to the audit log"""
+    if SAMPLE_RATE <= 0:
+        return False
+    return SAMPLE_RATE >= 1 or random.random() < SAMPLE_RATE
+
+
+def record_prompt(messages: List[Dict[str, str]], chatbot_id: str = None, thread_id: str = None,
+                  namespace: str = None, retrieval: Dict = None, tokens: Dict = None) -> bool:
+    """
+    Queue a prompt for the audit log. Never blocks and never touches the disk.
+
+    Args:
+        messages: The messages sent to the chat model
+        chatbot_id: Chatbot the prompt was built for
+        thread_id: Visitor thread the prompt belongs to
+        namespace: Pinecone namespace used for retrieval
+        retrieval: Retrieval metadata (source, scores, timing)
+        tokens: Per-section prompt token counts
+
+    Returns:
+        bool: True if the record was queued
+    """
+    if not should_sample():
+        _count("skipped")
+        return False
+
+    record = {
+        "ts": datetime.now(UTC).isoformat(),
+        "chatbot_id": chatbot_id,
+        "thread_id": thread_id,
+        "namespace": namespace,
+        "retrieval": retrieval or {},
+        "tokens": tokens or {},
+        "messages": [{"role": m.get("role"), "content": m.get("content")} for m in messages]
+    }
+
+    _ensure_writer()
+    try:
+        # Compact separators keep each record on one short line
+        _queue.put_nowait(json.dumps(record, separators=(",", ":"), default=str))
+    except queue.Full:
+        _count("dropped")
+        return False
+
+    _count("sampled")
+    return True
+
+
+def get_stats() -> Dict:
+    """Get sampling, queue and writer counters for monitoring"""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats.update({
+        "sample_rate": SAMPLE_RATE,
+        "queue_depth": _queue.qsize(),
+        "queue_size": QUEUE_SIZE,
+        "path": LOG_PATH,
+        "max_bytes": MAX_BYTES,
+        "backup_count": BACKUP_COUNT
+    })
+    return stats
+
+
+def shutdown(timeout: float = 5.0) -> None:
+    """Flush queued records and stop the writer thread"""
+    global _writer_thread
+    with _writer_lock:
+        thread = _writer_thread
+        if thread is None or not thread.is_alive():
+            return
+        try:
+            _queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        _writer_thread = None
+    thread.join(timeout)
+
+
+def _ensure_writer() -> None:
+    global _writer_thread
+    if _writer_thread is not None and _writer_thread.is_alive():
+        return
+    with _writer_lock:
+        if _writer_thread is None or not _writer_thread.is_alive():
+            _writer_thread = threading.Thread(target=_writer_loop, name="prompt-audit-writer", daemon=True)
+            _writer_thread.start()
+
+
+def _writer_loop() -> None:
+    log_file = None
+    lock_file = None
+    try:
+        while True:
+            line = _queue.get()
+            if line is None:
+                break
+
+            # Write everything already queued in one go before flushing
+            lines = [line]
+            stop = False
+            while True:
+                try:
+                    extra = _queue.get_nowait()
+                except queue.Empty:
+                    break
+                if extra is None:
+                    stop = True
+                    break
+                lines.append(extra)
+
+            try:
+                if lock_file is None and fcntl is not None:
+                    lock_file = open(f"{LOG_PATH}.lock", "a")
+                with _log_lock(lock_file):
+                    # Another worker may have rotated the file since this one last wrote
+                    if log_file is not None and not _is_current(log_file):
+                        log_file.close()
+                        log_file = None
+                    if log_file is None:
+                        log_file = open(LOG_PATH, "a", encoding="utf-8")
+                    log_file.write("\n".join(lines) + "\n")
+                    log_file.flush()
+                    _count("written", len(lines))
+
+                    if MAX_BYTES > 0 and log_file.tell() >= MAX_BYTES:
+                        log_file.close()
+                        log_file = None
+                        _rotate()
+            except Exception as e:
+                _count("errors")
+                logger.error(f"Error writing prompt audit log: {e}")
+                if log_file is not None:
+                    log_file.close()
+                    log_file = None
+
+            if stop:
+                break
+    finally:
+        if log_file is not None:
+            log_file.close()
+        if lock_file is not None:
+            lock_file.close()
+
+
+@contextmanager
+def _log_lock(lock_file):
+    """Serialize writes and rotation across workers, or only within this process without fcntl"""
+    if fcntl is None:
+        with _file_lock:
+            yield
+        return
+    fcntl.flock(lock_file, fcntl.LOCK_EX)
+    try:
+        yield
+    finally:
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _is_current(log_file) -> bool:
+    """Whether an open handle still refers to the file at LOG_PATH"""
+    try:
+        return os.stat(LOG_PATH).st_ino == os.fstat(log_file.fileno()).st_ino
+    except FileNotFoundError:
+        return False
+
+
+def _rotate() -> None:
+    # Caller holds the log's flock. Shift <path>.N.gz up by one, dropping the oldest, then compress the active file to .1.gz
+    if BACKUP_COUNT <= 0:
+        os.remove(LOG_PATH)
+        _count("rotations")
+        return
+
+    oldest = f"{LOG_PATH}.{BACKUP_COUNT}.gz"
+    if os.path.exists(oldest):
+        os.remove(oldest)
+    for i in range(BACKUP_COUNT - 1, 0, -1):
+        source = f"{LOG_PATH}.{i}.gz"
+        if os.path.exists(source):
+            os.replace(source, f"{LOG_PATH}.{i + 1}.gz")
+
+    rotated = f"{LOG_PATH}.rotating"
+    os.replace(LOG_PATH, rotated)
+    with open(rotated, "rb") as source, gzip.open(f"{LOG_PATH}.1.gz", "wb") as target:
+        shutil.copyfileobj(source, target)
+    os.remove(rotated)
+
+    _count("rotations")
+    logger.info(f"Rotated prompt audit log {LOG_PATH}")
+
+
+# Flush whatever is still queued when the worker exits
+atexit.register(shutdown)
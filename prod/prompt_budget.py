@@ -0,0 +1,241 @@
+import os
+import json
+import threading
+from typing import Dict, List, Tuple
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+except ImportError:  # Fall back to a character estimate if tiktoken is not installed
+    tiktoken = None
+
+# Context window of each chat model
+MODEL_CONTEXT_LIMITS = {
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+    "gpt-4-turbo": 128000,
+    "gpt-4": 8192,
+    "gpt-3.5-turbo": 16385
+}
+
+# Prompt tokens we are willing to spend per request. Far below the context window:
+# prompt tokens dominate cost and latency, and answers rarely improve past a few chunks.
+# Override per model with PROMPT_TOKEN_BUDGETS='{"gpt-4o": 6000}'.
+MODEL_PROMPT_BUDGETS = {
+    "gpt-4o": 4000,
+    "gpt-4o-mini": 4000,
+    "gpt-4-turbo": 4000,
+    "gpt-4": 3000,
+    "gpt-3.5-turbo": 3000
+}
+MODEL_PROMPT_BUDGETS.update(json.loads(os.getenv('PROMPT_TOKEN_BUDGETS', '{}')))
+DEFAULT_PROMPT_BUDGET = int(os.getenv('PROMPT_TOKEN_BUDGET', 4000))
+
+# A context chunk is only truncated to fit if at least this many of its tokens survive
+MIN_TRUNCATED_CHUNK_TOKENS = int(os.getenv('PROMPT_MIN_TRUNCATED_CHUNK_TOKENS', 64))
+
+# Chat format overhead (per OpenAI's counting guide): each message carries a few
+# framing tokens and every reply is primed with a few more
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY = 3
+
+CONTEXT_HEADER = "Company Information for this question:\n"
+
+SECTIONS = ("system", "context", "history", "user")
+
+_encodings = {}
+_encodings_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {"prompts": 0, "truncated_prompts": 0, "tokens": {section: 0 for section in SECTIONS}}
+
+
+def _get_encoding(model: str):
+    if tiktoken is None:
+        return None
+    with _encodings_lock:
+        if model not in _encodings:
+            try:
+                _encodings[model] = tiktoken.encoding_for_model(model)
+            except KeyError:
+                _encodings[model] = tiktoken.get_encoding("o200k_base")
+            except Exception as e:
+                # Encodings are downloaded on first use; don't fail chats if that is impossible
+                logger.error(f"Could not load tokenizer for {model}, estimating tokens instead: {e}")
+                _encodings[model] = None
+        return _encodings[model]
+
+
+def count_tokens(text: str, model: str = "gpt-4o") -> int:
+    """Count the tokens in a string for the given model"""
+    if not text:
+        return 0
+    encoding = _get_encoding(model)
+    if encoding is None:
+        # Roughly four characters per token for English text
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str = "gpt-4o") -> str:
+    """Cut text down to at most max_tokens tokens"""
+    if max_tokens <= 0:
+        return ""
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return text[:max_tokens * 4]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
+
+
+def get_prompt_budget(model: str, max_completion_tokens: int = None) -> int:
+    """
+    Get the prompt token budget for a model, never leaving less room than the
+    completion needs inside the context window
+    """
+    budget = int(MODEL_PROMPT_BUDGETS.get(model, DEFAULT_PROMPT_BUDGET))
+    context_limit = MODEL_CONTEXT_LIMITS.get(model)
+    if context_limit:
+        budget = min(budget, context_limit - (max_completion_tokens or 0) - TOKENS_PER_REPLY)
+    return max(budget, 0)
+
+
+def build_messages(system_prompt: str, user_message: str, context_chunks: List[Dict] = None,
+                   history: List[Dict] = None, model: str = "gpt-4o",
+                   max_completion_tokens: int = None) -> Tuple[List[Dict[str, str]], Dict]:
+    """
+    Pack a prompt into the model's token budget.
+
+    The system prompt and the user's message are always kept. The latest
+    exchange of history comes next (follow-up questions depend on it), then
+    retrieved context in descending score order, then older history from
+    newest to oldest. A context chunk that does not fit whole is truncated if
+    enough of it survives; everything else that does not fit is dropped.
+
+    Args:
+        system_prompt: The chatbot's system prompt
+        user_message: The visitor's current message
+        context_chunks: Retrieved chunks as dicts with 'text' and optional 'score'
+        history: Prior user/assistant messages, oldest first
+        model: Chat model the prompt is for
+        max_completion_tokens: Tokens reserved for the answer
+
+    Returns:
+        Tuple of (messages, report) where report has token counts per section
+    """
+    context_chunks = context_chunks or []
+    history = history or []
+    budget = get_prompt_budget(model, max_completion_tokens)
+
+    system_tokens = TOKENS_PER_MESSAGE + count_tokens(system_prompt, model)
+    user_tokens = TOKENS_PER_MESSAGE + count_tokens(user_message, model)
+    remaining = budget - system_tokens - user_tokens - TOKENS_PER_REPLY
+
+    # Latest exchange first, then context, then older history
+    recent_count = min(2, len(history))
+    kept_history = {}
+
+    def add_history(index: int) -> bool:
+        nonlocal remaining
+        message = history[index]
+        cost = TOKENS_PER_MESSAGE + count_tokens(message["content"], model)
+        if cost > remaining:
+            return False
+        kept_history[index] = message
+        remaining -= cost
+        return True
+
+    for index in range(len(history) - 1, len(history) - 1 - recent_count, -1):
+        if not add_history(index):
+            break
+
+    ranked = sorted(context_chunks, key=lambda chunk: chunk.get("score", 0), reverse=True)
+    kept_chunks = []
+    context_truncated = False
+    context_tokens = 0
+    if ranked:
+        header_cost = TOKENS_PER_MESSAGE + count_tokens(CONTEXT_HEADER, model)
+        if header_cost < remaining:
+            remaining -= header_cost
+            context_tokens = header_cost
+            for chunk in ranked:
+                # +1 for the newline joining chunks
+                cost = count_tokens(chunk["text"], model) + 1
+                if cost <= remaining:
+                    kept_chunks.append(chunk["text"])
+                elif remaining >= MIN_TRUNCATED_CHUNK_TOKENS:
+                    kept_chunks.append(truncate_to_tokens(chunk["text"], remaining - 1, model))
+                    context_truncated = True
+                    cost = remaining
+                else:
+                    continue
+                remaining -= cost
+                context_tokens += cost
+            if not kept_chunks:
+                # Give back the header if no chunk made it in
+                remaining += header_cost
+                context_tokens = 0
+
+    for index in range(len(history) - 1 - recent_count, -1, -1):
+        if not add_history(index):
+            break
+
+    messages = [{"role": "system", "content": system_prompt}]
+    if kept_chunks:
+        messages.append({"role": "system", "content": CONTEXT_HEADER + "\n".join(kept_chunks)})
+    history_messages = [
+        {"role": history[index]["role"], "content": history[index]["content"]}
+        for index in sorted(kept_history)
+    ]
+    messages.extend(history_messages)
+    messages.append({"role": "user", "content": user_message})
+
+    history_tokens = sum(
+        TOKENS_PER_MESSAGE + count_tokens(message["content"], model) for message in history_messages
+    )
+    report = {
+        "model": model,
+        "budget": budget,
+        "system": system_tokens,
+        "context": context_tokens,
+        "history": history_tokens,
+        "user": user_tokens,
+        "total": system_tokens + context_tokens + history_tokens + user_tokens + TOKENS_PER_REPLY,
+        "context_chunks": len(kept_chunks),
+        "context_chunks_dropped": len(ranked) - len(kept_chunks),
+        "context_truncated": context_truncated,
+        "history_messages": len(history_messages),
+        "history_messages_dropped": len(history) - len(history_messages)
+    }
+    _record(report)
+    return messages, report
+
+
+def _record(report: Dict) -> None:
+    with _stats_lock:
+        _stats["prompts"] += 1
+        if report["context_truncated"] or report["context_chunks_dropped"] or report["history_messages_dropped"]:
+            _stats["truncated_prompts"] += 1
+        for section in SECTIONS:
+            _stats["tokens"][section] += report[section]
+
+
+def get_stats() -> Dict:
+    """Get prompt counts and average tokens per section for this worker"""
+    with _stats_lock:
+        prompts = _stats["prompts"]
+        return {
+            "prompts": prompts,
+            "truncated_prompts": _stats["truncated_prompts"],
+            "tokenizer": "tiktoken" if tiktoken is not None else "estimate",
+            "total_tokens": dict(_stats["tokens"]),
+            "average_tokens": {
+                section: (_stats["tokens"][section] / prompts if prompts else 0.0)
+                for section in SECTIONS
+            }
+        }
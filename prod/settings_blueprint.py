@@ -8,6 +8,8 @@ import hashlib
 from datetime import datetime
 import time
 from chat_handler import DEFAULT_SYSTEM_PROMPT  # Import the default prompt
+import answer_cache
+import chatbot_profile
 
 settings_bp = Blueprint('settings', __name__, url_prefix='/settings')
 
@@ -306,7 +308,8 @@ def get_chatbot_config(chatbot_id):
                     icon_image_url, 
                     show_lead_form,
                     webhook_url,
-                    webhook_triggers
+                    webhook_triggers,
+                    answer_cache_enabled
                 FROM chatbot_config
                 WHERE chatbot_id = {placeholder}
             """, (chatbot_id,))
@@ -356,7 +359,8 @@ def get_chatbot_config(chatbot_id):
                         icon_image_url, 
                         show_lead_form,
                         webhook_url,
-                        webhook_triggers
+                        webhook_triggers,
+                        answer_cache_enabled
                     FROM chatbot_config
                     WHERE chatbot_id = {placeholder}
                 """, (chatbot_id,))
@@ -372,7 +376,8 @@ def get_chatbot_config(chatbot_id):
                 "lead_form_title": "Want us to reach out? Need to keep this chat going? Just fill out the info below.",
                 "primary_color": "#0084ff",
                 "accent_color": "#e9ecef",
-                "show_lead_form": "Yes"
+                "show_lead_form": "Yes",
+                "answer_cache_enabled": "No"
             }
             
             # Convert to dictionary with named keys, using defaults for NULL values
@@ -386,7 +391,8 @@ def get_chatbot_config(chatbot_id):
                 "icon_image_url": result[6] or "",
                 "show_lead_form": result[7] if result[7] else default_values["show_lead_form"],
                 "webhook_url": result[8] or "",
-                "webhook_triggers": result[9] or ""
+                "webhook_triggers": result[9] or "",
+                "answer_cache_enabled": result[10] if result[10] else default_values["answer_cache_enabled"]
             }
             
             return jsonify({"success": True, "config": config})
@@ -427,7 +433,8 @@ def update_chatbot_config(chatbot_id):
             'icon_image_url', 
             'show_lead_form',
             'webhook_url',
-            'webhook_triggers'
+            'webhook_triggers',
+            'answer_cache_enabled'
         ]
         
         if setting not in allowed_settings:
@@ -491,6 +498,13 @@ def update_chatbot_config(chatbot_id):
             
             conn.commit()
             
+            # Cached answers were produced under the old prompt/setting
+            if setting in ('system_prompt', 'answer_cache_enabled'):
+                answer_cache.invalidate(chatbot_id)
+            
+            # embed_chat reads the prompt and model settings from the cached profile
+            chatbot_profile.invalidate(chatbot_id)
+            
             return jsonify({"success": True})
             
     except Exception as e:
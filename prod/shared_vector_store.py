@@ -0,0 +1,284 @@
+import os
+import json
+import time
+import fcntl
+import uuid
+import hashlib
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+import numpy as np
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# tmpfs when available, so the "files" are plain shared memory pages
+DEFAULT_SHARED_DIR = os.getenv(
+    'VECTOR_CACHE_SHARED_DIR',
+    '/dev/shm/easychat-vector-cache' if os.path.isdir('/dev/shm') else
+    os.path.join(tempfile.gettempdir(), 'easychat-vector-cache')
+)
+
+INDEX_FILE = "index.json"
+LOCK_FILE = "index.lock"
+
+
+class SharedVectorStore:
+    """
+    Vector cache entries shared by every worker process on a host.
+
+    Each entry's normalized float32 matrix is written once to a .npy file in
+    a tmpfs directory and memory-mapped read-only by every worker, so all of
+    them search the same physical pages. Chunk texts sit next to it as JSON.
+    A small index.json maps each cache key to its current version, file,
+    shape and expiry; writers hold an flock on index.lock and replace the
+    index atomically. Readers re-read the index only when it changes.
+
+    Replacing an entry writes the new data under a new file name and then
+    unlinks the old one. Workers still searching the old mapping keep it
+    valid until they drop it, so a reader never sees a half-written matrix.
+    """
+
+    def __init__(self, directory: str = DEFAULT_SHARED_DIR, max_bytes: int = 0):
+        """
+        Args:
+            directory: Host-local directory holding the index and matrices
+            max_bytes: Budget for all entries on the host (0 for unlimited)
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+        self._index_path = os.path.join(directory, INDEX_FILE)
+        self._lock_path = os.path.join(directory, LOCK_FILE)
+        self._lock = threading.RLock()
+        self._index: Dict = {"next_version": 1, "entries": {}}
+        self._index_stamp = None
+        # This worker's open mappings: key -> (version, matrix, chunks)
+        self._mapped: Dict[str, tuple] = {}
+
+        # Counters for get_stats() (this worker only)
+        self.evictions = 0
+        self.evicted_bytes = 0
+        self.expirations = 0
+        self.rejected = 0
+
+    def put(self, key: str, vectors: np.ndarray, chunks: List[str], created_at: float, expires_at: float,
+            **extra) -> Optional[int]:
+        """
+        Publish an entry for every worker on the host
+
+        Args:
+            key: Namespace or document cache key
+            vectors: Prepared float32 matrix, one row per chunk
+            chunks: Text for each row
+            created_at: Creation timestamp
+            expires_at: Expiry timestamp
+            extra: Additional fields stored with the entry (e.g. doc_id, namespace)
+
+        Returns:
+            int: Bytes used by the entry, or None if it does not fit the budget
+        """
+        chunks_json = json.dumps(chunks).encode("utf-8")
+        size = int(vectors.nbytes) + len(chunks_json)
+        if self.max_bytes and size > self.max_bytes:
+            self.rejected += 1
+            return None
+
+        # Data first, index last: a worker that sees the new version can always open it. The files
+        # get a unique name, so they are written before taking any lock and readers are not held up.
+        base = f"{hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]}.{uuid.uuid4().hex[:12]}"
+        self._write_file(f"{base}.npy", lambda f: np.save(f, vectors, allow_pickle=False))
+        self._write_file(f"{base}.json", lambda f: f.write(chunks_json))
+
+        with self._write_lock() as index:
+            version = index["next_version"]
+            index["next_version"] = version + 1
+
+            self._drop_entry(index, key)
+            index["entries"][key] = {
+                "version": version,
+                "file": base,
+                "rows": int(vectors.shape[0]),
+                "dimension": int(vectors.shape[1]),
+                "bytes": size,
+                "created_at": created_at,
+                "expires_at": expires_at,
+                **extra
+            }
+            self._evict(index, keep=key)
+        return size
+
+    def get(self, key: str) -> Optional[Dict]:
+        """
+        Get an entry in the same shape as a local cache entry, with a zero-copy matrix
+
+        Returns:
+            dict with 'vectors', 'chunks', 'created_at', 'expires_at', 'bytes' and any extra
+            fields, or None if the key is not cached
+        """
+        with self._lock:
+            meta = self._read_index()["entries"].get(key)
+            if meta is None:
+                self._mapped.pop(key, None)
+                return None
+            meta = dict(meta)
+            mapped = self._mapped.get(key)
+
+        if mapped is None or mapped[0] != meta["version"]:
+            # Opened outside the lock so a large entry does not hold up readers of other keys
+            try:
+                mapped = self._map(meta)
+            except FileNotFoundError:
+                # Replaced or removed by another worker since the index was read
+                with self._lock:
+                    self._index_stamp = None
+                return None
+            with self._lock:
+                current = self._index["entries"].get(key)
+                if current is not None and current["version"] == meta["version"]:
+                    self._mapped[key] = mapped
+
+        meta["vectors"] = mapped[1]
+        meta["chunks"] = mapped[2]
+        return meta
+
+    def get_meta(self, key: str) -> Optional[Dict]:
+        """Get an entry's index record (no vectors or chunks) without mapping it"""
+        with self._lock:
+            meta = self._read_index()["entries"].get(key)
+            return dict(meta) if meta else None
+
+    def remove(self, key: str) -> Optional[Dict]:
+        """Remove an entry for every worker, returning its index record"""
+        with self._write_lock() as index:
+            return self._drop_entry(index, key)
+
+    def keys(self) -> List[str]:
+        """Get the cached keys, oldest first"""
+        with self._lock:
+            return list(self._read_index()["entries"].keys())
+
+    def entries(self) -> Dict[str, Dict]:
+        """Get a copy of every index record"""
+        with self._lock:
+            return {key: dict(meta) for key, meta in self._read_index()["entries"].items()}
+
+    def cleanup_expired(self) -> int:
+        """Remove expired entries for every worker, returning how many were removed"""
+        now = time.time()
+        with self._lock:
+            if not any(meta["expires_at"] < now for meta in self._read_index()["entries"].values()):
+                return 0
+        with self._write_lock() as index:
+            expired = [key for key, meta in index["entries"].items() if meta["expires_at"] < now]
+            for key in expired:
+                self._drop_entry(index, key)
+            self.expirations += len(expired)
+            return len(expired)
+
+    def get_stats(self) -> Dict:
+        """Get host-wide occupancy and this worker's eviction counters"""
+        with self._lock:
+            entries = self._read_index()["entries"]
+            return {
+                "directory": self.directory,
+                "total_entries": len(entries),
+                "total_bytes": sum(meta["bytes"] for meta in entries.values()),
+                "mapped_in_worker": len(self._mapped),
+                "evictions": self.evictions,
+                "evicted_bytes": self.evicted_bytes,
+                "expirations": self.expirations,
+                "rejected": self.rejected
+            }
+
+    # Internal helpers
+
+    def _read_index(self) -> Dict:
+        # Caller must hold self._lock; the stat makes an unchanged index nearly free to check
+        try:
+            stat = os.stat(self._index_path)
+        except FileNotFoundError:
+            self._index = {"next_version": 1, "entries": {}}
+            self._index_stamp = None
+            return self._index
+
+        stamp = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        if stamp != self._index_stamp:
+            with open(self._index_path, encoding="utf-8") as index_file:
+                self._index = json.load(index_file)
+            self._index_stamp = stamp
+            # Release mappings of entries other workers removed or replaced
+            for key in list(self._mapped):
+                meta = self._index["entries"].get(key)
+                if meta is None or meta["version"] != self._mapped[key][0]:
+                    del self._mapped[key]
+        return self._index
+
+    @contextmanager
+    def _write_lock(self):
+        """Hold the host-wide writer lock and yield the current index; it is saved on exit"""
+        with self._lock:
+            with open(self._lock_path, "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    # Always read fresh under the lock, even if the stamp looks unchanged
+                    self._index_stamp = None
+                    index = self._read_index()
+                    yield index
+                    self._write_file(INDEX_FILE, lambda f: f.write(json.dumps(index).encode("utf-8")))
+                    self._index_stamp = None
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _write_file(self, name: str, write) -> None:
+        # Write to a temporary name and rename so readers never open a partial file
+        path = os.path.join(self.directory, name)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            write(f)
+        os.replace(temp_path, path)
+
+    def _map(self, meta: Dict) -> tuple:
+        base = os.path.join(self.directory, meta["file"])
+        # np.asarray drops the memmap subclass but keeps the shared pages
+        matrix = np.asarray(np.load(f"{base}.npy", mmap_mode="r"))
+        with open(f"{base}.json", encoding="utf-8") as chunks_file:
+            chunks = json.load(chunks_file)
+        return meta["version"], matrix, chunks
+
+    def _drop_entry(self, index: Dict, key: str) -> Optional[Dict]:
+        # Caller must hold the write lock
+        meta = index["entries"].pop(key, None)
+        self._mapped.pop(key, None)
+        if meta is not None:
+            base = os.path.join(self.directory, meta["file"])
+            for path in (f"{base}.npy", f"{base}.json"):
+                try:
+                    # Workers that still map the file keep their pages until they let go
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        return meta
+
+    def _evict(self, index: Dict, keep: str) -> None:
+        # Caller must hold the write lock. Workers don't report reads to each other, so the
+        # host-wide order is by expiry: entries closest to expiring are given up first.
+        if not self.max_bytes:
+            return
+        total = sum(meta["bytes"] for meta in index["entries"].values())
+        if total <= self.max_bytes:
+            return
+        for key, meta in sorted(index["entries"].items(), key=lambda item: item[1]["expires_at"]):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            self._drop_entry(index, key)
+            total -= meta["bytes"]
+            self.evictions += 1
+            self.evicted_bytes += meta["bytes"]
+            logger.info(f"Evicted shared cache entry '{key}' ({meta['bytes']} bytes) to stay within budget")
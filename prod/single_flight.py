@@ -0,0 +1,171 @@
+import os
+import time
+import hashlib
+import threading
+from collections import deque
+from typing import Dict, Optional, Tuple
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Longest a duplicate request waits for the original before doing the work itself
+DEFAULT_WAIT_TIMEOUT_SECONDS = float(os.getenv('SINGLE_FLIGHT_WAIT_SECONDS', 60))
+
+# Shorter wait for callers that block a shared thread pool while they wait (the ASGI
+# app), so a burst of duplicates cannot tie up every thread behind one slow leader
+DEFAULT_POOL_WAIT_TIMEOUT_SECONDS = float(os.getenv('SINGLE_FLIGHT_POOL_WAIT_SECONDS', 10))
+
+# How long a result is kept for replay when the client sent an idempotency key
+DEFAULT_RESULT_TTL_SECONDS = float(os.getenv('IDEMPOTENCY_RESULT_TTL_SECONDS', 300))
+
+
+def make_key(chatbot_id: str, thread_id: str, message: str, idempotency_key: str = None) -> Tuple:
+    """
+    Build the coalescing key for a chat request. An idempotency key identifies
+    one logical send (including its retries); otherwise identical messages in
+    the same thread are matched by their hash.
+    """
+    if idempotency_key:
+        return (chatbot_id, thread_id, "idempotency", idempotency_key)
+    digest = hashlib.sha256((message or "").encode("utf-8")).hexdigest()
+    return (chatbot_id, thread_id, "message", digest)
+
+
+class Flight:
+    """One upstream call that any number of identical requests can wait on"""
+
+    def __init__(self, key: Tuple, retain: bool):
+        self.key = key
+        self.retain = retain
+        self.event = threading.Event()
+        self.result = None
+        self.abandoned = False
+        self.started_at = time.time()
+        self.expires_at = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical requests so they share one result.
+
+    The first request for a key becomes the leader and does the work; later
+    requests wait for its result instead of repeating it. If the leader fails
+    or is abandoned, a waiting request takes over. Results of flights started
+    with retain=True (client idempotency keys) are kept for a TTL so retries
+    that arrive after completion are replayed too.
+    """
+
+    def __init__(self, wait_timeout_seconds: float = DEFAULT_WAIT_TIMEOUT_SECONDS,
+                 result_ttl_seconds: float = DEFAULT_RESULT_TTL_SECONDS):
+        """Initialize an empty registry with the given timeouts"""
+        self.wait_timeout_seconds = wait_timeout_seconds
+        self.result_ttl_seconds = result_ttl_seconds
+
+        self._flights: Dict[Tuple, Flight] = {}
+        # Retained flights in completion order; the TTL is fixed so they expire in this order too
+        self._retained = deque()
+        self._lock = threading.Lock()
+
+        # Counters for get_stats()
+        self.leaders = 0
+        self.coalesced = 0
+        self.replayed = 0
+        self.abandoned = 0
+        self.timeouts = 0
+
+    def join(self, key: Tuple, retain: bool = False,
+             wait_timeout_seconds: float = None) -> Tuple[Optional[Flight], Optional[Dict]]:
+        """
+        Join the flight for a key
+
+        Args:
+            key: Key from make_key()
+            retain: Keep the result for replay after completion
+            wait_timeout_seconds: Longest this caller waits for another request's result,
+                if shorter than the registry's wait timeout
+
+        Returns:
+            (flight, None) if the caller is the leader and must complete or abandon the flight,
+            (None, result) if another request's result should be returned,
+            (None, None) if waiting timed out and the caller should proceed on its own
+        """
+        wait = self.wait_timeout_seconds
+        if wait_timeout_seconds is not None:
+            wait = min(wait, wait_timeout_seconds)
+        deadline = time.time() + wait
+        while True:
+            with self._lock:
+                self._purge(time.time())
+                flight = self._flights.get(key)
+                # A leader that never finished (e.g. its stream was never consumed) is replaced
+                if flight is not None and not flight.event.is_set() and \
+                        time.time() - flight.started_at > self.wait_timeout_seconds:
+                    flight = None
+                if flight is None:
+                    flight = Flight(key, retain)
+                    self._flights[key] = flight
+                    self.leaders += 1
+                    return flight, None
+                if flight.event.is_set() and not flight.abandoned:
+                    self.replayed += 1
+                    return None, flight.result
+
+            remaining = deadline - time.time()
+            if remaining <= 0 or not flight.event.wait(remaining):
+                with self._lock:
+                    self.timeouts += 1
+                logger.warning(f"Timed out waiting for in-flight request {key[:2]}, proceeding independently")
+                return None, None
+
+            if not flight.abandoned:
+                with self._lock:
+                    self.coalesced += 1
+                return None, flight.result
+            # The leader gave up; loop round and try to take over
+
+    def complete(self, flight: Optional[Flight], result: Dict) -> None:
+        """Publish the leader's result to every waiting request"""
+        if flight is None:
+            return
+        with self._lock:
+            flight.result = result
+            if flight.retain:
+                flight.expires_at = time.time() + self.result_ttl_seconds
+                self._retained.append(flight)
+            elif self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+            flight.event.set()
+
+    def abandon(self, flight: Optional[Flight]) -> None:
+        """Give up a flight without a result so a waiting request can retry it"""
+        if flight is None or flight.event.is_set():
+            return
+        with self._lock:
+            flight.abandoned = True
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+            self.abandoned += 1
+            flight.event.set()
+
+    def get_stats(self) -> Dict:
+        """Get counts of led, coalesced and replayed requests for monitoring"""
+        with self._lock:
+            return {
+                # Retained flights are done, and a replaced one may have left _flights already
+                "in_flight": sum(1 for flight in self._flights.values() if not flight.event.is_set()),
+                "retained_results": len(self._retained),
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+                "replayed": self.replayed,
+                "abandoned": self.abandoned,
+                "timeouts": self.timeouts
+            }
+
+    def _purge(self, now: float) -> None:
+        # Caller must hold self._lock
+        while self._retained and self._retained[0].expires_at <= now:
+            flight = self._retained.popleft()
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
@@ -1318,7 +1318,8 @@ function initializeMarkedAndChatbot() {
                         'Content-Type': 'application/json',
                     },
                     body: JSON.stringify({
-                        chatbot_id: chatbotId
+                        chatbot_id: chatbotId,
+                        thread_id: threadId
                     })
                 });
 
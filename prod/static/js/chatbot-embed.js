@@ -1116,6 +1116,91 @@ function addMessage(message, role) {
     console.log(`Total messages in conversation: ${messages.length}`);
 }
 
+// Create a unique key for one chat send; retries of the send reuse it
+function createIdempotencyKey() {
+    if (window.crypto && typeof window.crypto.randomUUID === 'function') {
+        return window.crypto.randomUUID();
+    }
+    return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+}
+
+// POST a chat message, retrying network failures and gateway errors.
+// The request carries an idempotency key, so a retry of a message the server
+// already answered (or is still answering) is served that same answer.
+async function fetchChatWithRetry(url, options, maxRetries = 2) {
+    for (let attempt = 0; ; attempt++) {
+        try {
+            const response = await fetch(url, options);
+            if ([502, 503, 504].includes(response.status) && attempt < maxRetries) {
+                console.log(`Chat request returned ${response.status}, retrying...`);
+            } else {
+                return response;
+            }
+        } catch (error) {
+            if (attempt >= maxRetries) throw error;
+            console.log(`Chat request failed (${error.message}), retrying...`);
+        }
+        await new Promise(resolve => setTimeout(resolve, 500 * Math.pow(2, attempt)));
+    }
+}
+
+// Read a Server-Sent Events chat response from /embed-chat.
+// Calls onDelta with the text received so far after every fragment.
+async function readChatStream(response, onDelta) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let text = '';
+    let done = null;
+    let error = null;
+
+    while (true) {
+        const { value, done: streamDone } = await reader.read();
+        if (streamDone) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        // Events are separated by a blank line
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let eventName = 'message';
+            const dataLines = [];
+            rawEvent.split('\n').forEach(line => {
+                if (line.startsWith('event:')) {
+                    eventName = line.slice(6).trim();
+                } else if (line.startsWith('data:')) {
+                    dataLines.push(line.slice(5).trim());
+                }
+            });
+            if (!dataLines.length) continue;
+
+            const payload = JSON.parse(dataLines.join('\n'));
+            if (eventName === 'done') {
+                done = payload;
+            } else if (eventName === 'error') {
+                error = payload.error || 'Stream error';
+            } else if (payload.delta) {
+                text += payload.delta;
+                onDelta(text);
+            }
+        }
+    }
+
+    return { text, done, error };
+}
+
+// Render a partially streamed answer. Markdown is only rendered once DOMPurify
+// is available; until then plain text is shown and the final render replaces it.
+function renderPartialResponse(messageDiv, partialText) {
+    if (typeof DOMPurify !== 'undefined') {
+        messageDiv.innerHTML = DOMPurify.sanitize(marked.parse(partialText));
+    } else {
+        messageDiv.textContent = partialText;
+    }
+}
+
 // Function to show initial popup message with delay
 function showInitialPopup(delay = 2000) {
     // Only show if enabled in config (default to true if not specified)
@@ -1278,7 +1363,9 @@ chatForm.addEventListener('submit', async (e) => {
         const requestData = {
             message,
             chatbot_id: chatbotId,
-            thread_id: threadId
+            thread_id: threadId,
+            // Lets the server answer retries of this send without a second completion
+            idempotency_key: createIdempotencyKey()
         };
         
         // Add model configuration if available
@@ -1293,10 +1380,12 @@ chatForm.addEventListener('submit', async (e) => {
         
         console.log('Sending chat request:', requestData);
         
-        const response = await fetch(`${baseUrl}/embed-chat`, {
+        const response = await fetchChatWithRetry(`${baseUrl}/embed-chat`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
+                // Ask for a token stream; the server falls back to JSON otherwise
+                'Accept': 'text/event-stream',
             },
             body: JSON.stringify(requestData)
         });
@@ -1314,15 +1403,6 @@ chatForm.addEventListener('submit', async (e) => {
 
         if (!response.ok) throw new Error(`Request failed with status ${response.status}`);
 
-        const data = await response.json();
-        console.log('Received chat response:', data);
-        
-        // Update thread ID if provided in the response
-        if (data.thread_id) {
-            threadId = data.thread_id;
-            console.log('Updated thread ID:', threadId);
-        }
-        
         // Create assistant message container
         const assistantMessageDiv = document.createElement('div');
         assistantMessageDiv.className = 'daves-chat-message assistant';
@@ -1355,8 +1435,38 @@ chatForm.addEventListener('submit', async (e) => {
             }
         }
         
-        // Get the full response text
-        const fullText = data.response;
+        // Get the full response text, rendering it incrementally if it is streamed
+        let fullText;
+        const contentType = response.headers.get('Content-Type') || '';
+        if (contentType.includes('text/event-stream') && response.body) {
+            const streamed = await readChatStream(response, (partialText) => {
+                renderPartialResponse(assistantMessageDiv, partialText);
+                ensureUserMessageAtTop();
+            });
+
+            if (streamed.error) {
+                messagesContainer.removeChild(assistantMessageDiv);
+                throw new Error(streamed.error);
+            }
+
+            // Update thread ID if provided in the final event
+            if (streamed.done && streamed.done.thread_id) {
+                threadId = streamed.done.thread_id;
+                console.log('Updated thread ID:', threadId);
+            }
+            console.log('Received streamed chat response:', streamed.done);
+            fullText = streamed.text;
+        } else {
+            const data = await response.json();
+            console.log('Received chat response:', data);
+            
+            // Update thread ID if provided in the response
+            if (data.thread_id) {
+                threadId = data.thread_id;
+                console.log('Updated thread ID:', threadId);
+            }
+            fullText = data.response;
+        }
         
         // Add to messages array right away (we'll still display it gradually)
         messages.push({ role: 'assistant', content: fullText });
@@ -1526,7 +1636,8 @@ resetButton.addEventListener('click', async () => {
                 'Content-Type': 'application/json',
             },
             body: JSON.stringify({
-                chatbot_id: chatbotId
+                chatbot_id: chatbotId,
+                thread_id: threadId
             })
         });
 
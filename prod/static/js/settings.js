@@ -164,6 +164,13 @@ function loadSettingContent(settingId) {
                     { value: 'No', label: 'No - Hide the lead form' }
                 ]);
             break;
+        case 'answer-cache-enabled':
+            renderRadioForm(contentArea, 'answer-cache-enabled', 'Answer Cache', 'Reuse answers for first questions that closely match ones already asked', 
+                [
+                    { value: 'Yes', label: 'Yes - Answer repeated first questions instantly from cache' },
+                    { value: 'No', label: 'No - Generate every answer fresh' }
+                ]);
+            break;
         case 'webhook-url':
             renderWebhookUrlForm(contentArea);
             break;
@@ -0,0 +1,46 @@
+"""
+Shared pytest setup. The app's modules live flat in prod/ and import each
+other by name, so the tests put that directory on the path the same way
+running from prod/ does.
+
+Run from the prod directory:
+    python -m pytest tests
+"""
+
+import os
+import sys
+import types
+
+import pytest
+
+PROD_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROD_DIR not in sys.path:
+    sys.path.insert(0, PROD_DIR)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """
+    A controllable time.time() for a module under test
+
+    Usage:
+        now = clock(some_module)  # some_module's time.time() now returns now[0]
+        now[0] += 10
+    """
+    def install(module, start: float = 1000.0):
+        now = [start]
+        fake_time = types.SimpleNamespace(time=lambda: now[0], sleep=lambda seconds: None)
+        monkeypatch.setattr(module, "time", fake_time)
+        return now
+    return install
+
+
+@pytest.fixture
+def sqlite_db(monkeypatch, tmp_path):
+    """A fresh SQLite database with the app's full schema, used by connect_to_db()"""
+    import database
+    monkeypatch.delenv("DB_TYPE", raising=False)
+    monkeypatch.setattr(database, "DB_TYPE", "sqlite")
+    monkeypatch.setattr(database, "SQLITE_DB_NAME", str(tmp_path / "easyafchat.db"))
+    database.upgrade_database()
+    return database
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+import answer_cache
+from answer_cache import make_fingerprint
+
+SETTINGS = {"model": "gpt-4o", "temperature": 0.7, "max_tokens": 500}
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch):
+    monkeypatch.setattr(answer_cache, "answer_cache", {})
+    monkeypatch.setattr(answer_cache, "_stats", {})
+
+
+def unit(*values) -> np.ndarray:
+    vector = np.zeros(8, dtype=np.float32)
+    vector[:len(values)] = values
+    return vector
+
+
+def test_fingerprint_changes_with_everything_that_shapes_an_answer():
+    base = make_fingerprint("prompt", "ns", SETTINGS, 1)
+    assert base == make_fingerprint("prompt", "ns", dict(SETTINGS), 1)
+    assert base != make_fingerprint("other prompt", "ns", SETTINGS, 1)
+    assert base != make_fingerprint("prompt", "ns-v2", SETTINGS, 1)
+    assert base != make_fingerprint("prompt", "ns", dict(SETTINGS, temperature=0.2), 1)
+    assert base != make_fingerprint("prompt", "ns", SETTINGS, 2)
+
+
+def test_similar_question_hits_and_different_one_misses():
+    fingerprint = make_fingerprint("prompt", "ns", SETTINGS)
+    answer_cache.store("bot", unit(1, 0), "cached answer", fingerprint)
+
+    assert answer_cache.lookup("bot", unit(1, 0.01), fingerprint) == "cached answer"
+    assert answer_cache.lookup("bot", unit(0, 1), fingerprint) is None
+    assert answer_cache.lookup("other-bot", unit(1, 0), fingerprint) is None
+
+    stats = answer_cache.get_stats("bot")
+    assert stats["hits"] == 1 and stats["misses"] == 1 and stats["cached_answers"] == 1
+
+
+def test_new_fingerprint_drops_cached_answers():
+    answer_cache.store("bot", unit(1), "old answer", make_fingerprint("prompt", "ns", SETTINGS, 1))
+    assert answer_cache.lookup("bot", unit(1), make_fingerprint("prompt", "ns", SETTINGS, 2)) is None
+    assert answer_cache.get_stats("bot")["invalidations"] == 1
+    assert answer_cache.get_stats("bot")["cached_answers"] == 0
+
+
+def test_answers_expire_after_ttl(clock):
+    now = clock(answer_cache)
+    fingerprint = make_fingerprint("prompt", "ns", SETTINGS)
+    answer_cache.store("bot", unit(1), "answer", fingerprint)
+
+    now[0] += answer_cache.TTL_SECONDS - 1
+    assert answer_cache.lookup("bot", unit(1), fingerprint) == "answer"
+    now[0] += 2
+    assert answer_cache.lookup("bot", unit(1), fingerprint) is None
+
+
+def test_oldest_answers_are_dropped_past_the_cap(monkeypatch):
+    monkeypatch.setattr(answer_cache, "MAX_ENTRIES_PER_CHATBOT", 2)
+    fingerprint = make_fingerprint("prompt", "ns", SETTINGS)
+    for i, answer in enumerate(("a", "b", "c")):
+        answer_cache.store("bot", unit(*([0] * i + [1])), answer, fingerprint)
+
+    assert answer_cache.lookup("bot", unit(1), fingerprint) is None
+    assert answer_cache.lookup("bot", unit(0, 0, 1), fingerprint) == "c"
+
+
+def test_invalidate_and_empty_answers():
+    fingerprint = make_fingerprint("prompt", "ns", SETTINGS)
+    answer_cache.store("bot", unit(1), "", fingerprint)
+    assert answer_cache.invalidate("bot") is False
+
+    answer_cache.store("bot", unit(1), "answer", fingerprint)
+    assert answer_cache.invalidate("bot") is True
+    assert answer_cache.lookup("bot", unit(1), fingerprint) is None
+
+
+def test_is_enabled_reads_the_config_flag():
+    assert answer_cache.is_enabled("Yes") and answer_cache.is_enabled("true")
+    assert not answer_cache.is_enabled("No") and not answer_cache.is_enabled(None)
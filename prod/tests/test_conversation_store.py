@@ -0,0 +1,101 @@
+from types import SimpleNamespace
+
+import conversation_store
+from conversation_store import ConversationStore, estimate_handler_size
+
+
+def make_handler(history_text: str = ""):
+    history = [{"role": "user", "content": history_text}] if history_text else []
+    return SimpleNamespace(conversation_history=history, initial_question=None)
+
+
+def test_get_or_create_reuses_handler_per_thread():
+    store = ConversationStore()
+    first, created = store.get_or_create("bot", "t1", make_handler)
+    again, created_again = store.get_or_create("bot", "t1", make_handler)
+    other, _ = store.get_or_create("bot", "t2", make_handler)
+
+    assert created and not created_again
+    assert again is first
+    assert other is not first
+    assert store.get_stats()["hits"] == 1
+    assert store.get_stats()["misses"] == 2
+
+
+def test_threads_of_different_chatbots_do_not_mix():
+    store = ConversationStore()
+    a, _ = store.get_or_create("bot-a", "t1", make_handler)
+    b, _ = store.get_or_create("bot-b", "t1", make_handler)
+    assert a is not b
+
+
+def test_idle_conversations_expire(clock):
+    now = clock(conversation_store)
+    store = ConversationStore(idle_ttl_seconds=60)
+    store.get_or_create("bot", "t1", make_handler)
+
+    now[0] += 59
+    assert store.get("bot", "t1") is not None
+
+    # The access above restarted the idle timer
+    now[0] += 61
+    assert store.get("bot", "t1") is None
+    assert store.get_stats()["expirations"] == 1
+
+
+def test_sweep_removes_only_idle_conversations(clock):
+    now = clock(conversation_store)
+    store = ConversationStore(idle_ttl_seconds=60)
+    store.get_or_create("bot", "old", make_handler)
+    now[0] += 30
+    store.get_or_create("bot", "new", make_handler)
+    now[0] += 45
+
+    assert store.sweep() == 1
+    assert ("bot", "old") not in store
+    assert ("bot", "new") in store
+
+
+def test_least_recently_used_is_evicted_past_max_entries():
+    store = ConversationStore(max_entries=2)
+    store.get_or_create("bot", "t1", make_handler)
+    store.get_or_create("bot", "t2", make_handler)
+    store.get("bot", "t1")
+    store.get_or_create("bot", "t3", make_handler)
+
+    assert ("bot", "t2") not in store
+    assert ("bot", "t1") in store and ("bot", "t3") in store
+    assert store.get_stats()["evictions"] == 1
+
+
+def test_touch_remeasures_and_enforces_byte_budget():
+    small = estimate_handler_size(make_handler())
+    store = ConversationStore(max_bytes=small * 3)
+    first, _ = store.get_or_create("bot", "t1", make_handler)
+    store.get_or_create("bot", "t2", make_handler)
+    assert store.get_stats()["total_bytes"] == small * 2
+
+    # A long history pushes the store over budget; the other conversation goes
+    first.conversation_history.append({"role": "user", "content": "x" * (small * 2)})
+    store.touch("bot", "t1")
+
+    assert ("bot", "t2") not in store
+    assert store.get_stats()["total_bytes"] == estimate_handler_size(first)
+
+
+def test_newest_entry_is_kept_even_if_over_budget():
+    store = ConversationStore(max_bytes=1)
+    store.get_or_create("bot", "t1", make_handler)
+    assert len(store) == 1
+
+
+def test_discard_chatbot_drops_all_its_threads():
+    store = ConversationStore()
+    for thread_id in ("t1", "t2"):
+        store.get_or_create("bot", thread_id, make_handler)
+    store.get_or_create("other", "t1", make_handler)
+
+    assert store.discard_chatbot("bot") == 2
+    assert len(store) == 1
+    assert store.discard("other", "t1") is True
+    assert store.get_stats()["total_bytes"] == 0
@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+
+from ivf_index import IVFIndex
+
+DIMENSION = 16
+
+
+def unit_rows(rng, rows: int) -> np.ndarray:
+    matrix = rng.standard_normal((rows, DIMENSION)).astype(np.float32)
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+def exact_top(matrix: np.ndarray, query: np.ndarray, top_k: int) -> set:
+    return set(np.argsort(-(matrix @ query))[:top_k].tolist())
+
+
+@pytest.fixture
+def matrix():
+    return unit_rows(np.random.default_rng(1), 400)
+
+
+def test_train_assigns_every_row(matrix):
+    index = IVFIndex.train(matrix, n_lists=8)
+    assert index.n_lists == 8
+    assert len(index.assignments) == len(matrix)
+    assert set(np.unique(index.assignments)) <= set(range(8))
+    np.testing.assert_allclose(np.linalg.norm(index.centroids, axis=1), 1.0, rtol=1e-5)
+
+
+def test_probing_every_list_is_exact(matrix):
+    index = IVFIndex.train(matrix, n_lists=8)
+    query = matrix[17]
+    rows, scores = index.search(matrix, query, top_k=5, n_probe=8)
+
+    assert set(rows.tolist()) == exact_top(matrix, query, 5)
+    assert rows[0] == 17
+    assert list(scores) == sorted(scores, reverse=True)
+
+
+def test_few_probes_still_find_the_query_row(matrix):
+    index = IVFIndex.train(matrix, n_lists=16)
+    for row in (0, 99, 250):
+        rows, _ = index.search(matrix, matrix[row], top_k=1, n_probe=2)
+        assert rows[0] == row
+
+
+def test_add_update_and_keep_stay_aligned_with_the_matrix(matrix):
+    rng = np.random.default_rng(2)
+    index = IVFIndex.train(matrix, n_lists=8)
+
+    appended = unit_rows(rng, 20)
+    matrix = np.concatenate([matrix, appended])
+    index.add(appended)
+    assert len(index.assignments) == len(matrix)
+    rows, _ = index.search(matrix, appended[3], top_k=1, n_probe=8)
+    assert rows[0] == 403
+
+    replacement = unit_rows(rng, 1)
+    matrix[5] = replacement[0]
+    index.update(np.array([5]), replacement)
+    rows, _ = index.search(matrix, replacement[0], top_k=1, n_probe=8)
+    assert rows[0] == 5
+
+    keep = np.array([row for row in range(len(matrix)) if row % 2 == 0])
+    matrix = matrix[keep]
+    index.keep(keep)
+    assert len(index.assignments) == len(matrix)
+    rows, _ = index.search(matrix, matrix[10], top_k=1, n_probe=8)
+    assert rows[0] == 10
+
+
+def test_needs_retraining_after_growth(matrix):
+    index = IVFIndex.train(matrix[:100], n_lists=4)
+    assert not index.needs_retraining()
+    index.add(matrix[100:])
+    assert index.needs_retraining(factor=3.0)
+
+
+def test_save_and_load_round_trip(matrix, tmp_path):
+    index = IVFIndex.train(matrix, n_lists=8)
+    path = tmp_path / "index.npz"
+    index.save(str(path))
+    loaded = IVFIndex.load(str(path))
+
+    np.testing.assert_array_equal(loaded.centroids, index.centroids)
+    np.testing.assert_array_equal(loaded.assignments, index.assignments)
+    assert loaded.trained_rows == index.trained_rows
+
+
+def test_empty_matrix_cannot_be_trained():
+    with pytest.raises(ValueError):
+        IVFIndex.train(np.empty((0, DIMENSION), dtype=np.float32))
@@ -0,0 +1,66 @@
+import pytest
+
+import namespace_versions
+from namespace_versions import next_namespace, parse_namespace
+
+
+@pytest.mark.parametrize("namespace, expected", [
+    ("acme-01", ("acme-01", 0)),
+    ("acme-01-v3", ("acme-01", 3)),
+    ("acme-v2-v10", ("acme-v2", 10)),
+    ("acme-vx", ("acme-vx", 0)),
+    ("acme-v", ("acme-v", 0)),
+])
+def test_parse_namespace(namespace, expected):
+    assert parse_namespace(namespace) == expected
+
+
+def test_next_namespace_increments_the_version():
+    assert next_namespace("acme-01") == "acme-01-v1"
+    assert next_namespace("acme-01-v1") == "acme-01-v2"
+    assert parse_namespace(next_namespace("acme-01-v9"))[0] == "acme-01"
+
+
+def add_company(database, chatbot_id: str, namespace: str) -> None:
+    with database.connect_to_db() as conn:
+        conn.cursor().execute(
+            "INSERT INTO companies (chatbot_id, company_url, pinecone_namespace) VALUES (?, ?, ?)",
+            (chatbot_id, "https://example.com", namespace)
+        )
+
+
+def namespace_of(database, chatbot_id: str) -> str:
+    with database.connect_to_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT pinecone_namespace FROM companies WHERE chatbot_id = ?", (chatbot_id,))
+        return cursor.fetchone()[0]
+
+
+def retired(database) -> set:
+    with database.connect_to_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT namespace FROM retired_namespaces")
+        return {row[0] for row in cursor.fetchall()}
+
+
+def test_swap_is_compare_and_swap(sqlite_db):
+    add_company(sqlite_db, "bot", "acme")
+
+    assert namespace_versions.swap_namespace("bot", "acme", "acme-v1") is True
+    assert namespace_of(sqlite_db, "bot") == "acme-v1"
+    assert retired(sqlite_db) == {"acme"}
+
+    # A stale builder that still expects the old namespace must not overwrite the new one
+    assert namespace_versions.swap_namespace("bot", "acme", "acme-v2") is False
+    assert namespace_of(sqlite_db, "bot") == "acme-v1"
+    assert namespace_versions.swap_namespace("missing", "acme", "acme-v1") is False
+
+
+def test_unused_version_skips_live_and_retired_names(sqlite_db):
+    add_company(sqlite_db, "bot", "acme")
+    add_company(sqlite_db, "other", "acme-v1")
+    namespace_versions.retire_namespace("acme-v2", "bot")
+
+    assert namespace_versions._unused_version("bot", "acme") == "acme-v3"
+    # The chatbot has moved on from this namespace: nothing to build
+    assert namespace_versions._unused_version("bot", "acme-v1") is None
@@ -0,0 +1,135 @@
+from types import SimpleNamespace
+
+import pytest
+
+import pinecone_sync
+from pinecone_sync import sync_namespace
+
+
+class FakeIndex:
+    """In-memory stand-in for a Pinecone index handle, recording every call"""
+
+    def __init__(self, can_list: bool = True):
+        self.can_list = can_list
+        self.namespaces = {}
+        self.calls = []
+
+    def upsert(self, vectors, namespace):
+        self.calls.append("upsert")
+        stored = self.namespaces.setdefault(namespace, {})
+        for vector_id, values, metadata in vectors:
+            stored[vector_id] = (values, metadata)
+
+    def delete(self, ids=None, delete_all=False, namespace=None):
+        self.calls.append("delete_all" if delete_all else "delete")
+        if delete_all:
+            self.namespaces.pop(namespace, None)
+        else:
+            for vector_id in ids:
+                self.namespaces.get(namespace, {}).pop(vector_id, None)
+
+    def list(self, namespace):
+        if not self.can_list:
+            raise RuntimeError("list is not supported for pod-based indexes")
+        ids = list(self.namespaces.get(namespace, {}))
+        return iter([ids[i:i + 2] for i in range(0, len(ids), 2)])
+
+    def describe_index_stats(self):
+        return SimpleNamespace(namespaces={
+            name: SimpleNamespace(vector_count=len(vectors)) for name, vectors in self.namespaces.items()
+        })
+
+    def texts(self, namespace):
+        return {vector_id: metadata["text"] for vector_id, (_, metadata) in self.namespaces[namespace].items()}
+
+
+def embed(chunks):
+    return [[float(len(chunk))] for chunk in chunks]
+
+
+def sync(index, chunks, namespace="ns"):
+    return sync_namespace(index, namespace, chunks, embed(chunks))
+
+
+@pytest.fixture(autouse=True)
+def database(sqlite_db):
+    return sqlite_db
+
+
+def test_first_sync_adds_everything_and_records_it():
+    index = FakeIndex()
+    result = sync(index, ["a", "b"])
+
+    assert result == {"added": 2, "updated": 0, "removed": 0, "unchanged": 0, "full_replace": False}
+    assert index.texts("ns") == {"ns-0": "a", "ns-1": "b"}
+    assert set(pinecone_sync.load_state("ns")) == {"ns-0", "ns-1"}
+
+
+def test_resync_counts_added_updated_removed_and_unchanged():
+    index = FakeIndex()
+    sync(index, ["a", "b", "c"])
+    index.calls.clear()
+
+    result = sync(index, ["a", "B"])
+    assert result == {"added": 0, "updated": 1, "removed": 1, "unchanged": 1, "full_replace": False}
+    assert index.texts("ns") == {"ns-0": "a", "ns-1": "B"}
+    # Upserts land before deletes so the namespace is never empty in between
+    assert index.calls == ["upsert", "delete"]
+
+    result = sync(index, ["a", "B", "d"])
+    assert result == {"added": 1, "updated": 0, "removed": 0, "unchanged": 2, "full_replace": False}
+
+
+def test_unchanged_content_makes_no_pinecone_calls():
+    index = FakeIndex()
+    sync(index, ["a", "b"])
+    index.calls.clear()
+
+    assert sync(index, ["a", "b"])["unchanged"] == 2
+    assert index.calls == []
+
+
+def test_unrecorded_namespace_is_discovered_by_listing():
+    index = FakeIndex()
+    index.upsert([("ns-0", [1.0], {"text": "old"}), ("ns-7", [1.0], {"text": "stray"})], "ns")
+
+    result = sync(index, ["new"])
+    # Listed IDs have no known hash: re-upserted if still produced, deleted otherwise
+    assert result == {"added": 0, "updated": 1, "removed": 1, "unchanged": 0, "full_replace": False}
+    assert "delete_all" not in index.calls
+    assert index.texts("ns") == {"ns-0": "new"}
+
+
+def test_unlistable_unrecorded_namespace_is_replaced_once():
+    index = FakeIndex(can_list=False)
+    index.upsert([("ns-0", [1.0], {"text": "old"})], "ns")
+
+    assert sync(index, ["a"])["full_replace"] is True
+    assert index.calls.count("delete_all") == 1
+    assert index.texts("ns") == {"ns-0": "a"}
+
+    # Recorded now, so the next sync is incremental even without list()
+    assert sync(index, ["a", "b"])["full_replace"] is False
+    assert index.calls.count("delete_all") == 1
+
+
+def test_unreadable_state_aborts_without_touching_pinecone(monkeypatch):
+    index = FakeIndex(can_list=False)
+    sync(index, ["a"])
+    index.calls.clear()
+
+    def unavailable():
+        raise ConnectionError("database is down")
+    monkeypatch.setattr(pinecone_sync, "connect_to_db", unavailable)
+
+    assert pinecone_sync.load_state("ns") is None
+    with pytest.raises(RuntimeError):
+        sync(index, ["a", "b"])
+    assert index.calls == []
+    assert index.texts("ns") == {"ns-0": "a"}
+
+
+def test_forget_vectors_by_prefix():
+    pinecone_sync.record_vectors("ns", ["ns-doc1-0", "ns-doc1-1", "ns-doc2-0"], ["x", "y", "z"])
+    pinecone_sync.forget_vectors("ns", prefix="ns-doc1-")
+    assert set(pinecone_sync.load_state("ns")) == {"ns-doc2-0"}
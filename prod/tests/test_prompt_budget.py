@@ -0,0 +1,92 @@
+import pytest
+
+import prompt_budget
+from prompt_budget import build_messages, count_tokens
+
+MODEL = "test-model"
+
+
+@pytest.fixture(autouse=True)
+def estimated_tokens(monkeypatch):
+    # The character estimate (len // 4 + 1) keeps budgets exact without downloading encodings
+    monkeypatch.setattr(prompt_budget, "tiktoken", None)
+
+
+def with_budget(monkeypatch, budget: int) -> None:
+    monkeypatch.setitem(prompt_budget.MODEL_PROMPT_BUDGETS, MODEL, budget)
+
+
+def chunk(text: str, score: float) -> dict:
+    return {"text": text, "score": score}
+
+
+def test_everything_fits_in_order(monkeypatch):
+    with_budget(monkeypatch, 10000)
+    history = [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"}]
+    messages, report = build_messages("system", "question", [chunk("low", 0.1), chunk("high", 0.9)],
+                                      history, model=MODEL)
+
+    assert [m["role"] for m in messages] == ["system", "system", "user", "assistant", "user"]
+    assert messages[1]["content"] == prompt_budget.CONTEXT_HEADER + "high\nlow"
+    assert messages[-1]["content"] == "question"
+    assert report["context_chunks"] == 2 and report["history_messages"] == 2
+    assert report["total"] <= report["budget"]
+
+
+def test_lowest_scoring_context_is_dropped_first(monkeypatch):
+    # system (3+2) + user (3+3) + reply 3 + header (3+10) leaves room for one 100-token chunk
+    with_budget(monkeypatch, 130)
+    chunks = [chunk("a" * 396, 0.2), chunk("b" * 396, 0.8)]
+    messages, report = build_messages("system", "question", chunks, model=MODEL)
+
+    assert "b" * 396 in messages[1]["content"]
+    assert "a" * 10 not in messages[1]["content"]
+    assert report["context_chunks_dropped"] == 1
+    assert report["total"] <= 130
+
+
+def test_chunk_is_truncated_when_enough_of_it_survives(monkeypatch):
+    monkeypatch.setattr(prompt_budget, "MIN_TRUNCATED_CHUNK_TOKENS", 10)
+    with_budget(monkeypatch, 60)
+    messages, report = build_messages("system", "question", [chunk("c" * 4000, 1.0)], model=MODEL)
+
+    assert report["context_truncated"] is True
+    assert report["context_chunks"] == 1
+    assert report["total"] <= 60
+    assert len(messages[1]["content"]) < 4000
+
+
+def test_latest_exchange_outranks_context_and_older_history(monkeypatch):
+    with_budget(monkeypatch, 60)
+    history = [
+        {"role": "user", "content": "o" * 200},
+        {"role": "assistant", "content": "p" * 200},
+        {"role": "user", "content": "recent question"},
+        {"role": "assistant", "content": "recent answer"}
+    ]
+    messages, report = build_messages("system", "follow up", [chunk("z" * 400, 1.0)], history, model=MODEL)
+
+    contents = [m["content"] for m in messages]
+    assert "recent question" in contents and "recent answer" in contents
+    assert "o" * 200 not in contents
+    assert report["history_messages_dropped"] == 2
+    assert report["context_chunks"] == 0
+
+
+def test_system_prompt_and_user_message_are_always_kept(monkeypatch):
+    with_budget(monkeypatch, 1)
+    messages, report = build_messages("system " * 50, "question", [chunk("text", 1.0)], model=MODEL)
+
+    assert messages == [{"role": "system", "content": "system " * 50}, {"role": "user", "content": "question"}]
+    assert report["context"] == 0
+
+
+def test_budget_leaves_room_for_the_completion():
+    limit = prompt_budget.MODEL_CONTEXT_LIMITS["gpt-4"]
+    budget = prompt_budget.get_prompt_budget("gpt-4", max_completion_tokens=limit - 100)
+    assert budget == 100 - prompt_budget.TOKENS_PER_REPLY
+
+
+def test_count_tokens_estimate():
+    assert count_tokens("", MODEL) == 0
+    assert count_tokens("abcd" * 10, MODEL) == 11
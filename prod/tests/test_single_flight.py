@@ -0,0 +1,116 @@
+import threading
+import time
+
+import single_flight
+from single_flight import SingleFlight, make_key
+
+
+def wait_for(predicate, timeout: float = 2.0) -> None:
+    deadline = time.time() + timeout
+    while not predicate():
+        assert time.time() < deadline, "condition not reached"
+        time.sleep(0.005)
+
+
+def follow(flights: SingleFlight, key, results: list, **kwargs) -> threading.Thread:
+    thread = threading.Thread(target=lambda: results.append(flights.join(key, **kwargs)))
+    thread.start()
+    return thread
+
+
+def test_make_key_prefers_idempotency_key():
+    assert make_key("bot", "t", "hi", "abc") == ("bot", "t", "idempotency", "abc")
+    assert make_key("bot", "t", "hi") == make_key("bot", "t", "hi")
+    assert make_key("bot", "t", "hi") != make_key("bot", "t", "hello")
+
+
+def test_followers_share_the_leaders_result():
+    flights = SingleFlight(wait_timeout_seconds=5)
+    leader, result = flights.join(("k",))
+    assert leader is not None and result is None
+
+    results = []
+    followers = [follow(flights, ("k",), results) for _ in range(3)]
+    wait_for(lambda: sum(1 for t in followers if t.is_alive()) == 3)
+    flights.complete(leader, {"response": "answer"})
+    for thread in followers:
+        thread.join(2)
+
+    assert results == [(None, {"response": "answer"})] * 3
+    stats = flights.get_stats()
+    assert stats["leaders"] == 1 and stats["coalesced"] == 3 and stats["in_flight"] == 0
+
+
+def test_completed_flight_without_retain_starts_fresh():
+    flights = SingleFlight()
+    leader, _ = flights.join(("k",))
+    flights.complete(leader, {"response": "first"})
+    again, result = flights.join(("k",))
+    assert again is not None and result is None
+
+
+def test_retained_result_is_replayed_until_ttl(clock):
+    now = clock(single_flight)
+    flights = SingleFlight(result_ttl_seconds=300)
+    leader, _ = flights.join(("k",), retain=True)
+    flights.complete(leader, {"response": "answer"})
+
+    assert flights.join(("k",)) == (None, {"response": "answer"})
+    assert flights.get_stats()["replayed"] == 1
+
+    now[0] += 301
+    new_leader, result = flights.join(("k",))
+    assert new_leader is not None and result is None
+    assert flights.get_stats()["retained_results"] == 0
+
+
+def test_abandoned_flight_is_taken_over_by_a_follower():
+    flights = SingleFlight(wait_timeout_seconds=5)
+    leader, _ = flights.join(("k",))
+    results = []
+    follower = follow(flights, ("k",), results)
+    wait_for(follower.is_alive)
+    time.sleep(0.05)
+    flights.abandon(leader)
+    follower.join(2)
+
+    new_leader, result = results[0]
+    assert new_leader is not None and new_leader is not leader and result is None
+    assert flights.get_stats()["abandoned"] == 1
+
+
+def test_follower_wait_is_bounded_per_call():
+    flights = SingleFlight(wait_timeout_seconds=60)
+    flights.join(("k",))
+    started = time.time()
+    assert flights.join(("k",), wait_timeout_seconds=0.05) == (None, None)
+    assert time.time() - started < 1
+    assert flights.get_stats()["timeouts"] == 1
+
+
+def test_stale_leader_is_replaced(clock):
+    now = clock(single_flight)
+    flights = SingleFlight(wait_timeout_seconds=10)
+    stale, _ = flights.join(("k",))
+    now[0] += 11
+    replacement, result = flights.join(("k",))
+    assert replacement is not None and replacement is not stale and result is None
+
+
+def test_in_flight_never_goes_negative(clock):
+    now = clock(single_flight)
+    flights = SingleFlight(wait_timeout_seconds=10, result_ttl_seconds=300)
+    first, _ = flights.join(("a",), retain=True)
+    flights.complete(first, {"response": "a"})
+
+    # A retained flight whose leader was replaced is in _retained but not in _flights
+    stale, _ = flights.join(("b",), retain=True)
+    now[0] += 11
+    replacement, _ = flights.join(("b",), retain=True)
+    flights.complete(stale, {"response": "late"})
+    assert flights.get_stats()["in_flight"] == 1
+
+    flights.complete(replacement, {"response": "b"})
+    stats = flights.get_stats()
+    assert stats["in_flight"] == 0
+    assert stats["retained_results"] == 3
@@ -1,16 +1,189 @@
+import os
+import sys
 import time
+import zlib
+import threading
+from collections import OrderedDict
 import numpy as np
 from typing import Dict, List, Tuple, Optional
 import logging
 
+import vector_quantization
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Global in-memory cache to store vectors by namespace
-vector_cache = {}
+# Most memory the cache may hold in one worker; least recently used entries are evicted beyond it
+MAX_CACHE_BYTES = int(os.getenv('VECTOR_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+
+# How often the background sweeper drops expired entries
+SWEEP_INTERVAL_SECONDS = float(os.getenv('VECTOR_CACHE_SWEEP_INTERVAL_SECONDS', 30))
+
+# Most memory one block of batch search scores may take; larger query batches are split into blocks
+BATCH_SCORE_BYTES = int(os.getenv('VECTOR_CACHE_BATCH_SCORE_BYTES', 64 * 1024 * 1024))
+
+# 'local' keeps entries in this worker's memory; 'shared' memory-maps them from a host-wide
+# directory so every gunicorn worker searches one copy (MAX_CACHE_BYTES is then per host)
+BACKEND = os.getenv('VECTOR_CACHE_BACKEND', 'local').lower()
+
+# 'int8' keeps namespace vectors compressed in memory (4x smaller) and re-scores the best
+# candidates exactly from a memory-mapped float32 copy; 'none' keeps plain float32
+QUANTIZATION = os.getenv('VECTOR_CACHE_QUANTIZATION', 'none').lower()
+
+# Locks serializing read-modify-write updates of one cache key (e.g. appending a document);
+# keys hash onto a fixed set of stripes so writers to different namespaces rarely share one
+LOCK_STRIPES = int(os.getenv('VECTOR_CACHE_LOCK_STRIPES', 64))
 
-def add_to_cache(namespace: str, vectors: List[List[float]], chunks: List[str], expiry_seconds: int = 60) -> bool:
+# Global in-memory cache to store vectors by namespace, least recently used first.
+# Only change it through the functions below so the byte total stays accurate.
+#
+# Entries are copy-on-write snapshots: once stored, an entry and its (read-only) arrays are
+# never modified. Writers build a complete new entry under the key's stripe lock and swap it in;
+# readers take a reference and search it without any lock. _cache_lock guards only the dict,
+# the byte total and the counters, and is never held while vectors are built or searched.
+vector_cache = OrderedDict()
+_cache_lock = threading.RLock()
+_stripe_locks = [threading.RLock() for _ in range(max(1, LOCK_STRIPES))]
+_total_bytes = 0
+_stats = {"hits": 0, "misses": 0, "evictions": 0, "evicted_bytes": 0, "expirations": 0, "rejected": 0}
+_sweeper_thread = None
+
+_shared_store = None
+if BACKEND == 'shared':
+    # Imported only when enabled: it relies on fcntl file locks
+    from shared_vector_store import SharedVectorStore
+    _shared_store = SharedVectorStore(max_bytes=MAX_CACHE_BYTES)
+    logger.info(f"Using shared vector cache in {_shared_store.directory}")
+
+if QUANTIZATION == 'float16':
+    # Removed: scanning it was 12-15x slower than float32; int8 is smaller and about as fast
+    logger.warning("VECTOR_CACHE_QUANTIZATION 'float16' is no longer supported; using 'int8'")
+    QUANTIZATION = 'int8'
+
+if QUANTIZATION != 'none' and QUANTIZATION not in vector_quantization.MODES:
+    logger.warning(f"Unknown VECTOR_CACHE_QUANTIZATION '{QUANTIZATION}'; caching float32 vectors")
+    QUANTIZATION = 'none'
+elif QUANTIZATION != 'none' and _shared_store is not None:
+    # Shared entries are already a single copy per host, stored as plain .npy matrices
+    logger.warning("VECTOR_CACHE_QUANTIZATION applies to the local backend only; caching float32 vectors")
+    QUANTIZATION = 'none'
+
+def entry_size(vectors: np.ndarray, chunks: List[str]) -> int:
+    """
+    Bytes held by a cache entry: the vector matrix plus the chunk strings and the list holding them
+    """
+    return int(vectors.nbytes) + sys.getsizeof(chunks) + sum(sys.getsizeof(chunk) for chunk in chunks)
+
+def _key_lock(key: str) -> threading.RLock:
+    """The stripe lock serializing writers of a cache key"""
+    return _stripe_locks[zlib.crc32(key.encode("utf-8")) % len(_stripe_locks)]
+
+def _freeze(entry: Dict) -> None:
+    # Make accidental in-place changes to a published snapshot fail loudly
+    if isinstance(entry["vectors"], np.ndarray):
+        entry["vectors"].flags.writeable = False
+
+def _store_entry(key: str, entry: Dict) -> bool:
+    """Swap in an entry as most recently used, evicting older entries to stay within the budget"""
+    global _total_bytes
+    if _shared_store is not None:
+        extra = {k: v for k, v in entry.items() if k not in ("vectors", "chunks", "created_at", "expires_at")}
+        stored = _shared_store.put(
+            key, entry["vectors"], entry["chunks"], entry["created_at"], entry["expires_at"], **extra
+        ) is not None
+        if not stored:
+            logger.warning(f"Cache entry '{key}' is larger than the {MAX_CACHE_BYTES} byte budget; not caching")
+        _ensure_sweeper()
+        return stored
+
+    entry["bytes"] = entry_size(entry["vectors"], entry["chunks"])
+    if entry["bytes"] > MAX_CACHE_BYTES:
+        logger.warning(
+            f"Cache entry '{key}' needs {entry['bytes']} bytes, more than the {MAX_CACHE_BYTES} byte budget; not caching"
+        )
+        with _cache_lock:
+            _stats["rejected"] += 1
+        _release(entry)
+        return False
+
+    _freeze(entry)
+    released = []
+    with _cache_lock:
+        # One assignment replaces the entry: readers see the old snapshot or the new one
+        previous = vector_cache.pop(key, None)
+        if previous is not None:
+            _total_bytes -= previous["bytes"]
+            released.append(previous)
+        vector_cache[key] = entry
+        _total_bytes += entry["bytes"]
+
+        while _total_bytes > MAX_CACHE_BYTES:
+            oldest_key, evicted = vector_cache.popitem(last=False)
+            _total_bytes -= evicted["bytes"]
+            released.append(evicted)
+            _stats["evictions"] += 1
+            _stats["evicted_bytes"] += evicted["bytes"]
+            logger.info(f"Evicted cache entry '{oldest_key}' ({evicted['bytes']} bytes) to stay within budget")
+
+    for old_entry in released:
+        _release(old_entry)
+    _ensure_sweeper()
+    return True
+
+def _remove_entry(key: str, expected: Dict = None) -> Optional[Dict]:
+    """Remove an entry; with expected, only if that snapshot is still the current one"""
+    global _total_bytes
+    if _shared_store is not None:
+        return _shared_store.remove(key)
+    with _cache_lock:
+        entry = vector_cache.get(key)
+        if entry is None or (expected is not None and entry is not expected):
+            return None
+        del vector_cache[key]
+        _total_bytes -= entry["bytes"]
+    _release(entry)
+    return entry
+
+def _release(entry: Dict) -> None:
+    """Delete the spill file behind a quantized entry"""
+    if isinstance(entry["vectors"], vector_quantization.QuantizedMatrix):
+        entry["vectors"].close()
+
+def _get_entry(key: str) -> Optional[Dict]:
+    """Get a live entry snapshot and mark it most recently used; expired entries are dropped"""
+    if _shared_store is not None:
+        # The shared store has its own locking; mapping a file must not hold up other readers
+        entry = _shared_store.get(key)
+    else:
+        with _cache_lock:
+            entry = vector_cache.get(key)
+            if entry is not None:
+                vector_cache.move_to_end(key)
+    
+    if entry is not None and time.time() > entry["expires_at"]:
+        if _remove_entry(key, expected=entry if _shared_store is None else None) is not None:
+            with _cache_lock:
+                _stats["expirations"] += 1
+        entry = None
+    with _cache_lock:
+        _stats["hits" if entry is not None else "misses"] += 1
+    return entry
+
+def remove_from_cache(key: str) -> bool:
+    """
+    Remove a namespace or document entry from the cache
+    
+    Args:
+        key: Namespace, or document cache key
+        
+    Returns:
+        bool: True if an entry was removed
+    """
+    return _remove_entry(key) is not None
+
+def add_to_cache(namespace: str, vectors: List[List[float]], chunks: List[str], expiry_seconds: int = 60,
+                 knowledge_version: int = None) -> bool:
     """
     Add vectors and their corresponding text chunks to the cache with expiration
     
@@ -19,12 +192,15 @@ def add_to_cache(namespace: str, vectors: List[List[float]], chunks: List[str],
         vectors: List of embedding vectors
         chunks: Corresponding text chunks
         expiry_seconds: Number of seconds until cache entry expires
+        knowledge_version: Chatbot knowledge version the vectors were read at, so
+            is_cache_valid() can drop them once the knowledge base changes
         
     Returns:
         bool: True if successfully added to cache
     """
     try:
-        if not namespace or not vectors or not chunks:
+        # len() rather than truthiness so numpy arrays are accepted too
+        if not namespace or vectors is None or len(vectors) == 0 or not chunks:
             return False
             
         if len(vectors) != len(chunks):
@@ -34,13 +210,18 @@ def add_to_cache(namespace: str, vectors: List[List[float]], chunks: List[str],
         # Current timestamp in seconds
         current_time = time.time()
         
-        # Store in cache
-        vector_cache[namespace] = {
-            "vectors": vectors,
-            "chunks": chunks,
+        # Store in cache, normalized once here instead of on every query
+        entry = {
+            "vectors": _compress(prepare_vectors(vectors)),
+            "chunks": list(chunks),
             "created_at": current_time,
             "expires_at": current_time + expiry_seconds
         }
+        if knowledge_version is not None:
+            entry["knowledge_version"] = knowledge_version
+        stored = _store_entry(namespace, entry)
+        if not stored:
+            return False
         
         logger.info(f"Added {len(vectors)} vectors to cache for namespace '{namespace}'")
         return True
@@ -61,80 +242,257 @@ def get_from_cache(namespace: str, query_vector: List[float], top_k: int = 3) ->
         List of dictionaries with 'chunk' and 'score' fields
     """
     try:
-        if not is_cache_valid(namespace):
+        cached_data = _get_entry(namespace)
+        if cached_data is None:
             return []
             
-        cached_data = vector_cache[namespace]
-        cached_vectors = cached_data["vectors"]
-        cached_chunks = cached_data["chunks"]
-        
-        # Calculate similarity scores
-        similarities = calculate_similarity(query_vector, cached_vectors)
-        
-        # Get indices of top_k highest similarities
-        top_indices = np.argsort(similarities)[-top_k:][::-1]  # Descending order
-        
-        # Create results list
-        results = []
-        for idx in top_indices:
-            results.append({
-                "text": cached_chunks[idx],
-                "score": float(similarities[idx])
-            })
-            
-        return results
+        return search_matrix(cached_data["vectors"], cached_data["chunks"], query_vector, top_k)
     except Exception as e:
         logger.error(f"Error retrieving from cache: {e}")
         return []
 
-def is_cache_valid(namespace: str) -> bool:
+def is_cache_valid(namespace: str, knowledge_version: int = None) -> bool:
     """
     Check if cache exists for namespace and has not expired
     
     Args:
         namespace: Unique identifier (usually the chatbot_id or namespace)
+        knowledge_version: The chatbot's current knowledge version; entries stamped
+            with an older one are stale even before they expire
         
     Returns:
         bool: True if cache exists and has not expired
     """
-    if namespace not in vector_cache:
+    if _shared_store is not None:
+        cache_entry = _shared_store.get_meta(namespace)
+    else:
+        cache_entry = vector_cache.get(namespace)
+    if cache_entry is None:
         return False
         
-    cache_entry = vector_cache[namespace]
     current_time = time.time()
     
     # Check if cache has expired
     if current_time > cache_entry["expires_at"]:
-        # Consider removing expired entries to free memory
-        # del vector_cache[namespace]
-        logger.info(f"Cache for namespace '{namespace}' has expired")
+        # Free the memory now rather than waiting for the sweeper
+        if _remove_entry(namespace, expected=cache_entry if _shared_store is None else None) is not None:
+            with _cache_lock:
+                _stats["expirations"] += 1
+            logger.info(f"Cache for namespace '{namespace}' has expired")
+        return False
+
+    # Knowledge changed in another worker; a newer stamp than ours just means our profile is behind
+    if knowledge_version is not None and cache_entry.get("knowledge_version", knowledge_version) < knowledge_version:
+        if _remove_entry(namespace, expected=cache_entry if _shared_store is None else None) is not None:
+            with _cache_lock:
+                _stats["expirations"] += 1
+            logger.info(f"Cache for namespace '{namespace}' predates knowledge version {knowledge_version}")
         return False
         
     return True
 
-def calculate_similarity(query_vector: List[float], cached_vectors: List[List[float]]) -> np.ndarray:
+def _compress(matrix: np.ndarray):
+    """Quantize a prepared matrix when VECTOR_CACHE_QUANTIZATION is on, keeping float32 if that fails"""
+    if QUANTIZATION == 'none':
+        return matrix
+    try:
+        return vector_quantization.QuantizedMatrix.from_vectors(matrix, QUANTIZATION)
+    except OSError as e:
+        logger.warning(f"Could not write the re-scoring copy, caching float32 vectors: {e}")
+        return matrix
+
+def prepare_vectors(vectors) -> np.ndarray:
     """
-    Calculate cosine similarity between query vector and cached vectors
+    Convert embedding vectors to the cache's storage format: one contiguous
+    float32 matrix with unit-length rows, so cosine similarity is a plain dot product
+    
+    Args:
+        vectors: List of embedding vectors or a 2-D array
+        
+    Returns:
+        numpy array of shape (len(vectors), dimension)
+    """
+    # Always copy so normalizing in place never touches the caller's array
+    matrix = np.array(vectors, dtype=np.float32, order="C")
+    if matrix.ndim != 2:
+        raise ValueError(f"Expected a 2-D array of vectors, got shape {matrix.shape}")
+    
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    # Leave all-zero rows at zero instead of dividing by zero
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return matrix
+
+def normalize_query(query_vector: List[float]) -> np.ndarray:
+    """
+    Convert a query embedding to a unit-length float32 vector
     
     Args:
         query_vector: The query embedding vector
-        cached_vectors: List of cached embedding vectors
         
     Returns:
-        numpy array of similarity scores
+        numpy array of shape (dimension,)
+    """
+    query = np.asarray(query_vector, dtype=np.float32)
+    norm = np.linalg.norm(query)
+    if norm == 0:
+        return query
+    return query / norm
+
+def top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """
+    Get the indices of the top_k highest scores, best first
+    
+    argpartition finds the top_k in linear time; only those k are then sorted,
+    instead of sorting every score.
+    """
+    count = len(scores)
+    if top_k <= 0 or count == 0:
+        return np.empty(0, dtype=np.intp)
+    if top_k < count:
+        candidates = np.argpartition(scores, count - top_k)[count - top_k:]
+    else:
+        candidates = np.arange(count)
+    return candidates[np.argsort(scores[candidates])[::-1]]
+
+def search_matrix(matrix: np.ndarray, chunks: List[str], query_vector: List[float], top_k: int,
+                  normalized: bool = False) -> List[Dict]:
+    """
+    Search a matrix from prepare_vectors() with one matrix-vector product
+    
+    Args:
+        matrix: Unit-length float32 vectors, one row per chunk
+        chunks: Text for each row
+        query_vector: The query embedding vector
+        top_k: Number of top results to return
+        normalized: True if query_vector already came from normalize_query()
+        
+    Returns:
+        List of dictionaries with 'text' and 'score' fields, best first
+    """
+    query = query_vector if normalized else normalize_query(query_vector)
+    if isinstance(matrix, vector_quantization.QuantizedMatrix):
+        indices, scores = matrix.search(query, top_k)
+        return [{"text": chunks[idx], "score": float(score)} for idx, score in zip(indices, scores)]
+    similarities = matrix @ query
+    return [
+        {"text": chunks[idx], "score": float(similarities[idx])}
+        for idx in top_k_indices(similarities, top_k)
+    ]
+
+def normalize_queries(query_vectors) -> np.ndarray:
+    """
+    Convert query embeddings to a (Q x dimension) float32 matrix with unit-length rows
+    
+    Args:
+        query_vectors: List of query embedding vectors or a 2-D array
+        
+    Returns:
+        numpy array of shape (len(query_vectors), dimension)
+    """
+    return prepare_vectors(query_vectors)
+
+def top_k_indices_batch(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """
+    Row-wise top_k_indices() for a (Q x N) score matrix, best first in each row
+    
+    Returns:
+        numpy array of shape (Q, min(top_k, N))
     """
-    # Convert to numpy arrays for faster computation
-    query_np = np.array(query_vector)
-    vectors_np = np.array(cached_vectors)
+    count = scores.shape[1]
+    top_k = min(top_k, count)
+    if top_k <= 0:
+        return np.empty((len(scores), 0), dtype=np.intp)
+    if top_k < count:
+        candidates = np.argpartition(scores, count - top_k, axis=1)[:, count - top_k:]
+    else:
+        candidates = np.broadcast_to(np.arange(count), scores.shape)
+    order = np.argsort(np.take_along_axis(scores, candidates, axis=1), axis=1)[:, ::-1]
+    return np.take_along_axis(candidates, order, axis=1)
+
+def search_matrix_batch(matrix: np.ndarray, query_vectors, top_k: int, normalized: bool = False,
+                        max_block_bytes: int = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Search a matrix from prepare_vectors() for many queries with matrix-matrix products
     
-    # Normalize vectors (in case they aren't already)
-    query_norm = query_np / np.linalg.norm(query_np)
-    vectors_norm = vectors_np / np.linalg.norm(vectors_np, axis=1, keepdims=True)
+    Queries are scored in blocks so the (block x rows) score matrix stays within
+    max_block_bytes, whatever the number of queries.
     
-    # Calculate cosine similarity
-    similarities = np.dot(vectors_norm, query_norm)
+    Args:
+        matrix: Unit-length float32 vectors, one row per chunk (or a QuantizedMatrix)
+        query_vectors: (Q x dimension) query embeddings
+        top_k: Number of top results per query
+        normalized: True if query_vectors already came from normalize_queries()
+        max_block_bytes: Score memory per block (default VECTOR_CACHE_BATCH_SCORE_BYTES)
+        
+    Returns:
+        Tuple of (indices, scores), each of shape (Q, min(top_k, rows)), best first in each row
+    """
+    queries = query_vectors if normalized else normalize_queries(query_vectors)
+    rows = len(matrix)
+    top_k = max(0, min(top_k, rows))
+    indices = np.empty((len(queries), top_k), dtype=np.intp)
+    scores = np.empty((len(queries), top_k), dtype=np.float32)
+    if top_k == 0 or len(queries) == 0:
+        return indices, scores
     
-    return similarities
+    quantized = isinstance(matrix, vector_quantization.QuantizedMatrix)
+    bytes_per_query = rows * 4
+    if quantized:
+        # Re-scoring also gathers each query's candidate rows
+        bytes_per_query = max(bytes_per_query, top_k * vector_quantization.RESCORE_FACTOR * matrix.shape[1] * 4)
+    block = max(1, (max_block_bytes or BATCH_SCORE_BYTES) // bytes_per_query)
+    for start in range(0, len(queries), block):
+        if quantized:
+            best, best_scores = matrix.search_batch(queries[start:start + block], top_k)
+        else:
+            block_scores = queries[start:start + block] @ matrix.T
+            best = top_k_indices_batch(block_scores, top_k)
+            best_scores = np.take_along_axis(block_scores, best, axis=1)
+        indices[start:start + len(best)] = best
+        scores[start:start + len(best)] = best_scores
+    return indices, scores
+
+def get_many_from_cache(namespace: str, query_vectors, top_k: int = 3) -> List[List[Dict]]:
+    """
+    Retrieve the most similar chunks for many queries against one namespace
+    
+    Args:
+        namespace: Unique identifier (usually the chatbot_id or namespace)
+        query_vectors: (Q x dimension) query embeddings
+        top_k: Number of top results per query
+        
+    Returns:
+        One list of dictionaries with 'text' and 'score' fields per query, in query
+        order; every list is empty if the namespace is not cached
+    """
+    try:
+        cached_data = _get_entry(namespace)
+        if cached_data is None:
+            return [[] for _ in range(len(query_vectors))]
+        
+        chunks = cached_data["chunks"]
+        indices, scores = search_matrix_batch(cached_data["vectors"], query_vectors, top_k)
+        return [
+            [{"text": chunks[idx], "score": float(score)} for idx, score in zip(row_indices, row_scores)]
+            for row_indices, row_scores in zip(indices.tolist(), scores.tolist())
+        ]
+    except Exception as e:
+        logger.error(f"Error retrieving batch from cache: {e}")
+        return [[] for _ in range(len(query_vectors))]
+
+def calculate_similarity(query_vector: List[float], cached_vectors: List[List[float]]) -> np.ndarray:
+    """
+    Calculate cosine similarity between query vector and cached vectors
+    
+    Args:
+        query_vector: The query embedding vector
+        cached_vectors: List of cached embedding vectors (need not be normalized)
+        
+    Returns:
+        numpy array of similarity scores
+    """
+    return prepare_vectors(cached_vectors) @ normalize_query(query_vector)
 
 def cleanup_expired_cache() -> int:
     """
@@ -143,20 +501,28 @@ def cleanup_expired_cache() -> int:
     Returns:
         int: Number of entries removed
     """
-    namespaces_to_remove = []
-    current_time = time.time()
+    if _shared_store is not None:
+        removed = _shared_store.cleanup_expired()
+        if removed:
+            logger.info(f"Removed {removed} expired shared cache entries")
+        return removed
     
-    for namespace, cache_entry in vector_cache.items():
-        if current_time > cache_entry["expires_at"]:
-            namespaces_to_remove.append(namespace)
+    current_time = time.time()
     
-    for namespace in namespaces_to_remove:
-        del vector_cache[namespace]
+    # Scan a snapshot so writers can keep swapping entries while we look
+    with _cache_lock:
+        snapshot = list(vector_cache.items())
+    removed = sum(
+        1 for namespace, cache_entry in snapshot
+        if current_time > cache_entry["expires_at"] and _remove_entry(namespace, expected=cache_entry) is not None
+    )
+    with _cache_lock:
+        _stats["expirations"] += removed
     
-    if namespaces_to_remove:
-        logger.info(f"Removed {len(namespaces_to_remove)} expired cache entries")
+    if removed:
+        logger.info(f"Removed {removed} expired cache entries")
     
-    return len(namespaces_to_remove)
+    return removed
 
 def get_cache_status(namespace: str = None) -> Dict:
     """
@@ -169,33 +535,118 @@ def get_cache_status(namespace: str = None) -> Dict:
         Dictionary with cache statistics
     """
     if namespace:
-        if namespace in vector_cache:
-            entry = vector_cache[namespace]
+        if _shared_store is not None:
+            entry = _shared_store.get_meta(namespace)
+        else:
+            entry = vector_cache.get(namespace)
+        if entry is not None:
             return {
                 "exists": True,
-                "vector_count": len(entry["vectors"]),
+                "vector_count": entry["rows"] if _shared_store is not None else len(entry["vectors"]),
+                "bytes": entry["bytes"],
                 "created_at": entry["created_at"],
                 "expires_at": entry["expires_at"],
-                "time_remaining": max(0, entry["expires_at"] - time.time())
+                "time_remaining": max(0, entry["expires_at"] - time.time()),
+                "knowledge_version": entry.get("knowledge_version")
             }
         else:
             return {"exists": False}
     
     # Return overall cache stats
-    total_entries = len(vector_cache)
-    total_vectors = sum(len(entry["vectors"]) for entry in vector_cache.values())
+    if _shared_store is not None:
+        entries = _shared_store.entries()
+        shared_stats = _shared_store.get_stats()
+        with _cache_lock:
+            return {
+                "backend": BACKEND,
+                "total_entries": len(entries),
+                "total_vectors": sum(meta["rows"] for meta in entries.values()),
+                "namespaces": list(entries.keys()),
+                "max_bytes": MAX_CACHE_BYTES,
+                "utilization": shared_stats["total_bytes"] / MAX_CACHE_BYTES if MAX_CACHE_BYTES else 0.0,
+                "sweep_interval_seconds": SWEEP_INTERVAL_SECONDS,
+                **_stats,
+                # Host-wide occupancy; evictions and expirations are counted by the worker that did them
+                **shared_stats
+            }
+    
+    with _cache_lock:
+        snapshot = list(vector_cache.items())
+        total_bytes = _total_bytes
+        stats = dict(_stats)
     
     return {
-        "total_entries": total_entries,
-        "total_vectors": total_vectors,
-        "namespaces": list(vector_cache.keys())
+        "backend": BACKEND,
+        "total_entries": len(snapshot),
+        "total_vectors": sum(len(entry["vectors"]) for _, entry in snapshot),
+        # Least recently used first
+        "namespaces": [key for key, _ in snapshot],
+        "total_bytes": total_bytes,
+        "max_bytes": MAX_CACHE_BYTES,
+        "utilization": total_bytes / MAX_CACHE_BYTES if MAX_CACHE_BYTES else 0.0,
+        "quantization": QUANTIZATION,
+        # Heap bytes the cached entries would need on top of total_bytes as float32
+        "quantized_bytes_saved": sum(
+            entry["vectors"].bytes_saved for _, entry in snapshot
+            if isinstance(entry["vectors"], vector_quantization.QuantizedMatrix)
+        ),
+        "lock_stripes": len(_stripe_locks),
+        "sweep_interval_seconds": SWEEP_INTERVAL_SECONDS,
+        **stats
     }
 
-# Added to allow dashboard document uploads with near immediate use of the new vectors
+# Added to allow dashboard document uploads with near immediate use of the new vectors.
+# All uploaded documents of a namespace share one entry: a single append-only matrix plus
+# "docs", an index of which rows belong to which document. A query is then one matrix-vector
+# product over the namespace instead of one search per document, and removing a document only
+# drops it from the index; its rows are masked out until the matrix is compacted.
+
+def document_cache_key(namespace: str) -> str:
+    """Cache key of a namespace's combined document entry (':' never appears in a namespace)"""
+    return f"{namespace}:docs"
+
+def _peek_entry(key: str, with_vectors: bool = False) -> Optional[Dict]:
+    """Get an entry without counting a hit or miss or changing its LRU position"""
+    if _shared_store is not None:
+        # The index record alone avoids mapping the matrix when only "docs" is needed
+        return _shared_store.get(key) if with_vectors else _shared_store.get_meta(key)
+    return vector_cache.get(key)
+
+def _live_documents(entry: Dict, now: float) -> Dict[str, Dict]:
+    return {doc_id: rows for doc_id, rows in entry["docs"].items() if rows["expires_at"] >= now}
+
+def _store_documents(namespace: str, vectors: np.ndarray, chunks: List[str], docs: Dict[str, Dict],
+                     created_at: float) -> bool:
+    """Write a namespace's document entry, compacting the matrix once most of its rows are dead"""
+    live_rows = sum(rows["count"] for rows in docs.values())
+    if not live_rows:
+        _remove_entry(document_cache_key(namespace))
+        return True
+
+    if len(vectors) - live_rows > live_rows:
+        blocks, kept_chunks, compacted = [], [], {}
+        for doc_id, rows in docs.items():
+            start, end = rows["start"], rows["start"] + rows["count"]
+            compacted[doc_id] = dict(rows, start=len(kept_chunks))
+            blocks.append(vectors[start:end])
+            kept_chunks.extend(chunks[start:end])
+        vectors, chunks, docs = np.concatenate(blocks), kept_chunks, compacted
+
+    return _store_entry(document_cache_key(namespace), {
+        "vectors": vectors,
+        "chunks": chunks,
+        "created_at": created_at,
+        "expires_at": max(rows["expires_at"] for rows in docs.values()),
+        "docs": docs
+    })
+
 def add_document_to_cache(namespace: str, doc_id: str, vectors: List[List[float]], chunks: List[str], expiry_seconds: int = 60) -> bool:
     """
     Add document vectors and their corresponding text chunks to the cache with expiration
     
+    The rows are appended to the namespace's document matrix. Adding a document
+    that is already cached points it at the new rows and leaves the old ones dead.
+    
     Args:
         namespace: The company namespace
         doc_id: The document ID
@@ -207,7 +658,7 @@ def add_document_to_cache(namespace: str, doc_id: str, vectors: List[List[float]
         bool: True if successfully added to cache
     """
     try:
-        if not namespace or not doc_id or not vectors or not chunks:
+        if not namespace or not doc_id or vectors is None or len(vectors) == 0 or not chunks:
             return False
             
         if len(vectors) != len(chunks):
@@ -217,25 +668,99 @@ def add_document_to_cache(namespace: str, doc_id: str, vectors: List[List[float]
         # Current timestamp in seconds
         current_time = time.time()
         
-        # Create a unique cache key for the document
-        cache_key = f"{namespace}-doc-{doc_id}"
+        # Normalized once here instead of on every query
+        matrix = prepare_vectors(vectors)
         
-        # Store in cache
-        vector_cache[cache_key] = {
-            "vectors": vectors,
-            "chunks": chunks,
-            "created_at": current_time,
-            "expires_at": current_time + expiry_seconds,
-            "doc_id": doc_id,
-            "namespace": namespace
-        }
+        # Other namespaces' readers and writers never wait on this append
+        with _key_lock(document_cache_key(namespace)):
+            existing = _peek_entry(document_cache_key(namespace), with_vectors=True)
+            if existing is not None and existing["vectors"].shape[1] != matrix.shape[1]:
+                # A different embedding model; the old rows cannot be searched with new queries
+                existing = None
+            
+            if existing is None:
+                old_vectors, old_chunks, docs, created_at = matrix[:0], [], {}, current_time
+            else:
+                old_vectors, old_chunks = existing["vectors"], existing["chunks"]
+                docs, created_at = _live_documents(existing, current_time), existing["created_at"]
+            
+            # Append rather than modify: searches holding the old matrix keep a consistent view
+            docs[doc_id] = {"start": len(old_chunks), "count": len(chunks), "expires_at": current_time + expiry_seconds}
+            stored = _store_documents(
+                namespace, np.concatenate([old_vectors, matrix]), list(old_chunks) + list(chunks), docs, created_at
+            )
+        if not stored:
+            return False
         
-        logger.info(f"Added {len(vectors)} vectors for document {doc_id} to cache with key '{cache_key}'")
+        logger.info(f"Added {len(vectors)} vectors for document {doc_id} to the document cache of namespace '{namespace}'")
         return True
     except Exception as e:
         logger.error(f"Error adding document to cache: {e}")
         return False
 
+def remove_document_from_cache(namespace: str, doc_id: str) -> bool:
+    """
+    Stop serving a document's cached vectors
+    
+    The document is dropped from the namespace's row index; its rows stay in the
+    matrix, masked out of every search, until enough rows are dead to compact.
+    
+    Args:
+        namespace: The company namespace
+        doc_id: The document ID
+        
+    Returns:
+        bool: True if the document was cached
+    """
+    try:
+        key = document_cache_key(namespace)
+        with _key_lock(key):
+            entry = _peek_entry(key, with_vectors=True)
+            if entry is None or doc_id not in entry["docs"]:
+                return False
+            docs = _live_documents(entry, time.time())
+            docs.pop(doc_id, None)
+            _store_documents(namespace, entry["vectors"], entry["chunks"], docs, entry["created_at"])
+        
+        logger.info(f"Removed document {doc_id} from the document cache of namespace '{namespace}'")
+        return True
+    except Exception as e:
+        logger.error(f"Error removing document from cache: {e}")
+        return False
+
+def _search_documents(namespace: str, query_vector: List[float], top_k: int, doc_id: str = None) -> List[Dict]:
+    """One masked pass over the namespace's document matrix, optionally limited to one document"""
+    entry = _get_entry(document_cache_key(namespace))
+    if entry is None:
+        return []
+    
+    docs = _live_documents(entry, time.time())
+    if doc_id is not None:
+        docs = {doc_id: docs[doc_id]} if doc_id in docs else {}
+    if not docs:
+        return []
+    
+    matrix, chunks = entry["vectors"], entry["chunks"]
+    live = np.zeros(len(matrix), dtype=bool)
+    for rows in docs.values():
+        live[rows["start"]:rows["start"] + rows["count"]] = True
+    live_count = int(live.sum())
+    
+    if live_count < len(matrix) // 4:
+        # Mostly masked (e.g. a single document): score only the live rows
+        rows = np.flatnonzero(live)
+        scores = matrix[rows] @ normalize_query(query_vector)
+        best = top_k_indices(scores, top_k)
+        return [{"text": chunks[rows[idx]], "score": float(scores[idx])} for idx in best]
+    
+    scores = matrix @ normalize_query(query_vector)
+    if live_count < len(matrix):
+        scores[~live] = -np.inf
+    return [
+        {"text": chunks[idx], "score": float(scores[idx])}
+        for idx in top_k_indices(scores, min(top_k, live_count))
+    ]
+
 def get_document_from_cache(namespace: str, doc_id: str, query_vector: List[float], top_k: int = 3) -> List[Dict]:
     """
     Retrieve the most similar chunks from a specific document in cache
@@ -250,45 +775,40 @@ def get_document_from_cache(namespace: str, doc_id: str, query_vector: List[floa
         List of dictionaries with 'text' and 'score' fields
     """
     try:
-        cache_key = f"{namespace}-doc-{doc_id}"
-        
-        if not is_cache_valid(cache_key):
-            return []
-            
-        cached_data = vector_cache[cache_key]
-        cached_vectors = cached_data["vectors"]
-        cached_chunks = cached_data["chunks"]
-        
-        # Calculate similarity scores
-        similarities = calculate_similarity(query_vector, cached_vectors)
-        
-        # Get indices of top_k highest similarities
-        top_indices = np.argsort(similarities)[-top_k:][::-1]  # Descending order
-        
-        # Create results list
-        results = []
-        for idx in top_indices:
-            results.append({
-                "text": cached_chunks[idx],
-                "score": float(similarities[idx])
-            })
-            
-        return results
+        return _search_documents(namespace, query_vector, top_k, doc_id=doc_id)
     except Exception as e:
         logger.error(f"Error retrieving document from cache: {e}")
         return []
 
+def has_document_cache(namespace: str) -> bool:
+    """
+    Check if any uploaded document of a namespace is cached and unexpired
+    
+    Args:
+        namespace: The company namespace
+        
+    Returns:
+        bool: True if a document search could return results
+    """
+    entry = _peek_entry(document_cache_key(namespace))
+    return entry is not None and bool(_live_documents(entry, time.time()))
+
 def get_all_document_cache_keys(namespace: str) -> List[str]:
     """
     Get all document cache keys for a namespace
     
+    Read from the namespace's row index; kept for callers that list cached documents.
+    
     Args:
         namespace: The company namespace
         
     Returns:
         List of document cache keys
     """
-    return [key for key in vector_cache.keys() if key.startswith(f"{namespace}-doc-")]
+    entry = _peek_entry(document_cache_key(namespace))
+    if entry is None:
+        return []
+    return [f"{namespace}-doc-{doc_id}" for doc_id in _live_documents(entry, time.time())]
 
 def get_cached_document_results(namespace: str, query_vector: List[float], top_k: int = 5) -> List[Dict]:
     """
@@ -303,42 +823,25 @@ def get_cached_document_results(namespace: str, query_vector: List[float], top_k
         List of dictionaries with 'text' and 'score' fields
     """
     try:
-        all_results = []
-        
-        # Get all document cache keys for this namespace
-        doc_cache_keys = get_all_document_cache_keys(namespace)
-        
-        # If no document caches found, return empty list
-        if not doc_cache_keys:
-            return []
-            
-        # Collect results from all document caches
-        for cache_key in doc_cache_keys:
-            if not is_cache_valid(cache_key):
-                continue
-                
-            cached_data = vector_cache[cache_key]
-            cached_vectors = cached_data["vectors"]
-            cached_chunks = cached_data["chunks"]
-            
-            # Calculate similarity scores
-            similarities = calculate_similarity(query_vector, cached_vectors)
-            
-            # Get indices of top similarities 
-            # Get more than top_k since we'll merge and sort later
-            top_indices = np.argsort(similarities)[-top_k*2:][::-1]  # Descending order
-            
-            # Add results
-            for idx in top_indices:
-                all_results.append({
-                    "text": cached_chunks[idx],
-                    "score": float(similarities[idx])
-                })
-        
-        # Sort by score and take top_k
-        all_results.sort(key=lambda x: x["score"], reverse=True)
-        return all_results[:top_k]
-        
+        return _search_documents(namespace, query_vector, top_k)
     except Exception as e:
         logger.error(f"Error retrieving cached document results: {e}")
         return []
+
+def _ensure_sweeper() -> None:
+    global _sweeper_thread
+    if _sweeper_thread is not None and _sweeper_thread.is_alive():
+        return
+    with _cache_lock:
+        if _sweeper_thread is None or not _sweeper_thread.is_alive():
+            _sweeper_thread = threading.Thread(target=_sweep_loop, name="vector-cache-sweeper", daemon=True)
+            _sweeper_thread.start()
+
+def _sweep_loop() -> None:
+    """Drop expired entries periodically so idle namespaces do not hold memory until their next lookup"""
+    while True:
+        time.sleep(SWEEP_INTERVAL_SECONDS)
+        try:
+            cleanup_expired_cache()
+        except Exception as e:
+            logger.error(f"Error sweeping vector cache: {e}")
@@ -0,0 +1,103 @@
+"""
+Vector Cache Microbenchmark
+Measures the per-query cost of a vector_cache search at 100, 1k and 10k chunks,
+comparing the original storage (lists of lists, converted and re-normalized on
+every query, full argsort) with the contiguous pre-normalized float32 matrix.
+
+It then compares per-query throughput of get_from_cache, one query at a time,
+with get_many_from_cache scoring a whole batch of queries per matrix product.
+
+Run from the prod directory:
+    python vector_cache_bench.py [--dimension 1536] [--top-k 5] [--batch 256]
+"""
+
+import time
+import argparse
+import statistics
+import numpy as np
+
+import vector_cache
+
+SIZES = [100, 1000, 10000]
+
+
+def legacy_search(cached_vectors, cached_chunks, query_vector, top_k):
+    """The search as it was before vectors were stored as a pre-normalized matrix"""
+    query_np = np.array(query_vector)
+    vectors_np = np.array(cached_vectors)
+    query_norm = query_np / np.linalg.norm(query_np)
+    vectors_norm = vectors_np / np.linalg.norm(vectors_np, axis=1, keepdims=True)
+    similarities = np.dot(vectors_norm, query_norm)
+    top_indices = np.argsort(similarities)[-top_k:][::-1]
+    return [{"text": cached_chunks[idx], "score": float(similarities[idx])} for idx in top_indices]
+
+
+def time_per_query(search, queries, min_seconds=0.5):
+    """Median milliseconds per query, repeating the query set for at least min_seconds"""
+    samples = []
+    started = time.perf_counter()
+    while not samples or time.perf_counter() - started < min_seconds:
+        for query in queries:
+            query_started = time.perf_counter()
+            search(query)
+            samples.append((time.perf_counter() - query_started) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark vector_cache search")
+    parser.add_argument("--dimension", type=int, default=1536, help="Embedding dimension (ada-002 is 1536)")
+    parser.add_argument("--top-k", type=int, default=5, help="Results per query")
+    parser.add_argument("--queries", type=int, default=20, help="Distinct query vectors per size")
+    parser.add_argument("--batch", type=int, default=256, help="Queries per batch for the batch comparison")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"dimension={args.dimension} top_k={args.top_k}")
+    print(f"{'chunks':>8} {'before ms':>10} {'after ms':>10} {'speedup':>8}")
+
+    for size in SIZES:
+        vectors = rng.standard_normal((size, args.dimension)).astype(np.float32)
+        chunks = [f"chunk {i}" for i in range(size)]
+        queries = [rng.standard_normal(args.dimension).astype(np.float32) for _ in range(args.queries)]
+
+        # Before: the cache held the embeddings as returned by the API, lists of floats
+        vector_lists = vectors.tolist()
+        before = time_per_query(lambda q: legacy_search(vector_lists, chunks, q.tolist(), args.top_k), queries)
+
+        vector_cache.add_to_cache("bench", vector_lists, chunks, expiry_seconds=3600)
+        after = time_per_query(lambda q: vector_cache.get_from_cache("bench", q, top_k=args.top_k), queries)
+
+        # Same answers from both paths
+        expected = [r["text"] for r in legacy_search(vector_lists, chunks, queries[0].tolist(), args.top_k)]
+        actual = [r["text"] for r in vector_cache.get_from_cache("bench", queries[0], top_k=args.top_k)]
+        assert expected == actual, f"Results differ at {size} chunks: {expected} != {actual}"
+
+        print(f"{size:>8} {before:>10.3f} {after:>10.3f} {before / after:>7.1f}x")
+
+    print(f"\nbatch of {args.batch} queries")
+    print(f"{'chunks':>8} {'single ms/q':>12} {'batch ms/q':>11} {'speedup':>8}")
+    for size in SIZES:
+        vectors = rng.standard_normal((size, args.dimension)).astype(np.float32)
+        chunks = [f"chunk {i}" for i in range(size)]
+        batch = rng.standard_normal((args.batch, args.dimension)).astype(np.float32)
+        vector_cache.add_to_cache("bench", vectors, chunks, expiry_seconds=3600)
+
+        single = time_per_query(lambda q: vector_cache.get_from_cache("bench", q, top_k=args.top_k), list(batch))
+        batched = time_per_query(
+            lambda b: vector_cache.get_many_from_cache("bench", b, top_k=args.top_k), [batch]
+        ) / args.batch
+
+        # Same answers from both paths
+        expected = [[r["text"] for r in vector_cache.get_from_cache("bench", q, top_k=args.top_k)] for q in batch[:20]]
+        actual = [[r["text"] for r in results]
+                  for results in vector_cache.get_many_from_cache("bench", batch[:20], top_k=args.top_k)]
+        assert expected == actual, f"Batch results differ at {size} chunks"
+
+        print(f"{size:>8} {single:>12.3f} {batched:>11.3f} {single / batched:>7.1f}x")
+
+    vector_cache.remove_from_cache("bench")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+import os
+import glob
+import uuid
+import shutil
+import tempfile
+from typing import Tuple
+import numpy as np
+import logging
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines: spill directories of exited processes are left behind
+    fcntl = None
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# int8 only: numpy converts float16 to float32 element by element, which made a
+# float16 first pass 12-15x slower than scanning the float32 matrix outright
+MODES = ("int8",)
+
+# Candidates re-scored exactly per result: top_k * RESCORE_FACTOR rows come out of the first pass
+RESCORE_FACTOR = int(os.getenv('VECTOR_CACHE_RESCORE_FACTOR', 4))
+
+# Where the full-precision rows used for re-scoring are kept, memory-mapped rather than in the heap
+SPILL_DIR = os.getenv('VECTOR_CACHE_SPILL_DIR', os.path.join(tempfile.gettempdir(), 'easychat-vector-spill'))
+
+# Rows decoded per step of the first pass; small enough that the decoded block stays in CPU cache
+SCAN_BLOCK_ROWS = 256
+
+
+class QuantizedMatrix:
+    """
+    A compressed stand-in for a prepared float32 vector matrix.
+
+    The heap holds only the compressed rows: int8 codes with one float32 scale
+    per row, a quarter of the size of the float32 matrix. A query scores
+    every compressed row, keeps the best top_k * RESCORE_FACTOR candidates, and
+    re-scores those against the exact float32 rows, which live in a spill file
+    that is memory-mapped read-only. Only the few candidate rows are read from
+    it, so the page cache holds what is actually used and the OS can drop the
+    rest; returned scores are exact.
+    """
+
+    def __init__(self, mode: str, codes: np.ndarray, scales: np.ndarray, exact: np.ndarray, path: str):
+        self.mode = mode
+        self.codes = codes
+        self.scales = scales
+        self.exact = exact
+        self.path = path
+
+    @classmethod
+    def from_vectors(cls, matrix: np.ndarray, mode: str, directory: str = SPILL_DIR) -> "QuantizedMatrix":
+        """
+        Compress a matrix from vector_cache.prepare_vectors()
+
+        Args:
+            matrix: Unit-length float32 vectors, one row per chunk
+            mode: 'int8'
+            directory: Directory for the full-precision spill file
+
+        Returns:
+            QuantizedMatrix with the same rows
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown quantization mode '{mode}', expected one of {MODES}")
+
+        # Symmetric per-row scale: the largest component maps to +/-127
+        scales = np.abs(matrix).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.rint(matrix / scales[:, np.newaxis]).astype(np.int8)
+        scales = scales.astype(np.float32)
+
+        path = os.path.join(_spill_directory(directory), f"{uuid.uuid4().hex}.npy")
+        np.save(path, matrix, allow_pickle=False)
+        # np.asarray keeps the mapped pages but drops the memmap subclass
+        exact = np.asarray(np.load(path, mmap_mode="r"))
+        return cls(mode, codes, scales, exact, path)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.codes.shape
+
+    @property
+    def nbytes(self) -> int:
+        """Heap bytes held (the spill file is not counted)"""
+        return int(self.codes.nbytes) + int(self.scales.nbytes)
+
+    @property
+    def bytes_saved(self) -> int:
+        """Heap bytes saved compared with keeping the float32 matrix"""
+        return int(self.exact.nbytes) - self.nbytes
+
+    def approximate_scores(self, queries: np.ndarray) -> np.ndarray:
+        """
+        First-pass scores from the compressed rows
+
+        Args:
+            queries: Unit-length query vector, or (Q x dimension) matrix of them
+
+        Returns:
+            Scores of shape (rows,) for one query, or (Q, rows)
+        """
+        single = queries.ndim == 1
+        queries = np.atleast_2d(queries)
+        scores = np.empty((len(queries), len(self.codes)), dtype=np.float32)
+        buffer = np.empty((min(SCAN_BLOCK_ROWS, len(self.codes)), self.codes.shape[1]), dtype=np.float32)
+        for start in range(0, len(self.codes), SCAN_BLOCK_ROWS):
+            codes = self.codes[start:start + SCAN_BLOCK_ROWS]
+            block = buffer[:len(codes)]
+            np.copyto(block, codes, casting="unsafe")
+            block_scores = queries @ block.T
+            block_scores *= self.scales[start:start + SCAN_BLOCK_ROWS]
+            scores[:, start:start + len(block)] = block_scores
+        return scores[0] if single else scores
+
+    def search(self, query: np.ndarray, top_k: int, rescore_factor: int = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the top_k rows for a unit-length query, with exact scores
+
+        Returns:
+            Tuple of (row indices, scores), best first
+        """
+        # Imported here, not at module level: vector_cache imports this module
+        import vector_cache
+        rescored = top_k * (rescore_factor or RESCORE_FACTOR)
+        candidates = vector_cache.top_k_indices(self.approximate_scores(query), rescored)
+        # Sorted reads touch the spill file in order
+        candidates = np.sort(candidates)
+        exact_scores = self.exact[candidates] @ query
+        best = vector_cache.top_k_indices(exact_scores, top_k)
+        return candidates[best], exact_scores[best]
+
+    def search_batch(self, queries: np.ndarray, top_k: int,
+                     rescore_factor: int = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        search() for a (Q x dimension) matrix of unit-length queries
+
+        Returns:
+            Tuple of (indices, scores), each of shape (Q, min(top_k, rows)), best first in each row
+        """
+        import vector_cache
+        top_k = min(top_k, len(self.codes))
+        rescored = top_k * (rescore_factor or RESCORE_FACTOR)
+        candidates = vector_cache.top_k_indices_batch(self.approximate_scores(queries), rescored)
+        exact_scores = np.einsum("qcd,qd->qc", self.exact[candidates], queries)
+        best = vector_cache.top_k_indices_batch(exact_scores, top_k)
+        return np.take_along_axis(candidates, best, axis=1), np.take_along_axis(exact_scores, best, axis=1)
+
+    def close(self) -> None:
+        """Delete the spill file; searches still holding the mapping keep working until they finish"""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not remove spill file {self.path}: {e}")
+
+
+# (parent directory, pid) -> (this process's spill directory, its lock file, held until exit)
+_prepared_directories = {}
+
+
+def _spill_directory(directory: str) -> str:
+    """This process's spill directory; the first call also removes those left by exited processes"""
+    pid = os.getpid()
+    prepared = _prepared_directories.get((directory, pid))
+    if prepared is not None:
+        return prepared[0]
+
+    os.makedirs(directory, exist_ok=True)
+    own = os.path.join(directory, f"{pid}-{uuid.uuid4().hex[:12]}")
+    lock_path = f"{own}.lock"
+    while True:
+        lock_file = open(lock_path, "a")
+        if fcntl is None:
+            break
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        # Another process may have taken and unlinked the new file before we locked it
+        if os.path.exists(lock_path) and os.stat(lock_path).st_ino == os.fstat(lock_file.fileno()).st_ino:
+            break
+        lock_file.close()
+    os.makedirs(own, exist_ok=True)
+    _prepared_directories[(directory, pid)] = (own, lock_file)
+
+    _remove_stale_directories(directory, own)
+    return own
+
+
+def _remove_stale_directories(directory: str, own: str) -> None:
+    # The lock is released when its process exits, however it exits. Without fcntl
+    # there is no safe way to tell, so nothing is removed.
+    if fcntl is None:
+        return
+    for lock_path in glob.glob(os.path.join(directory, "*.lock")):
+        spill_path = lock_path[:-len(".lock")]
+        if spill_path == own:
+            continue
+        try:
+            lock_file = open(lock_path, "r")
+        except FileNotFoundError:
+            continue
+        with lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                # Owner is still running
+                continue
+            shutil.rmtree(spill_path, ignore_errors=True)
+            try:
+                os.remove(lock_path)
+            except FileNotFoundError:
+                pass
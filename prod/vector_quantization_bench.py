@@ -0,0 +1,85 @@
+"""
+Vector Quantization Benchmark
+Reports, for int8 cache storage against plain float32:
+memory per chunk, recall@k of the compressed first pass alone and after exact
+re-scoring, and per-query latency.
+
+Recall is measured on clustered vectors (see ivf_index_bench.py): near-duplicate
+neighbours are where quantization error can actually reorder results.
+
+Run from the prod directory:
+    python vector_quantization_bench.py [--rows 2000 10000] [--top-k 5]
+"""
+
+import sys
+import time
+import shutil
+import argparse
+import statistics
+import tempfile
+import numpy as np
+
+import vector_cache
+from vector_quantization import QuantizedMatrix, MODES
+from ivf_index_bench import clustered_vectors
+
+
+def median_ms(search, queries):
+    samples = []
+    for query in queries:
+        started = time.perf_counter()
+        search(query)
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def recall(found, exact, top_k):
+    return sum(len(set(f) & set(e)) for f, e in zip(found, exact)) / (len(exact) * top_k)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark quantized vector_cache storage")
+    parser.add_argument("--rows", type=int, nargs="+", default=[2000, 10000], help="Matrix sizes to test")
+    parser.add_argument("--dimension", type=int, default=1536, help="Embedding dimension (ada-002 is 1536)")
+    parser.add_argument("--top-k", type=int, default=5, help="k for recall@k")
+    parser.add_argument("--queries", type=int, default=200, help="Queries per setting")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    spill_dir = tempfile.mkdtemp(prefix="quantization-bench-")
+
+    # What the cache held before it stored matrices: one list of Python floats per chunk
+    row = [float(x) for x in rng.standard_normal(args.dimension)]
+    list_bytes = sys.getsizeof(row) + sum(sys.getsizeof(x) for x in row)
+    print(f"dimension={args.dimension} top_k={args.top_k}; a list of Python floats takes {list_bytes} bytes per chunk")
+
+    for rows in args.rows:
+        matrix = clustered_vectors(rng, rows, args.dimension, topics=max(10, rows // 200))
+        picks = rng.choice(rows, size=args.queries, replace=False)
+        queries = [
+            vector_cache.normalize_query(matrix[i] + rng.standard_normal(args.dimension).astype(np.float32) * 0.02)
+            for i in picks
+        ]
+        exact = [vector_cache.top_k_indices(matrix @ q, args.top_k) for q in queries]
+        float32_ms = median_ms(lambda q: vector_cache.top_k_indices(matrix @ q, args.top_k), queries)
+
+        print(f"\nrows={rows}")
+        print(f"{'storage':>8} {'bytes/chunk':>12} {'saved':>6} {'recall 1st':>11} {'recall':>7} {'ms/query':>9}")
+        print(f"{'float32':>8} {matrix.nbytes // rows:>12} {'':>6} {1.0:>11.3f} {1.0:>7.3f} {float32_ms:>9.3f}")
+
+        for mode in MODES:
+            quantized = QuantizedMatrix.from_vectors(matrix, mode, directory=spill_dir)
+            # First pass alone: only the top_k approximate candidates are re-scored
+            first_pass = [quantized.search(q, args.top_k, rescore_factor=1)[0] for q in queries]
+            rescored = [quantized.search(q, args.top_k)[0] for q in queries]
+            mode_ms = median_ms(lambda q: quantized.search(q, args.top_k), queries)
+            print(f"{mode:>8} {quantized.nbytes // rows:>12} {matrix.nbytes / quantized.nbytes:>5.1f}x "
+                  f"{recall(first_pass, exact, args.top_k):>11.3f} {recall(rescored, exact, args.top_k):>7.3f} "
+                  f"{mode_ms:>9.3f}")
+            quantized.close()
+
+    shutil.rmtree(spill_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
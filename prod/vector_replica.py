@@ -0,0 +1,459 @@
+import os
+import re
+import json
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+import logging
+
+import vector_cache
+from ivf_index import IVFIndex
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines: only threads in this process are serialized
+    fcntl = None
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Mirror every Pinecone write of a namespace to a local replica
+REPLICA_ENABLED = os.getenv('VECTOR_REPLICA_ENABLED', 'true').lower() == 'true'
+
+# Answer retrieval from the local replica, falling back to Pinecone when a namespace has none
+SERVING_ENABLED = REPLICA_ENABLED and os.getenv('VECTOR_REPLICA_SERVING', 'false').lower() == 'true'
+
+# One sub-directory per namespace: manifest.json plus v<N>.npy / v<N>.json. Next to
+# this module rather than the working directory, so all workers on a host share it.
+REPLICA_DIR = os.path.abspath(
+    os.getenv('VECTOR_REPLICA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'vector_replicas'))
+)
+
+# Replicas a worker keeps open; matrices are memory-mapped, but ids and texts are loaded
+MAX_LOADED_REPLICAS = int(os.getenv('VECTOR_REPLICA_MAX_LOADED', 256))
+
+# 'exact' searches every row; 'ivf' adds an approximate index to replicas of at least
+# VECTOR_REPLICA_IVF_MIN_ROWS rows (tune recall/latency with IVF_N_LISTS and IVF_N_PROBE)
+INDEX_BACKEND = os.getenv('VECTOR_REPLICA_INDEX', 'exact').lower()
+IVF_MIN_ROWS = int(os.getenv('VECTOR_REPLICA_IVF_MIN_ROWS', 5000))
+
+MANIFEST_FILE = "manifest.json"
+
+_lock = threading.Lock()
+_namespace_locks: Dict[str, threading.Lock] = {}
+# namespace -> (manifest stamp, matrix, ids, texts, doc_ids, ann index or None, knowledge version),
+# least recently used first
+_loaded = OrderedDict()
+_stats_lock = threading.Lock()
+_stats = {"searches": 0, "hits": 0, "misses": 0, "stale": 0, "ann_searches": 0, "writes": 0, "deletes": 0,
+          "errors": 0}
+
+
+def _count(key: str, amount: int = 1) -> None:
+    with _stats_lock:
+        _stats[key] += amount
+
+
+def _namespace_dir(namespace: str) -> str:
+    # Namespaces come from domain names; keep them readable but filesystem-safe
+    safe = re.sub(r'[^A-Za-z0-9_.-]', '_', namespace).strip('.')
+    if not safe:
+        raise ValueError(f"Invalid namespace for replica: {namespace!r}")
+    return os.path.join(REPLICA_DIR, safe)
+
+
+def has_replica(namespace: str, knowledge_version: int = None) -> bool:
+    """
+    Check whether a namespace has a local replica, and with knowledge_version,
+    whether it is at least that fresh
+    """
+    if not namespace:
+        return False
+    manifest = _read_manifest(_namespace_dir(namespace))
+    return manifest is not None and _is_fresh(manifest.get("knowledge_version"), knowledge_version)
+
+
+def replace_namespace(namespace: str, ids: Sequence[str], vectors, texts: Sequence[str],
+                      doc_ids: Sequence[Optional[str]] = None, create_only: bool = False,
+                      knowledge_version: int = None) -> bool:
+    """
+    Replace a namespace's replica with exactly these vectors (mirrors delete_all + upsert)
+
+    Args:
+        namespace: Pinecone namespace
+        ids: Vector IDs as written to Pinecone
+        vectors: Embedding vectors
+        texts: Chunk text for each vector
+        doc_ids: Uploaded document each vector belongs to (None for scraped content)
+        create_only: Only write if the namespace has no replica yet, or none as fresh as
+            knowledge_version (backfill from Pinecone)
+        knowledge_version: Chatbot knowledge version the vectors were read at
+
+    Returns:
+        bool: True if the replica was written
+    """
+    if not REPLICA_ENABLED or not namespace:
+        return False
+    if len(ids) == 0:
+        return delete_namespace(namespace)
+    try:
+        with _namespace_lock(namespace):
+            if create_only and has_replica(namespace, knowledge_version):
+                return False
+            # ann=None: _write trains a fresh index for the new content if one is needed
+            _write(namespace, list(ids), vector_cache.prepare_vectors(vectors), list(texts),
+                   list(doc_ids) if doc_ids is not None else [None] * len(ids), ann=None,
+                   knowledge_version=knowledge_version)
+        return True
+    except Exception as e:
+        _count("errors")
+        logger.error(f"[vector_replica] Error replacing replica for namespace '{namespace}': {e}")
+        return False
+
+
+def upsert(namespace: str, ids: Sequence[str], vectors, texts: Sequence[str],
+           doc_ids: Sequence[Optional[str]] = None) -> bool:
+    """
+    Insert or overwrite vectors in an existing replica (mirrors a Pinecone upsert).
+    A namespace without a replica is left alone: a partial replica would hide
+    the rest of its content from serving.
+
+    Returns:
+        bool: True if the replica was updated
+    """
+    if not REPLICA_ENABLED or not namespace:
+        return False
+    try:
+        with _namespace_lock(namespace):
+            current = _read(namespace, copy=True)
+            if current is None:
+                return False
+            _, matrix, current_ids, current_texts, current_doc_ids, ann, _ = current
+            new_matrix = vector_cache.prepare_vectors(vectors)
+            doc_ids = list(doc_ids) if doc_ids is not None else [None] * len(ids)
+
+            positions = {vector_id: row for row, vector_id in enumerate(current_ids)}
+            matrix = np.array(matrix)
+            appended = []
+            replaced = []
+            for row, vector_id in enumerate(ids):
+                if vector_id in positions:
+                    position = positions[vector_id]
+                    matrix[position] = new_matrix[row]
+                    current_texts[position] = texts[row]
+                    current_doc_ids[position] = doc_ids[row]
+                    replaced.append(position)
+                else:
+                    appended.append(row)
+            if appended:
+                matrix = np.concatenate([matrix, new_matrix[appended]])
+                current_ids = current_ids + [ids[row] for row in appended]
+                current_texts = current_texts + [texts[row] for row in appended]
+                current_doc_ids = current_doc_ids + [doc_ids[row] for row in appended]
+            if ann is not None:
+                ann.update(np.array(replaced, dtype=np.intp), matrix[replaced])
+                ann.add(new_matrix[appended])
+            _write(namespace, current_ids, matrix, current_texts, current_doc_ids, ann=ann)
+        return True
+    except Exception as e:
+        _count("errors")
+        logger.error(f"[vector_replica] Error upserting into replica for namespace '{namespace}': {e}")
+    # Better to serve from Pinecone than from a replica that missed a write
+    delete_namespace(namespace)
+    return False
+
+
+def delete_vectors(namespace: str, ids: Sequence[str] = None, doc_id: str = None) -> bool:
+    """
+    Remove vectors from an existing replica by ID or by document (mirrors a Pinecone delete)
+
+    Returns:
+        bool: True if the replica was updated
+    """
+    if not REPLICA_ENABLED or not namespace:
+        return False
+    try:
+        with _namespace_lock(namespace):
+            current = _read(namespace, copy=True)
+            if current is None:
+                return False
+            _, matrix, current_ids, current_texts, current_doc_ids, ann, _ = current
+            id_set = set(ids or [])
+            keep = [
+                row for row, (vector_id, row_doc_id) in enumerate(zip(current_ids, current_doc_ids))
+                if vector_id not in id_set and (doc_id is None or row_doc_id != doc_id)
+            ]
+            if len(keep) == len(current_ids):
+                return True
+            if ann is not None:
+                ann.keep(np.array(keep, dtype=np.intp))
+            _write(namespace, [current_ids[row] for row in keep], np.array(matrix[keep]),
+                   [current_texts[row] for row in keep], [current_doc_ids[row] for row in keep], ann=ann)
+        return True
+    except Exception as e:
+        _count("errors")
+        logger.error(f"[vector_replica] Error deleting from replica for namespace '{namespace}': {e}")
+    delete_namespace(namespace)
+    return False
+
+
+def delete_namespace(namespace: str) -> bool:
+    """Remove a namespace's replica entirely (mirrors delete_all)"""
+    if not namespace:
+        return False
+    try:
+        with _namespace_lock(namespace):
+            directory = _namespace_dir(namespace)
+            manifest_path = os.path.join(directory, MANIFEST_FILE)
+            if not os.path.exists(manifest_path):
+                return False
+            # Dropping the manifest is what readers look at; data files are removed after
+            os.remove(manifest_path)
+            _remove_versions(directory, keep=None)
+            with _lock:
+                _loaded.pop(namespace, None)
+            _count("deletes")
+        return True
+    except Exception as e:
+        _count("errors")
+        logger.error(f"[vector_replica] Error deleting replica for namespace '{namespace}': {e}")
+        return False
+
+
+def search(namespace: str, query_vector: List[float], top_k: int = 5, n_probe: int = None,
+           knowledge_version: int = None) -> Optional[List[Dict]]:
+    """
+    Search a namespace's replica
+
+    Args:
+        namespace: Pinecone namespace
+        query_vector: The query embedding vector
+        top_k: Number of top results to return
+        n_probe: IVF lists to search, for replicas with an approximate index
+        knowledge_version: The chatbot's current knowledge version; a replica stamped
+            with an older one missed a write made on another host
+
+    Returns:
+        List of dictionaries with 'text' and 'score' fields (best first),
+        or None if the namespace has no fresh replica and Pinecone must be used
+    """
+    _count("searches")
+    try:
+        current = _read(namespace)
+    except Exception as e:
+        _count("errors")
+        logger.error(f"[vector_replica] Error loading replica for namespace '{namespace}': {e}")
+        return None
+    if current is None:
+        _count("misses")
+        return None
+    if not _is_fresh(current[6], knowledge_version):
+        _count("stale")
+        return None
+    _count("hits")
+    _, matrix, _, texts, _, ann, _ = current
+    if ann is None:
+        return vector_cache.search_matrix(matrix, texts, query_vector, top_k)
+
+    _count("ann_searches")
+    rows, scores = ann.search(matrix, vector_cache.normalize_query(query_vector), top_k, n_probe=n_probe)
+    return [{"text": texts[row], "score": float(score)} for row, score in zip(rows, scores)]
+
+
+def mark_version(namespace: str, knowledge_version: int) -> bool:
+    """
+    Stamp a namespace's replica with the chatbot's knowledge version after a change
+    was mirrored to it, so search() keeps serving it once the version is bumped
+
+    Returns:
+        bool: True if the replica was stamped
+    """
+    if not REPLICA_ENABLED or not namespace or knowledge_version is None:
+        return False
+    try:
+        with _namespace_lock(namespace):
+            directory = _namespace_dir(namespace)
+            manifest = _read_manifest(directory)
+            if manifest is None:
+                return False
+            if _is_fresh(manifest.get("knowledge_version"), knowledge_version):
+                return True
+            manifest["knowledge_version"] = knowledge_version
+            _write_atomic(os.path.join(directory, MANIFEST_FILE),
+                          lambda f: f.write(json.dumps(manifest).encode("utf-8")))
+        return True
+    except Exception as e:
+        _count("errors")
+        logger.error(f"[vector_replica] Error stamping replica for namespace '{namespace}': {e}")
+        return False
+
+
+def get_stats() -> Dict:
+    """Get replica search and write counters for this worker"""
+    with _stats_lock:
+        stats = dict(_stats)
+    with _lock:
+        loaded = len(_loaded)
+    stats.update({
+        "enabled": REPLICA_ENABLED,
+        "serving": SERVING_ENABLED,
+        "directory": REPLICA_DIR,
+        "index_backend": INDEX_BACKEND,
+        "ivf_min_rows": IVF_MIN_ROWS,
+        "loaded_replicas": loaded,
+        "max_loaded_replicas": MAX_LOADED_REPLICAS
+    })
+    return stats
+
+
+# Internal helpers
+
+@contextmanager
+def _namespace_lock(namespace: str):
+    """Serialize writers of one namespace across threads and, where supported, processes"""
+    with _lock:
+        thread_lock = _namespace_locks.setdefault(namespace, threading.Lock())
+    directory = _namespace_dir(namespace)
+    with thread_lock:
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, ".lock"), "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _read(namespace: str, copy: bool = False) -> Optional[tuple]:
+    """
+    Load a replica, reusing this worker's copy while the manifest is unchanged.
+    Writers pass copy=True to get lists they may modify.
+    """
+    if not namespace:
+        return None
+    directory = _namespace_dir(namespace)
+    manifest_path = os.path.join(directory, MANIFEST_FILE)
+    try:
+        stat = os.stat(manifest_path)
+    except FileNotFoundError:
+        with _lock:
+            _loaded.pop(namespace, None)
+        return None
+    stamp = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    with _lock:
+        loaded = _loaded.get(namespace)
+        if loaded is not None and loaded[0] == stamp:
+            _loaded.move_to_end(namespace)
+            return _copy_rows(loaded) if copy else loaded
+
+    with open(manifest_path, encoding="utf-8") as manifest_file:
+        manifest = json.load(manifest_file)
+    base = os.path.join(directory, f"v{manifest['version']}")
+    # Memory-mapped read-only: the page cache holds one copy however many workers search it
+    matrix = np.asarray(np.load(f"{base}.npy", mmap_mode="r"))
+    with open(f"{base}.json", encoding="utf-8") as rows_file:
+        rows = json.load(rows_file)
+    ann = IVFIndex.load(f"{base}.ivf.npz") if manifest.get("index") == "ivf" else None
+
+    loaded = (stamp, matrix, rows["ids"], rows["texts"], rows["doc_ids"], ann, manifest.get("knowledge_version"))
+    with _lock:
+        _loaded[namespace] = loaded
+        _loaded.move_to_end(namespace)
+        while len(_loaded) > MAX_LOADED_REPLICAS:
+            _loaded.popitem(last=False)
+    return _copy_rows(loaded) if copy else loaded
+
+
+def _copy_rows(loaded: tuple) -> tuple:
+    stamp, matrix, ids, texts, doc_ids, ann, knowledge_version = loaded
+    if ann is not None:
+        ann = IVFIndex(ann.centroids, ann.assignments.copy(), ann.trained_rows)
+    return stamp, matrix, list(ids), list(texts), list(doc_ids), ann, knowledge_version
+
+
+def _read_manifest(directory: str) -> Optional[Dict]:
+    try:
+        with open(os.path.join(directory, MANIFEST_FILE), encoding="utf-8") as manifest_file:
+            return json.load(manifest_file)
+    except FileNotFoundError:
+        return None
+
+
+def _is_fresh(replica_version: Optional[int], knowledge_version: Optional[int]) -> bool:
+    # Replicas written before stamping existed count as version 0
+    return knowledge_version is None or (replica_version or 0) >= knowledge_version
+
+
+def _maintain_ann(ann: Optional[IVFIndex], matrix: np.ndarray) -> Optional[IVFIndex]:
+    """Decide whether a replica gets an approximate index, training one when needed"""
+    if INDEX_BACKEND != 'ivf' or len(matrix) < IVF_MIN_ROWS:
+        return None
+    if ann is None or ann.needs_retraining():
+        return IVFIndex.train(matrix)
+    return ann
+
+
+def _write(namespace: str, ids: List[str], matrix: np.ndarray, texts: List[str],
+           doc_ids: List[Optional[str]], ann: Optional[IVFIndex] = None, knowledge_version: int = None) -> None:
+    # Caller must hold the namespace lock. Data files first, manifest last, so readers
+    # only ever see a complete version.
+    if not (len(ids) == len(texts) == len(doc_ids) == len(matrix)):
+        raise ValueError("Replica ids, texts, doc_ids and vectors must have the same length")
+    ann = _maintain_ann(ann, matrix)
+
+    directory = _namespace_dir(namespace)
+    manifest_path = os.path.join(directory, MANIFEST_FILE)
+    version = 1
+    previous = _read_manifest(directory)
+    if previous is not None:
+        version = previous["version"] + 1
+        # Write-throughs keep the stamp; the knowledge version bump that follows them re-stamps
+        if knowledge_version is None:
+            knowledge_version = previous.get("knowledge_version")
+
+    base = os.path.join(directory, f"v{version}")
+    _write_atomic(f"{base}.npy", lambda f: np.save(f, np.ascontiguousarray(matrix, dtype=np.float32)))
+    rows = {"ids": ids, "texts": texts, "doc_ids": doc_ids}
+    _write_atomic(f"{base}.json", lambda f: f.write(json.dumps(rows).encode("utf-8")))
+    if ann is not None:
+        _write_atomic(f"{base}.ivf.npz", ann.save)
+    manifest = {
+        "namespace": namespace,
+        "version": version,
+        "rows": len(ids),
+        "dimension": int(matrix.shape[1]),
+        "index": "ivf" if ann is not None else "exact",
+        "n_lists": ann.n_lists if ann is not None else 0,
+        "knowledge_version": knowledge_version,
+        "updated_at": time.time()
+    }
+    _write_atomic(manifest_path, lambda f: f.write(json.dumps(manifest).encode("utf-8")))
+
+    _remove_versions(directory, keep=version)
+    _count("writes")
+    logger.info(f"[vector_replica] Wrote {len(ids)} vectors for namespace '{namespace}' (v{version})")
+
+
+def _write_atomic(path: str, write) -> None:
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        write(f)
+    os.replace(temp_path, path)
+
+
+def _remove_versions(directory: str, keep: Optional[int]) -> None:
+    # Workers still mapping an old version keep reading it until they see the new manifest
+    for name in os.listdir(directory):
+        match = re.fullmatch(r'v(\d+)\.(npy|json|ivf\.npz)', name)
+        if match and int(match.group(1)) != keep:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
@@ -0,0 +1,356 @@
+import os
+import glob
+import json
+import uuid
+import atexit
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import logging
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines: orphaned segments are not recovered
+    fcntl = None
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Defaults can be overridden from the environment
+DEFAULT_FLUSH_INTERVAL_SECONDS = float(os.getenv('WRITE_BEHIND_FLUSH_INTERVAL_SECONDS', 1.0))
+DEFAULT_BATCH_SIZE = int(os.getenv('WRITE_BEHIND_BATCH_SIZE', 50))
+# Next to this module rather than the working directory, so every worker (and a
+# restarted one) finds the same segments however it was launched
+DEFAULT_SPILL_DIR = os.path.abspath(
+    os.getenv('WRITE_BEHIND_SPILL_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'spill'))
+)
+
+# A batch that fails this many times is retried row by row so one bad row
+# (e.g. a chatbot deleted in the meantime) cannot block the queue forever
+MAX_BATCH_ATTEMPTS = int(os.getenv('WRITE_BEHIND_MAX_BATCH_ATTEMPTS', 5))
+
+# fsync every spilled row; survives power loss instead of just a process crash
+SPILL_FSYNC = os.getenv('WRITE_BEHIND_SPILL_FSYNC', 'false').lower() == 'true'
+
+
+_token = None
+_token_pid = None
+
+
+def _process_token() -> str:
+    """
+    Names this process's spill segments. Unlike a bare pid it is never reused by
+    a later process (restarted workers routinely get the same small pids).
+    """
+    global _token, _token_pid
+    pid = os.getpid()
+    if _token_pid != pid:
+        _token, _token_pid = f"{pid}.{uuid.uuid4().hex[:12]}", pid
+    return _token
+
+
+class WriteBehindQueue:
+    """
+    Buffers rows in memory and writes them to the database in batches from a
+    background thread, so request threads never wait on a commit.
+
+    Every queued row is first appended to a per-process spill segment on disk.
+    A flush swaps in a new segment, inserts the previous segment's rows with a
+    single executemany and deletes the segment once committed. Each process
+    holds an flock on its own lock file for as long as it runs; segments whose
+    owner's lock can be taken were left behind by a dead worker and are
+    replayed on start-up, so delivery is at-least-once.
+    """
+
+    def __init__(self, name: str, insert_batch: Callable[[List[Sequence]], None],
+                 flush_interval_seconds: float = DEFAULT_FLUSH_INTERVAL_SECONDS,
+                 batch_size: int = DEFAULT_BATCH_SIZE, spill_dir: str = DEFAULT_SPILL_DIR):
+        """
+        Args:
+            name: Short name used for spill files and log messages
+            insert_batch: Callable that inserts and commits a list of row tuples
+            flush_interval_seconds: Longest a row waits before being written
+            batch_size: Number of pending rows that triggers an immediate flush
+            spill_dir: Directory holding the durable spill segments
+        """
+        self.name = name
+        self.insert_batch = insert_batch
+        self.flush_interval_seconds = flush_interval_seconds
+        self.batch_size = batch_size
+        self.spill_dir = os.path.abspath(spill_dir)
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pending: List[Tuple] = []
+        self._segment_seq = 0
+        self._segment_path: Optional[str] = None
+        self._segment_file = None
+        # Lock file held for as long as this process owns segments, and the token it was taken for
+        self._owner_lock = None
+        self._owner_token = None
+        # Batches whose insert failed: [segment path, rows, attempts], retried on the next flush
+        self._failed: List[List] = []
+        self._thread = None
+        self._stopping = False
+
+        # Counters for get_stats()
+        self.enqueued = 0
+        self.written = 0
+        self.batches = 0
+        self.failures = 0
+        self.recovered = 0
+        self.rejected = 0
+
+        atexit.register(self.shutdown)
+
+    def enqueue(self, row: Sequence) -> None:
+        """
+        Queue a row for insertion. Only appends a line to the local spill file.
+        """
+        row = tuple(row)
+        line = json.dumps(row, separators=(",", ":"), default=str) + "\n"
+        with self._lock:
+            segment = self._open_segment()
+            segment.write(line)
+            segment.flush()
+            if SPILL_FSYNC:
+                os.fsync(segment.fileno())
+            self._pending.append(row)
+            self.enqueued += 1
+            full = len(self._pending) >= self.batch_size
+
+        self._ensure_thread()
+        if full:
+            self._wake.set()
+
+    def start(self) -> None:
+        """Start the background writer now so orphaned spill files are replayed at start-up"""
+        self._ensure_thread()
+
+    def flush(self) -> int:
+        """
+        Write everything queued so far (called by the background thread and on shutdown)
+
+        Returns:
+            int: Number of rows written
+        """
+        with self._lock:
+            batches = self._failed
+            self._failed = []
+            if self._pending:
+                # Later rows go to a fresh segment while this one is written
+                self._close_segment()
+                batches.append([self._segment_path, self._pending, 0])
+                self._pending = []
+                self._segment_path = None
+
+        written = 0
+        still_failed = []
+        for batch in batches:
+            segment_path, rows, attempts = batch
+            try:
+                if attempts >= MAX_BATCH_ATTEMPTS:
+                    self._insert_rows_individually(rows)
+                else:
+                    self.insert_batch(rows)
+            except Exception as e:
+                logger.error(f"[{self.name}] Failed to write batch of {len(rows)} rows: {e}")
+                # Rows stay in their spill segment until a later attempt succeeds
+                batch[2] += 1
+                still_failed.append(batch)
+                with self._lock:
+                    self.failures += 1
+                continue
+
+            self._remove_segment(segment_path)
+            written += len(rows)
+            with self._lock:
+                self.written += len(rows)
+                self.batches += 1
+
+        if still_failed:
+            with self._lock:
+                self._failed = still_failed + self._failed
+        return written
+
+    def shutdown(self, timeout: float = 10.0) -> None:
+        """Stop the background thread and flush whatever is still queued"""
+        self._stopping = True
+        self._wake.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive() and thread is not threading.current_thread():
+            thread.join(timeout)
+        self.flush()
+
+    def get_stats(self) -> Dict:
+        """Get queue depth and write counters for monitoring"""
+        with self._lock:
+            return {
+                "name": self.name,
+                "pending": len(self._pending),
+                "failed_batches": len(self._failed),
+                "enqueued": self.enqueued,
+                "written": self.written,
+                "batches": self.batches,
+                "failures": self.failures,
+                "recovered": self.recovered,
+                "rejected": self.rejected,
+                "batch_size": self.batch_size,
+                "flush_interval_seconds": self.flush_interval_seconds
+            }
+
+    # Internal helpers
+
+    def _ensure_thread(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, name=f"write-behind-{self.name}", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        self._recover_orphans()
+        while not self._stopping:
+            self._wake.wait(self.flush_interval_seconds)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"[{self.name}] Write-behind flush error: {e}")
+
+    def _insert_rows_individually(self, rows: List[Tuple]) -> None:
+        # First row's failure is re-raised if nothing at all can be written (database down);
+        # otherwise rows the database refuses are moved to a rejected file for inspection
+        rejected = []
+        first_error = None
+        for row in rows:
+            try:
+                self.insert_batch([row])
+            except Exception as e:
+                first_error = first_error or e
+                rejected.append(row)
+
+        if rejected and len(rejected) == len(rows):
+            raise first_error
+
+        if rejected:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            with open(os.path.join(self.spill_dir, f"{self.name}.rejected"), "a", encoding="utf-8") as rejected_file:
+                for row in rejected:
+                    rejected_file.write(json.dumps(row, separators=(",", ":"), default=str) + "\n")
+            logger.error(f"[{self.name}] Rejected {len(rejected)} rows: {first_error}")
+            with self._lock:
+                self.rejected += len(rejected)
+
+    def _segment_pattern(self, token: str = "*") -> str:
+        return os.path.join(self.spill_dir, f"{self.name}-{token}-*.jsonl")
+
+    def _lock_path(self, token: str) -> str:
+        return os.path.join(self.spill_dir, f"{self.name}-{token}.lock")
+
+    def _hold_owner_lock(self) -> str:
+        """Take this process's owner lock if not held yet; returns the process token"""
+        # Caller must hold self._lock
+        token = _process_token()
+        if self._owner_token == token:
+            return token
+        os.makedirs(self.spill_dir, exist_ok=True)
+        path = self._lock_path(token)
+        while True:
+            lock_file = open(path, "a")
+            if fcntl is None:
+                break
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            # A recovering worker may have taken and unlinked the new file before we locked it
+            if os.path.exists(path) and os.stat(path).st_ino == os.fstat(lock_file.fileno()).st_ino:
+                break
+            lock_file.close()
+        self._owner_lock, self._owner_token = lock_file, token
+        return token
+
+    def _open_segment(self):
+        # Caller must hold self._lock
+        if self._segment_file is None:
+            token = self._hold_owner_lock()
+            self._segment_seq += 1
+            self._segment_path = os.path.join(self.spill_dir, f"{self.name}-{token}-{self._segment_seq}.jsonl")
+            self._segment_file = open(self._segment_path, "a", encoding="utf-8")
+        return self._segment_file
+
+    def _close_segment(self) -> None:
+        # Caller must hold self._lock
+        if self._segment_file is not None:
+            self._segment_file.close()
+            self._segment_file = None
+
+    def _remove_segment(self, segment_path: Optional[str]) -> None:
+        if segment_path:
+            try:
+                os.remove(segment_path)
+            except FileNotFoundError:
+                pass
+
+    def _recover_orphans(self) -> None:
+        """Replay spill segments left behind by workers that are no longer running"""
+        with self._lock:
+            own = self._hold_owner_lock()
+        prefix = f"{self.name}-"
+        tokens = set()
+        for path in glob.glob(self._segment_pattern()) + glob.glob(self._lock_path("*")):
+            token = os.path.basename(path)[len(prefix):].split("-")[0].rsplit(".lock", 1)[0]
+            if token != own:
+                tokens.add(token)
+
+        if fcntl is None:
+            # Without flock a live owner cannot be told from a dead one; replaying a
+            # running worker's segment would insert its rows twice, so leave them all
+            if tokens:
+                logger.warning(f"[{self.name}] Cannot check owners of {len(tokens)} other spill token(s) "
+                               f"without fcntl; not recovering them")
+            return
+
+        for token in tokens:
+            lock_path = self._lock_path(token)
+            with open(lock_path, "a") as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    # Owner is still running
+                    continue
+                # Released when a process exits, however it exits: the owner is gone.
+                # Segments are claimed under this worker's token so only one worker
+                # replays them (and a later worker recovers them if this one dies first).
+                for path in glob.glob(self._segment_pattern(token)):
+                    self._claim_segment(path, own)
+                os.remove(lock_path)
+
+    def _claim_segment(self, path: str, own: str) -> None:
+        with self._lock:
+            self._segment_seq += 1
+            claimed = os.path.join(self.spill_dir, f"{self.name}-{own}-{self._segment_seq}.jsonl")
+        try:
+            os.rename(path, claimed)
+        except OSError:
+            return
+
+        rows = []
+        with open(claimed, encoding="utf-8") as spill:
+            for line in spill:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    rows.append(tuple(json.loads(line)))
+                except json.JSONDecodeError:
+                    # A crash can leave a partial last line
+                    logger.warning(f"[{self.name}] Skipping unreadable spill line in {path}")
+
+        if rows:
+            logger.info(f"[{self.name}] Recovering {len(rows)} rows from {path}")
+            with self._lock:
+                self._failed.append([claimed, rows, 0])
+                self.recovered += len(rows)
+        else:
+            self._remove_segment(claimed)